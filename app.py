@@ -6,9 +6,16 @@ VERSION OPTIMISÉE avec sélecteur de difficulté et feedback rapide
 
 import streamlit as st
 import os
+import itertools
+from collections import deque
 from utils.document_parser import DocumentParser
-from utils.claude_api import ClaudeQCMGenerator  # Version optimisée
+from utils.claude_api import ClaudeQCMGenerator, get_usage_tracker  # Version optimisée
 from utils.pdf_export import PDFExporter
+from utils.cache import get_extraction_cache, get_feedback_cache
+from utils.background import GenerationJob, run_in_background_once, get_prefetch_registry
+from utils.rate_limit import get_rate_limiter
+from utils.question_bank import get_question_bank
+from utils.metrics import MetricsRegistry, bind_session, get_metrics
 
 
 # Configuration de la page
@@ -85,20 +92,255 @@ def initialize_session_state():
         st.session_state.document_images = None
     if 'difficulty' not in st.session_state:
         st.session_state.difficulty = 'intermediaire'
+    if 'generation_job' not in st.session_state:
+        st.session_state.generation_job = None
+    if 'deepened_questions' not in st.session_state:
+        st.session_state.deepened_questions = set()
+    if 'generation_variant' not in st.session_state:
+        st.session_state.generation_variant = 0  # Régénérations sur le même document
+    if 'bank_served' not in st.session_state:
+        st.session_state.bank_served = 0  # Questions du QCM courant servies par la banque
+    if 'metrics' not in st.session_state:
+        st.session_state.metrics = MetricsRegistry()  # Mesures de cette session (panneau latéral)
+    if 'prefetch' not in st.session_state:
+        st.session_state.prefetch = None  # QCM suivant pré-généré {key, job, variant, claim}
 
 
 def reset_qcm():
     """Réinitialise le QCM pour permettre une nouvelle génération"""
+    if st.session_state.generation_job is not None:
+        st.session_state.generation_job.cancel()
+        st.session_state.generation_job = None
     st.session_state.questions = None
     st.session_state.current_question_index = 0
     st.session_state.user_answers = {}
     st.session_state.submitted_questions = set()
+    st.session_state.deepened_questions = set()
     st.session_state.all_submitted = False
     st.session_state.final_summary = None
 
 
+def start_generation(generator: ClaudeQCMGenerator, text: str, images, difficulty: str,
+                     variant: int = 0) -> GenerationJob:
+    """
+    Lance un QCM dans un thread de fond (questions disponibles au fil de l'eau)
+    
+    Les questions de la banque jamais vues par l'utilisateur sont servies en premier
+    (instantané) ; la génération en streaming ne complète que ce qui manque.
+    La pré-génération en cours est abandonnée : ses questions déjà en banque peuvent
+    être servies ici, elles ne doivent pas l'être une seconde fois par take_prefetch.
+    """
+    cancel_prefetch()
+    st.session_state.generation_variant = variant
+    count = ClaudeQCMGenerator.NUM_QUESTIONS
+    bank = generator.question_bank
+    document_hash = bank.document_key(text)
+    user_key = bank.user_key(generator.api_key)
+    banked = bank.sample_unseen(document_hash, difficulty, user_key, count)
+    # Marquées vues tout de suite : le calcul du réapprovisionnement ci-dessous ne dépend
+    # pas de l'avancement du thread de génération
+    bank.mark_seen(user_key, document_hash, banked)
+    st.session_state.bank_served = len(banked)
+    
+    def question_source():
+        stream = None
+        questions = iter(banked)
+        if len(banked) < count:
+            stream = generator.generate_qcm_stream(text, images, difficulty=difficulty, variant=variant)
+            questions = itertools.chain(banked, stream)
+        delivered = False
+        try:
+            for question in itertools.islice(questions, count):
+                bank.mark_seen(user_key, document_hash, [question])
+                yield question
+            delivered = True
+        finally:
+            if stream is not None:
+                if delivered and not job.cancelled:
+                    # Les questions générées au-delà du besoin (déjà payées) vont en banque
+                    run_in_background_once(f"drain:{id(stream)}", lambda: deque(stream, maxlen=0))
+                else:
+                    # QCM annulé (Réinitialiser, Régénérer) : libérer le flux HTTP et son créneau
+                    stream.close()
+    
+    job = GenerationJob(question_source, expected=count)
+    job.start()  # Après l'affectation : question_source lit job.cancelled
+    st.session_state.generation_job = job
+    st.session_state.questions = job.questions  # Liste partagée, complétée par le thread
+    
+    # Banque bientôt épuisée pour cet utilisateur : réapprovisionnement en tâche de fond
+    if len(banked) == count and bank.count_unseen(document_hash, difficulty, user_key) < count:
+        top_up_variant = bank.count(document_hash, difficulty) // count + 1
+        run_in_background_once(
+            f"top-up:{document_hash}:{difficulty}",
+            lambda: generator.generate_qcm(text, images, difficulty=difficulty, variant=top_up_variant)
+        )
+    return job
+
+
+def maybe_start_prefetch(generator: ClaudeQCMGenerator):
+    """
+    Pré-génère le QCM suivant (même document, même niveau) dès que le QCM courant
+    est entièrement livré, sauf si la banque peut déjà le servir
+    """
+    job = st.session_state.generation_job
+    text = st.session_state.document_text
+    if job is None or not job.done or not job.questions or text is None:
+        return
+    
+    count = ClaudeQCMGenerator.NUM_QUESTIONS
+    difficulty = st.session_state.difficulty
+    bank = generator.question_bank
+    document_hash = bank.document_key(text)
+    user_key = bank.user_key(generator.api_key)
+    key = (document_hash, difficulty)
+    
+    prefetch = st.session_state.prefetch
+    if prefetch is not None and prefetch['key'] == key and not prefetch['job'].cancelled:
+        return
+    cancel_prefetch()
+    if bank.count_unseen(document_hash, difficulty, user_key) >= count:
+        return
+    
+    images = st.session_state.document_images
+    variant = st.session_state.generation_variant + 1
+    
+    def question_source():
+        return generator.generate_qcm_stream(text, images, difficulty=difficulty, variant=variant)
+    
+    prefetch_job = GenerationJob(question_source, expected=count)
+    if get_prefetch_registry().try_start(user_key, prefetch_job):
+        st.session_state.prefetch = {'key': key, 'job': prefetch_job, 'variant': variant}
+
+
+def cancel_prefetch():
+    """Abandonne la pré-génération en cours (changement de document)"""
+    prefetch = st.session_state.prefetch
+    if prefetch is not None:
+        prefetch['job'].cancel()
+        st.session_state.prefetch = None
+
+
+def take_prefetch(generator: ClaudeQCMGenerator, text: str, difficulty: str):
+    """
+    Installe le QCM pré-généré comme QCM courant s'il correspond au document et au niveau
+    
+    Returns:
+        Le GenerationJob récupéré (éventuellement encore en cours), ou None
+    """
+    prefetch = st.session_state.prefetch
+    st.session_state.prefetch = None
+    bank = generator.question_bank
+    if prefetch is None:
+        return None
+    job = prefetch['job']
+    if prefetch['key'] != (bank.document_key(text), difficulty):
+        job.cancel()  # Pré-générée pour un autre document ou niveau
+        return None
+    if job.cancelled or (job.done and not job.questions):
+        return None
+    
+    # Questions déjà produites marquées vues maintenant, les suivantes dès leur arrivée
+    user_key, document_hash = bank.user_key(generator.api_key), prefetch['key'][0]
+    claimed = job.claim(lambda question: bank.mark_seen(user_key, document_hash, [question]))
+    bank.mark_seen(user_key, document_hash, claimed)
+    st.session_state.generation_job = job
+    st.session_state.questions = job.questions
+    st.session_state.generation_variant = prefetch['variant']
+    st.session_state.bank_served = 0
+    return job
+
+
+def export_button(kind: str, label: str, file_name: str, help_text: str, questions, all_results=None,
+                  summary=None):
+    """
+    Export PDF en deux temps : « Préparer » rend le PDF (une seule fois par contenu),
+    puis le bouton de téléchargement apparaît. Un PDF déjà en cache est proposé directement.
+    """
+    if not PDFExporter.is_exported(kind, questions, all_results, summary):
+        if not st.button(f"{label} · préparer", key=f"prepare_{kind}", help=help_text):
+            return
+        with st.spinner("Création du PDF..."):
+            PDFExporter.export(kind, questions, all_results, summary)
+        st.rerun()  # Remplacer « Préparer » par le bouton de téléchargement
+    
+    st.download_button(
+        label=label,
+        data=PDFExporter.export(kind, questions, all_results, summary),
+        file_name=file_name,
+        mime="application/pdf",
+        help=help_text,
+        key=f"download_{kind}"
+    )
+
+
+def queue_hint() -> str:
+    """Attente prévisible dans la file des appels Claude, à afficher dans les spinners"""
+    wait = get_rate_limiter().estimate_wait()
+    if wait < 1:
+        return ""
+    return f" ⏳ File d'attente : ~{wait:.0f} s"
+
+
+def is_generating() -> bool:
+    """True si des questions sont encore en cours de génération"""
+    job = st.session_state.generation_job
+    return job is not None and not job.done
+
+
+@st.fragment(run_every=1.5)
+def watch_generation(known_count: int):
+    """Surveille la génération en cours et relance l'affichage à chaque nouvelle question"""
+    job = st.session_state.generation_job
+    if job is None:
+        return
+    if job.done or len(job.questions) != known_count:
+        st.rerun()
+    st.caption(f"⏳ Génération en cours : {len(job.questions)}/{job.expected} questions prêtes")
+
+
+def render_metrics_panel():
+    """Résumé des mesures de la session : temps par étape, tokens, images envoyées"""
+    session = st.session_state.metrics
+    with st.expander("📈 Métriques de la session"):
+        parse = session.timer("qcm_parse_seconds")
+        api = session.timer("qcm_api_call_seconds")
+        json_parse = session.timer("qcm_json_parse_seconds")
+        export = session.timer("qcm_pdf_export_seconds")
+        if not (parse['count'] or api['count'] or export['count']):
+            st.caption("Aucune mesure pour l'instant")
+            return
+        
+        st.caption(f"📄 Extraction : {parse['count']} document(s), {parse['total']:.2f} s")
+        st.caption(
+            f"🤖 API : {api['count']} appel(s), moy. {api['avg']:.1f} s, p95 {api['p95']:.1f} s, "
+            f"{int(session.counter('qcm_api_errors_total'))} erreur(s), "
+            f"{int(session.counter('qcm_api_retries_total'))} nouvel(s) essai(s)"
+        )
+        st.caption(
+            f"🔢 Tokens : {int(session.counter('qcm_tokens_total', type='input'))} entrée / "
+            f"{int(session.counter('qcm_tokens_total', type='output'))} sortie / "
+            f"{int(session.counter('qcm_tokens_total', type='cache_read'))} lus en cache / "
+            f"{int(session.counter('qcm_tokens_total', type='cache_creation'))} écrits en cache"
+        )
+        st.caption(
+            f"🖼️ Images envoyées : {int(session.counter('qcm_images_sent_total'))} "
+            f"({session.counter('qcm_image_bytes_sent_total') / 1e6:.2f} Mo)"
+        )
+        st.caption(f"🧩 Parsing JSON : {json_parse['total'] * 1000:.0f} ms")
+        st.caption(f"📥 Export PDF : {export['count']} fichier(s), {export['total']:.2f} s")
+        st.download_button(
+            "Exporter (Prometheus, tout le serveur)",
+            data=get_metrics().to_prometheus(),
+            file_name="qcm_metrics.prom",
+            mime="text/plain"
+        )
+
+
 def main():
     initialize_session_state()
+    # Mesures de ce script et des tâches de fond qu'il lance attribuées à cette session
+    bind_session(st.session_state.metrics)
     
     # En-tête
     st.markdown('<h1 class="main-header">🏥 QCM Médical - EDN</h1>', unsafe_allow_html=True)
@@ -142,6 +384,30 @@ def main():
         """)
         
         st.divider()
+        
+        # Statistiques du cache d'extraction (partagé entre sessions)
+        cache_stats = get_extraction_cache().stats()
+        cache_hits = cache_stats['memory_hits'] + cache_stats['disk_hits']
+        st.caption(f"🗄️ Cache extraction : {cache_hits} hit(s) / {cache_stats['misses']} miss(es)")
+        feedback_stats = get_feedback_cache().stats()
+        st.caption(f"💬 Cache feedback : {feedback_stats['hits']} hit(s) / {feedback_stats['misses']} miss(es)")
+        generation_usage = get_usage_tracker().summary().get('generation')
+        if generation_usage:
+            st.caption(
+                f"⚡ Cache prompt : {generation_usage['cache_read_input_tokens']} tokens lus / "
+                f"{generation_usage['cache_creation_input_tokens']} écrits"
+            )
+        limiter_stats = get_rate_limiter().stats()
+        if limiter_stats['waited_calls'] or limiter_stats['waiting']:
+            st.caption(
+                f"🚦 File API : {limiter_stats['waiting']} en attente, "
+                f"attente moyenne {limiter_stats['avg_wait']:.1f} s, {limiter_stats['retries']} nouvel(s) essai(s)"
+            )
+        st.caption(f"📚 Banque de questions : {get_question_bank().count()} question(s)")
+        feedback_queue = get_rate_limiter().scheduler.stats()['interactive']
+        if feedback_queue['served']:
+            st.caption(f"🎯 Feedback prioritaire : attente p95 {feedback_queue['p95_wait']:.1f} s")
+        render_metrics_panel()
         st.caption("Propulsé par Claude Haiku 4.5 🚀")
     
     # Si pas de clé API, arrêter ici
@@ -151,6 +417,7 @@ def main():
     
     # Initialisation du générateur
     generator = ClaudeQCMGenerator(api_key)
+    maybe_start_prefetch(generator)
     
     # Zone principale
     tab1, tab2, tab3 = st.tabs(["📤 Upload & Génération", "📝 QCM Interactif", "📊 Résultats"])
@@ -236,34 +503,59 @@ def main():
                     try:
                         # Extraction du document
                         file_bytes = uploaded_file.read()
-                        text, images = DocumentParser.parse_document(file_bytes, file_type)
+                        parse_stats = {}
+                        text, images = DocumentParser.parse_document(file_bytes, file_type, stats=parse_stats)
+                        
+                        # Même document qu'avant (Régénérer) : nouvelle variante, préfixe en cache
+                        if text == st.session_state.document_text:
+                            variant = st.session_state.generation_variant + 1
+                        else:
+                            variant = 0
+                            cancel_prefetch()  # Pré-génération faite pour l'ancien document
                         
                         # Stockage dans session
                         st.session_state.document_text = text
                         st.session_state.document_images = images
                         
                         st.success(f"✅ Extraction réussie : {len(text)} caractères, {len(images)} image(s)")
+                        repeated = parse_stats['repeated_images'] + parse_stats['near_duplicate_images']
+                        if repeated:
+                            st.caption(f"🔁 {repeated} image(s) répétée(s) ignorée(s) (logos, bandeaux...)")
+                        if parse_stats.get('tokens_saved', 0) > 0:
+                            st.caption(
+                                f"✂️ Texte normalisé : ~{parse_stats['tokens_saved']} tokens économisés "
+                                f"({parse_stats['tokens_saved'] / parse_stats['tokens_raw']:.0%} : en-têtes, "
+                                f"pieds de page, numéros de page, césures)"
+                            )
                         
                     except Exception as e:
                         st.error(f"❌ Erreur lors de l'extraction : {e}")
                         return
                 
-                with st.spinner(f"🤖 Claude génère vos questions ({label})... (30-60 secondes)"):
+                with st.spinner(f"🤖 Claude génère vos questions ({label})... (première question en quelques secondes){queue_hint()}"):
                     try:
-                        # Génération des questions avec le niveau de difficulté
-                        questions = generator.generate_qcm(
+                        # Génération en streaming avec le niveau de difficulté
+                        reset_qcm()
+                        job = start_generation(
+                            generator,
                             st.session_state.document_text,
                             st.session_state.document_images,
-                            difficulty=st.session_state.difficulty
+                            st.session_state.difficulty,
+                            variant
                         )
+                        job.wait_for(1)
                         
-                        if not questions or len(questions) == 0:
+                        if not job.questions:
+                            reset_qcm()
                             st.error("❌ Aucune question n'a pu être générée. Réessayez.")
                             return
                         
-                        st.session_state.questions = questions
-                        st.success(f"✅ {len(questions)} questions générées avec succès !")
-                        st.info("👉 Passez à l'onglet **QCM Interactif** pour commencer")
+                        st.success(f"✅ Première question prête en {job.time_to_first_question:.1f} s !")
+                        if st.session_state.bank_served:
+                            st.caption(f"📚 {st.session_state.bank_served} question(s) servie(s) "
+                                       "depuis la banque de questions (sans appel API)")
+                        st.info("👉 Passez à l'onglet **QCM Interactif** pour commencer : "
+                                "les questions suivantes arrivent pendant que vous répondez")
                         st.balloons()
                         
                     except Exception as e:
@@ -281,7 +573,7 @@ def main():
                        unsafe_allow_html=True)
             
             with st.expander("Cliquez pour voir toutes les questions", expanded=False):
-                for i, q in enumerate(st.session_state.questions, 1):
+                for i, q in enumerate(list(st.session_state.questions), 1):
                     st.markdown(f"**Question {i} :** {q['question']}")
                     st.caption(f"→ {len(q['options'])} options, {len(q['correct_answers'])} bonne(s) réponse(s)")
                     st.divider()
@@ -292,8 +584,15 @@ def main():
             st.info("📤 Uploadez d'abord un document dans l'onglet **Upload & Génération**")
             return
         
-        questions = st.session_state.questions
+        # Copie : la liste peut encore grandir pendant le rendu (génération en streaming)
+        questions = list(st.session_state.questions)
         current_idx = st.session_state.current_question_index
+        generating = is_generating()
+        total_questions = max(len(questions), st.session_state.generation_job.expected) if generating else len(questions)
+        
+        # Fin de génération après que toutes les questions disponibles ont été traitées
+        if not generating and questions and len(st.session_state.submitted_questions) == len(questions):
+            st.session_state.all_submitted = True
         
         # Badge du niveau
         label, css_class = difficulty_labels[st.session_state.difficulty]
@@ -301,8 +600,10 @@ def main():
                    unsafe_allow_html=True)
         
         # Barre de progression
-        progress = len(st.session_state.submitted_questions) / len(questions)
-        st.progress(progress, text=f"Progression : {len(st.session_state.submitted_questions)}/{len(questions)} questions traitées")
+        progress = len(st.session_state.submitted_questions) / total_questions
+        st.progress(progress, text=f"Progression : {len(st.session_state.submitted_questions)}/{total_questions} questions traitées")
+        if generating:
+            watch_generation(len(questions))
         
         st.divider()
         
@@ -316,7 +617,7 @@ def main():
                     st.rerun()
         
         with col2:
-            st.markdown(f"### Question {current_idx + 1} / {len(questions)}")
+            st.markdown(f"### Question {current_idx + 1} / {total_questions}")
         
         with col3:
             if current_idx < len(questions) - 1:
@@ -367,7 +668,7 @@ def main():
                     st.session_state.submitted_questions.add(current_idx)
                     
                     # Vérifier si toutes les questions sont terminées
-                    if len(st.session_state.submitted_questions) == len(questions):
+                    if not generating and len(st.session_state.submitted_questions) == len(questions):
                         st.session_state.all_submitted = True
                     
                     st.rerun()
@@ -386,12 +687,24 @@ def main():
             else:
                 st.markdown('<div class="incorrect-answer">❌ <b>Réponse incomplète ou incorrecte</b></div>', unsafe_allow_html=True)
             
-            # Feedback détaillé (OPTIMISÉ - Plus rapide)
-            with st.spinner("💡 Claude analyse votre réponse (⚡ rapide)..."):
-                feedback = generator.explain_answer(current_question, user_answer)
+            # Feedback composé localement (justifications générées avec la question) : instantané
+            feedback = ClaudeQCMGenerator.compose_feedback(current_question, user_answer)
+            deepened = current_idx in st.session_state.deepened_questions
             
             st.markdown("### 💡 Explication")
-            st.markdown(feedback)
+            if feedback is not None:
+                st.markdown(feedback)
+            
+            # Analyse détaillée par Claude : à la demande, ou si pas de justifications
+            if feedback is None or deepened:
+                with st.spinner(f"💡 Claude analyse votre réponse (⚡ rapide)...{queue_hint()}"):
+                    detailed = generator.explain_answer(current_question, user_answer)
+                if feedback is not None:
+                    st.markdown("#### 🔍 Analyse approfondie")
+                st.markdown(detailed)
+            elif st.button("🔍 Approfondir avec Claude", key=f"deepen_{current_idx}"):
+                st.session_state.deepened_questions.add(current_idx)
+                st.rerun()
             
             st.divider()
             
@@ -400,6 +713,8 @@ def main():
                 if st.button("➡️ Question suivante", type="primary", use_container_width=True):
                     st.session_state.current_question_index += 1
                     st.rerun()
+            elif generating:
+                st.info("⏳ La question suivante est en cours de génération, elle s'affichera automatiquement...")
             else:
                 st.success("🎉 Vous avez terminé toutes les questions !")
                 if st.button("📊 Voir le récapitulatif complet", type="primary", use_container_width=True):
@@ -455,7 +770,7 @@ def main():
         
         # Génération du récapitulatif personnalisé
         if st.session_state.final_summary is None:
-            with st.spinner("🤖 Claude prépare votre récapitulatif personnalisé..."):
+            with st.spinner(f"🤖 Claude prépare votre récapitulatif personnalisé...{queue_hint()}"):
                 summary = generator.generate_final_summary(all_results)
                 st.session_state.final_summary = summary
         
@@ -469,38 +784,22 @@ def main():
         
         col1, col2, col3 = st.columns(3)
         
+        # PDF rendus seulement à la demande, puis mémorisés (toutes sessions)
         with col1:
             # QCM vierge
-            pdf_blank = PDFExporter.create_qcm_pdf(questions, with_answers=False)
-            st.download_button(
-                label="📄 QCM vierge",
-                data=pdf_blank,
-                file_name="qcm_medical_vierge.pdf",
-                mime="application/pdf",
-                help="Questions sans réponses (pour révision)"
-            )
+            export_button("vierge", "📄 QCM vierge", "qcm_medical_vierge.pdf",
+                          "Questions sans réponses (pour révision)", questions)
         
         with col2:
             # QCM avec corrigé
-            pdf_answers = PDFExporter.create_qcm_pdf(questions, with_answers=True)
-            st.download_button(
-                label="📗 QCM avec corrigé",
-                data=pdf_answers,
-                file_name="qcm_medical_corrige.pdf",
-                mime="application/pdf",
-                help="Questions avec explications complètes"
-            )
+            export_button("corrige", "📗 QCM avec corrigé", "qcm_medical_corrige.pdf",
+                          "Questions avec explications complètes", questions)
         
         with col3:
             # Résultats de la session
-            pdf_results = PDFExporter.create_results_pdf(all_results, st.session_state.final_summary)
-            st.download_button(
-                label="📊 Mes résultats",
-                data=pdf_results,
-                file_name="mes_resultats_qcm.pdf",
-                mime="application/pdf",
-                help="Votre performance sur cette session"
-            )
+            export_button("resultats", "📊 Mes résultats", "mes_resultats_qcm.pdf",
+                          "Votre performance sur cette session", questions,
+                          all_results, st.session_state.final_summary)
         
         st.divider()
         
@@ -513,9 +812,18 @@ def main():
             
             reset_qcm()
             
-            with st.spinner("🤖 Génération d'un nouveau QCM..."):
-                questions = generator.generate_qcm(text, images, difficulty=difficulty)
-                st.session_state.questions = questions
+            # QCM suivant déjà pré-généré en tâche de fond : échange immédiat
+            job = take_prefetch(generator, text, difficulty)
+            if job is None:
+                with st.spinner(f"🤖 Génération d'un nouveau QCM...{queue_hint()}"):
+                    job = start_generation(generator, text, images, difficulty,
+                                           st.session_state.generation_variant + 1)
+            job.wait_for(1)
+            
+            if not job.questions:
+                reset_qcm()
+                st.error("❌ Aucune question n'a pu être générée. Réessayez.")
+                return
             
             st.success("✅ Nouveau QCM généré !")
             st.rerun()
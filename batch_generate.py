@@ -0,0 +1,339 @@
+"""
+Génération de QCM en lot, sans interface (un dossier de cours Word/PDF)
+
+- Extraction des documents sur un pool de processus (DocumentParser.parse_document)
+- File bornée vers des threads de génération (ClaudeQCMGenerator.generate_qcm),
+  tous derrière le limiteur de débit partagé du process
+- Résultats en JSONL (une ligne par document) + PDF vierge et corrigé (PDFExporter)
+- Reprise : manifest des empreintes de fichiers déjà traités, ignorés au relancement
+  avec les mêmes réglages (niveau de difficulté, nombre de questions)
+- Rapport final : débit (documents/min) et temps par étape
+
+Usage : python batch_generate.py COURS/ [--output qcm_batch] [--difficulty intermediaire]
+        [--parse-workers 4] [--generation-workers 4] [--queue-size 8] [--no-pdf]
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import hashlib
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from utils.document_parser import DocumentParser
+from utils.claude_api import ClaudeQCMGenerator
+from utils.pdf_export import PDFExporter
+
+
+SUPPORTED_EXTENSIONS = {'.pdf': 'pdf', '.docx': 'docx'}
+STAGES = ('parse', 'queue', 'generate', 'export')
+
+
+def find_documents(input_dir: str) -> List[str]:
+    """Fichiers Word/PDF du dossier (récursif), dans un ordre stable"""
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS and not name.startswith('~$'):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def file_hash(path: str) -> str:
+    """Empreinte du contenu (un fichier renommé ou déplacé n'est pas retraité)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Empreintes des documents déjà traités (une ligne JSON par document, en ajout seul)
+    Un document n'est considéré traité que pour les réglages du lot qui l'a produit :
+    relancer avec une autre difficulté ou un autre nombre de questions le retraite
+    """
+
+    def __init__(self, path: str, difficulty: str, num_questions: int):
+        self.path = path
+        self.difficulty = difficulty
+        self.num_questions = num_questions
+        self.completed: Set[str] = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if (entry.get('difficulty'), entry.get('num_questions')) == (difficulty, num_questions):
+                            self.completed.add(entry['hash'])
+                    except (ValueError, KeyError, AttributeError):
+                        continue  # Ligne tronquée par une interruption
+
+    def __contains__(self, document_hash: str) -> bool:
+        return document_hash in self.completed
+
+    def add(self, document_hash: str, path: str) -> None:
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'hash': document_hash, 'file': path, 'difficulty': self.difficulty,
+                                    'num_questions': self.num_questions, 'completed_at': time.time()},
+                                   ensure_ascii=False) + "\n")
+            self.completed.add(document_hash)
+
+
+class StageTimings:
+    """Temps cumulés par étape (thread-safe)"""
+
+    def __init__(self):
+        self.totals = {stage: 0.0 for stage in STAGES}
+        self.counts = {stage: 0 for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.totals[stage] += seconds
+            self.counts[stage] += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {
+                    'total': self.totals[stage],
+                    'avg': self.totals[stage] / self.counts[stage] if self.counts[stage] else 0.0
+                }
+                for stage in STAGES
+            }
+
+
+# ----- Extraction (processus du pool) -----
+
+def _init_parse_worker() -> None:
+    """Un document par processus : pas de second pool de pages imbriqué dans un worker"""
+    DocumentParser.MAX_WORKERS = 1
+
+
+def _parse_file(path: str, document_hash: str) -> Dict:
+    """Extrait un document dans un worker (ExtractedImage est picklable)"""
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        file_bytes = f.read()
+    file_type = SUPPORTED_EXTENSIONS[os.path.splitext(path)[1].lower()]
+    stats = {}
+    text, images = DocumentParser.parse_document(file_bytes, file_type, stats=stats)
+    return {
+        'path': path,
+        'hash': document_hash,
+        'text': text,
+        'images': images,
+        'stats': stats,
+        'parse_time': time.perf_counter() - started
+    }
+
+
+def iter_parsed(pending_files: List[Dict], workers: int) -> Iterator[Dict]:
+    """
+    Extrait les documents sur un pool de processus, par fenêtre glissante
+    (au plus 2 documents en vol par worker) ; les erreurs sont produites, pas levées
+    """
+    files = deque(pending_files)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker)
+    try:
+        in_flight = deque()
+        while files or in_flight:
+            while files and len(in_flight) < workers * 2:
+                entry = files.popleft()
+                in_flight.append((entry, executor.submit(_parse_file, entry['path'], entry['hash'])))
+            entry, future = in_flight.popleft()
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {'path': entry['path'], 'hash': entry['hash'], 'error': str(e)}
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# ----- Génération et export (threads) -----
+
+class BatchRunner:
+    """Consomme la file des documents extraits : génération, écriture JSONL et PDF, manifest"""
+
+    def __init__(self, generator: ClaudeQCMGenerator, output_dir: str, difficulty: str,
+                 manifest: Manifest, export_pdf: bool = True):
+        self.generator = generator
+        self.output_dir = output_dir
+        self.difficulty = difficulty
+        self.manifest = manifest
+        self.export_pdf = export_pdf
+        self.timings = StageTimings()
+        self.succeeded = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self.results_path = os.path.join(output_dir, "questions.jsonl")
+        self.pdf_dir = os.path.join(output_dir, "pdf")
+        if export_pdf:
+            os.makedirs(self.pdf_dir, exist_ok=True)
+
+    def _fail(self, path: str, message: str) -> None:
+        with self._lock:
+            self.failed += 1
+            print(f"❌ {os.path.basename(path)} : {message}")
+
+    def process(self, document: Dict) -> None:
+        """Génère, exporte et enregistre un document extrait"""
+        path = document['path']
+        if 'error' in document:
+            self._fail(path, f"extraction impossible ({document['error']})")
+            return
+        if not document['text'].strip():
+            self._fail(path, "aucun texte extrait")
+            return
+        self.timings.record('queue', time.perf_counter() - document['queued_at'])
+
+        started = time.perf_counter()
+        questions = self.generator.generate_qcm(document['text'], document['images'], difficulty=self.difficulty)
+        generate_time = time.perf_counter() - started
+        self.timings.record('generate', generate_time)
+        if not questions:
+            self._fail(path, "aucune question générée")
+            return
+
+        export_time = 0.0
+        pdf_files = {}
+        if self.export_pdf:
+            started = time.perf_counter()
+            stem = f"{os.path.splitext(os.path.basename(path))[0]}-{document['hash'][:8]}"
+            for suffix, with_answers in (("", False), ("_corrige", True)):
+                pdf_path = os.path.join(self.pdf_dir, f"{stem}{suffix}.pdf")
+                with open(pdf_path, 'wb') as f:
+                    f.write(PDFExporter.create_qcm_pdf(questions, with_answers=with_answers).getvalue())
+                pdf_files['corrige' if with_answers else 'qcm'] = os.path.relpath(pdf_path, self.output_dir)
+            export_time = time.perf_counter() - started
+            self.timings.record('export', export_time)
+
+        record = {
+            'file': path,
+            'hash': document['hash'],
+            'difficulty': self.difficulty,
+            'model': self.generator.model,
+            'questions': questions,
+            'pdf': pdf_files,
+            'extraction': document['stats'],
+            'timings': {
+                'parse': round(document['parse_time'], 3),
+                'generate': round(generate_time, 3),
+                'export': round(export_time, 3)
+            }
+        }
+        with self._lock:
+            with open(self.results_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.succeeded += 1
+        # Manifest en dernier : un document interrompu avant cette ligne sera retraité
+        self.manifest.add(document['hash'], path)
+        with self._lock:
+            print(f"✅ {os.path.basename(path)} : {len(questions)} questions ({generate_time:.1f} s)")
+
+    def worker(self, documents: "queue.Queue[Optional[Dict]]") -> None:
+        while True:
+            document = documents.get()
+            if document is None:
+                return
+            try:
+                self.process(document)
+            except Exception as e:
+                self._fail(document['path'], str(e))
+
+
+def run_batch(args) -> Dict:
+    """Lance le lot complet et retourne le rapport (débit, temps par étape)"""
+    started = time.perf_counter()
+    os.makedirs(args.output, exist_ok=True)
+    manifest = Manifest(os.path.join(args.output, "manifest.jsonl"), args.difficulty,
+                        ClaudeQCMGenerator.NUM_QUESTIONS)
+
+    paths = find_documents(args.input_dir)
+    pending_files = []
+    for path in paths:
+        document_hash = file_hash(path)
+        if document_hash not in manifest:
+            pending_files.append({'path': path, 'hash': document_hash})
+    skipped = len(paths) - len(pending_files)
+    print(f"📚 {len(paths)} document(s) trouvé(s), {skipped} déjà traité(s), {len(pending_files)} à traiter\n")
+
+    runner = BatchRunner(ClaudeQCMGenerator(args.api_key), args.output, args.difficulty,
+                         manifest, export_pdf=not args.no_pdf)
+    # File bornée : l'extraction s'arrête quand la génération ne suit pas (mémoire bornée)
+    documents = queue.Queue(maxsize=args.queue_size)
+    threads = [threading.Thread(target=runner.worker, args=(documents,), daemon=True)
+               for _ in range(args.generation_workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        if pending_files:
+            for document in iter_parsed(pending_files, args.parse_workers):
+                if 'error' not in document:
+                    runner.timings.record('parse', document['parse_time'])
+                document['queued_at'] = time.perf_counter()
+                documents.put(document)
+    finally:
+        for _ in threads:
+            documents.put(None)
+        for thread in threads:
+            thread.join()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'found': len(paths),
+        'skipped': skipped,
+        'succeeded': runner.succeeded,
+        'failed': runner.failed,
+        'elapsed': elapsed,
+        'documents_per_minute': runner.succeeded / elapsed * 60 if elapsed > 0 else 0.0,
+        'stages': runner.timings.summary()
+    }
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Génération de QCM en lot depuis un dossier de cours")
+    parser.add_argument("input_dir", help="Dossier contenant les cours (.pdf, .docx), parcouru récursivement")
+    parser.add_argument("--output", default="qcm_batch", help="Dossier de sortie (JSONL, PDF, manifest)")
+    parser.add_argument("--difficulty", default="intermediaire", choices=["facile", "intermediaire", "difficile"])
+    parser.add_argument("--api-key", default=os.getenv("ANTHROPIC_API_KEY"), help="Clé API (défaut ANTHROPIC_API_KEY)")
+    parser.add_argument("--parse-workers", type=int, default=DocumentParser.MAX_WORKERS,
+                        help="Processus d'extraction")
+    parser.add_argument("--generation-workers", type=int, default=4, help="Générations simultanées")
+    parser.add_argument("--queue-size", type=int, default=8, help="Documents extraits en attente de génération")
+    parser.add_argument("--no-pdf", action="store_true", help="Ne pas exporter les PDF")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"dossier introuvable : {args.input_dir}")
+    if not args.api_key and not os.environ.get("QCM_FAKE_BACKEND"):
+        parser.error("clé API manquante (--api-key ou ANTHROPIC_API_KEY)")
+    args.api_key = args.api_key or "fake-backend"
+
+    report = run_batch(args)
+
+    print("\n" + "=" * 50)
+    print(f"✅ {report['succeeded']} réussi(s) | ❌ {report['failed']} échec(s) | "
+          f"⏭️ {report['skipped']} déjà traité(s)")
+    print(f"⏱️ {report['elapsed']:.1f} s — {report['documents_per_minute']:.1f} documents/min")
+    labels = {'parse': "Extraction", 'queue': "File d'attente", 'generate': "Génération", 'export': "Export PDF"}
+    for stage, timing in report['stages'].items():
+        print(f"  {labels[stage]:<15}: total {timing['total']:.1f} s | moy. {timing['avg']:.2f} s/document")
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+"""
+Benchmarks de l'extraction, de l'export PDF et du pipeline de génération
+Lancement : python -m benchmarks.run_benchmarks
+"""
@@ -0,0 +1,143 @@
+"""
+Faux serveur HTTP de l'API Anthropic (POST /v1/messages, JSON ou SSE)
+Contrairement à utils.fake_backend, le vrai client anthropic est utilisé :
+sérialisation, pool de connexions httpx et parsing du flux sont mesurés
+"""
+
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional
+
+from utils.fake_backend import FakeBackendConfig, fake_response_text
+
+
+class FakeAnthropicServer:
+    """
+    Serveur local à latence configurable (temps avant premier token + débit de sortie)
+
+    Usage :
+        with FakeAnthropicServer(first_token_latency=0.3) as server:
+            os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+    """
+
+    CHUNK_CHARS = 24
+
+    def __init__(self, first_token_latency: float = FakeBackendConfig.FIRST_TOKEN_LATENCY,
+                 tokens_per_second: float = FakeBackendConfig.OUTPUT_TOKENS_PER_SECOND):
+        self.config = FakeBackendConfig()
+        self.config.FIRST_TOKEN_LATENCY = first_token_latency
+        self.config.OUTPUT_TOKENS_PER_SECOND = tokens_per_second
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeAnthropicServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive : une connexion réutilisée par client
+
+            def log_message(self, *args) -> None:
+                return None
+
+            def do_POST(self) -> None:
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server._lock:
+                    server.requests += 1
+                text = fake_response_text(body)
+                if body.get('stream'):
+                    try:
+                        server._send_stream(self, body, text)
+                    except (BrokenPipeError, ConnectionResetError):
+                        self.close_connection = True  # Flux abandonné par le client
+                else:
+                    time.sleep(server.config.first_token_delay() + server.config.output_delay(text))
+                    server._send_json(self, server._message(body, text))
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeAnthropicServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    # ----- Réponses -----
+
+    @staticmethod
+    def _usage(body: Dict, text: str) -> Dict:
+        prompt_chars = len(json.dumps(body.get('messages', []), ensure_ascii=False))
+        return {
+            'input_tokens': prompt_chars // 4,
+            'output_tokens': len(text) // 4,
+            'cache_read_input_tokens': 0,
+            'cache_creation_input_tokens': 0
+        }
+
+    def _message(self, body: Dict, text: str) -> Dict:
+        return {
+            'id': f"msg_bench_{self.requests}",
+            'type': "message",
+            'role': "assistant",
+            'model': body.get('model'),
+            'content': [{'type': "text", 'text': text}],
+            'stop_reason': "end_turn",
+            'stop_sequence': None,
+            'usage': self._usage(body, text)
+        }
+
+    @staticmethod
+    def _send_json(handler: BaseHTTPRequestHandler, payload: Dict) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        handler.send_response(200)
+        handler.send_header("content-type", "application/json")
+        handler.send_header("content-length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _send_stream(self, handler: BaseHTTPRequestHandler, body: Dict, text: str) -> None:
+        handler.send_response(200)
+        handler.send_header("content-type", "text/event-stream")
+        handler.send_header("transfer-encoding", "chunked")
+        handler.end_headers()
+
+        def event(name: str, data: Dict) -> None:
+            chunk = f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+            handler.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            handler.wfile.flush()
+
+        message = self._message(body, "")
+        message['content'] = []
+        message['stop_reason'] = None
+        time.sleep(self.config.first_token_delay())
+        event("message_start", {'type': "message_start", 'message': message})
+        event("content_block_start", {'type': "content_block_start", 'index': 0,
+                                      'content_block': {'type': "text", 'text': ""}})
+        for i in range(0, len(text), self.CHUNK_CHARS):
+            chunk = text[i:i + self.CHUNK_CHARS]
+            time.sleep(self.config.output_delay(chunk))
+            event("content_block_delta", {'type': "content_block_delta", 'index': 0,
+                                          'delta': {'type': "text_delta", 'text': chunk}})
+        event("content_block_stop", {'type': "content_block_stop", 'index': 0})
+        event("message_delta", {'type': "message_delta",
+                                'delta': {'stop_reason': "end_turn", 'stop_sequence': None},
+                                'usage': {'output_tokens': len(text) // 4}})
+        event("message_stop", {'type': "message_stop"})
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.wfile.flush()
@@ -0,0 +1,148 @@
+"""
+Fixtures synthétiques déterministes pour les benchmarks
+Même graine = mêmes octets : les résultats de deux exécutions sont comparables
+"""
+
+import io
+import random
+from typing import Dict, List, Tuple
+
+import fitz  # PyMuPDF
+from docx import Document
+from docx.shared import Cm
+from PIL import Image, ImageDraw
+
+
+WORDS = (
+    "insuffisance cardiaque ventricule gauche fraction éjection dyspnée œdème pulmonaire "
+    "diurétique bêtabloquant inhibiteur enzyme conversion créatinine kaliémie natrémie "
+    "hypertension artérielle fibrillation auriculaire anticoagulant thrombose embolie "
+    "échographie électrocardiogramme troponine syndrome coronarien aigu angioplastie "
+    "néphropathie diabétique protéinurie glomérulaire débit filtration clairance dialyse"
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(_sentence(rng, rng.randint(8, 18)) for _ in range(sentences))
+
+
+def make_image(seed: int, size: Tuple[int, int] = (1600, 1200), fmt: str = 'PNG') -> bytes:
+    """Image « schéma » : dégradé, formes et bruit (compresse comme une vraie figure)"""
+    rng = random.Random(seed)
+    width, height = size
+    img = Image.linear_gradient('L').resize(size).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(20, width // 3), y0 + rng.randrange(20, height // 3)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), outline=color, width=rng.randint(1, 6))
+        else:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+    noise = Image.frombytes('L', size, rng.randbytes(width * height)).convert('RGB')
+    img = Image.blend(img, noise, 0.15)
+    output = io.BytesIO()
+    img.save(output, format=fmt, quality=92) if fmt == 'JPEG' else img.save(output, format=fmt)
+    return output.getvalue()
+
+
+def make_pdf(pages: int = 300, image_every: int = 4, seed: int = 0) -> bytes:
+    """
+    Polycopié PDF : en-tête et pied de page répétés, logo sur chaque page,
+    texte courant et une figure toutes les `image_every` pages
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    logo = make_image(seed + 1, (240, 80))
+    for page_num in range(pages):
+        page = doc.new_page()  # A4
+        page.insert_text((50, 30), "Faculté de Médecine — Cardiologie DFASM", fontsize=8)
+        page.insert_image(fitz.Rect(470, 15, 545, 40), stream=logo)
+        body = "\n".join(_paragraph(rng, 3) for _ in range(4))
+        text_rect = fitz.Rect(50, 60, 545, 480 if page_num % image_every == 0 else 790)
+        page.insert_textbox(text_rect, body, fontsize=9)
+        if page_num % image_every == 0:
+            figure = make_image(seed + 100 + page_num // image_every, (1600, 1200), 'JPEG')
+            page.insert_image(fitz.Rect(80, 490, 515, 780), stream=figure)
+        page.insert_text((280, 820), f"Page {page_num + 1}", fontsize=8)
+    # Dates et identifiant fixes : octets identiques d'une exécution à l'autre
+    doc.set_metadata({'creationDate': "D:20240101000000", 'modDate': "D:20240101000000",
+                      'producer': "benchmarks", 'creator': "benchmarks"})
+    data = doc.tobytes(garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+    return data
+
+
+def make_docx(paragraphs: int = 3000, table_every: int = 30, images: int = 8, seed: int = 0) -> bytes:
+    """Cours Word : titres, paragraphes, tableaux (dont imbriqués et à cellules fusionnées) et figures"""
+    rng = random.Random(seed)
+    doc = Document()
+    image_every = max(1, paragraphs // max(1, images))
+    for index in range(paragraphs):
+        if index % 50 == 0:
+            doc.add_heading(f"Chapitre {index // 50 + 1} : {_sentence(rng, 4)}", level=1)
+        doc.add_paragraph(_paragraph(rng, rng.randint(2, 5)))
+        if index % table_every == table_every - 1:
+            table = doc.add_table(rows=6, cols=4)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+            if index % (table_every * 5) == table_every - 1:
+                nested = table.cell(1, 1).add_table(rows=2, cols=2)
+                for row in nested.rows:
+                    for cell in row.cells:
+                        cell.text = rng.choice(WORDS)
+            if index % (table_every * 3) == 2 * table_every - 1:
+                # Cellules fusionnées : colonne 0 verticalement, dernière ligne entièrement en suite de fusion
+                table.cell(0, 2).merge(table.cell(0, 3))
+                table.cell(2, 0).merge(table.cell(5, 0))
+                for column in range(1, 4):
+                    table.cell(4, column).merge(table.cell(5, column))
+        if images and index % image_every == image_every - 1:
+            figure = make_image(seed + 200 + index, (1200, 900), 'JPEG')
+            doc.add_picture(io.BytesIO(figure), width=Cm(12))
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue()
+
+
+def make_questions(count: int, seed: int = 0) -> List[Dict]:
+    """Questions au format de ClaudeQCMGenerator (5 propositions, justifications)"""
+    rng = random.Random(seed)
+    questions = []
+    for index in range(count):
+        correct = sorted(rng.sample(range(5), rng.randint(1, 3)))
+        questions.append({
+            'question': f"{_sentence(rng, 14)[:-1]} ? ({index + 1})",
+            'options': [_sentence(rng, rng.randint(4, 10)) for _ in range(5)],
+            'correct_answers': correct,
+            'explanation': _paragraph(rng, 3),
+            'option_rationales': [_sentence(rng, 10) for _ in range(5)]
+        })
+    return questions
+
+
+def make_results(questions: List[Dict], seed: int = 0) -> Tuple[List[Dict], str]:
+    """Résultats d'un QCM complété (format de app.py) et récapitulatif"""
+    rng = random.Random(seed)
+    results = []
+    for question in questions:
+        if rng.random() < 0.6:
+            user_answers = list(question['correct_answers'])
+        else:
+            user_answers = sorted(rng.sample(range(len(question['options'])), rng.randint(0, 2)))
+        results.append({
+            'question': question['question'],
+            'options': question['options'],
+            'user_answers': user_answers,
+            'correct_answers': question['correct_answers'],
+            'explanation': question['explanation']
+        })
+    summary = "\n".join(f"**Point {i + 1}** : {_paragraph(rng, 2)}" for i in range(6))
+    return results, summary
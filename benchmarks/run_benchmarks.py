@@ -0,0 +1,318 @@
+"""
+Suite de benchmarks : extraction, optimisation d'images, export PDF et pipeline
+complet contre un faux serveur Anthropic local
+
+Les résultats sont écrits en JSON (benchmarks/results/) pour comparer deux versions :
+    python -m benchmarks.run_benchmarks [--quick] [--only pdf] [--latency 0.3]
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/avant.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+import zipfile
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks import fixtures
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REGRESSION_THRESHOLD = 0.10  # Écart signalé dans la comparaison (+10 %)
+
+SIZES = {
+    'full': {'pdf_pages': 300, 'docx_paragraphs': 3000, 'question_counts': (10, 100, 1000, 2000), 'repeat': 5},
+    'quick': {'pdf_pages': 40, 'docx_paragraphs': 300, 'question_counts': (10, 100), 'repeat': 3}
+}
+
+
+def peak_memory_mb(fn: Callable[[], Any]) -> float:
+    """Pic d'allocations Python (Mo) pendant un appel de fn"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Exécute fn `warmup` + `repeat` fois et résume les durées (secondes)"""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return {
+        'repeat': repeat,
+        'min': min(durations),
+        'median': statistics.median(durations),
+        'mean': statistics.fmean(durations),
+        'max': max(durations)
+    }
+
+
+class BenchmarkSuite:
+    """Enregistre les benchmarks sélectionnés et collecte leurs résultats"""
+
+    def __init__(self, only: Optional[List[str]] = None):
+        self.only = only or []
+        self.results: Dict[str, Dict] = {}
+
+    def selected(self, name: str) -> bool:
+        return not self.only or any(pattern in name for pattern in self.only)
+
+    def run(self, name: str, fn: Callable[[], Any], repeat: int, warmup: int = 1, **extra) -> None:
+        if not self.selected(name):
+            return
+        result = measure(fn, repeat, warmup)
+        result.update(extra)
+        self.results[name] = result
+        print(f"  {name:<44} médiane {result['median'] * 1000:9.1f} ms | min {result['min'] * 1000:9.1f} ms")
+
+
+# ----- Benchmarks -----
+
+def _docx_text_xml(docx_bytes: bytes) -> str:
+    from utils.document_parser import _docx_main_part, _iter_docx_body_text
+
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as archive, archive.open(_docx_main_part(archive)) as body:
+        return "\n\n".join(_iter_docx_body_text(body))
+
+
+def _docx_text_python_docx(docx_bytes: bytes) -> str:
+    """Référence : ancienne extraction python-docx (tableaux de premier niveau, en fin de texte)"""
+    from docx import Document
+
+    doc = Document(io.BytesIO(docx_bytes))
+    parts = [paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()]
+    for table in doc.tables:
+        rows = (" | ".join(cell.text.strip() for cell in row.cells) for row in table.rows)
+        parts.append("\n".join(row for row in rows if row.strip()))
+    return "\n\n".join(parts)
+
+
+def _docx_missing_blocks(docx_bytes: bytes) -> int:
+    """Parité : blocs (paragraphes, tableaux) de la référence python-docx absents de la lecture XML"""
+    blocks = set(_docx_text_xml(docx_bytes).split("\n\n"))
+    return sum(block not in blocks for block in _docx_text_python_docx(docx_bytes).split("\n\n"))
+
+
+def bench_extraction(suite: BenchmarkSuite, size: Dict) -> None:
+    from utils.document_parser import DocumentParser
+
+    print("📄 Extraction")
+    pages = size['pdf_pages']
+    if suite.selected(f"extract_from_pdf[{pages}p"):
+        pdf_bytes = fixtures.make_pdf(pages=pages)
+        pdf_stats = {}
+        DocumentParser.extract_from_pdf(pdf_bytes, stats=pdf_stats)
+        suite.run(f"extract_from_pdf[{pages}p]", lambda: DocumentParser.extract_from_pdf(pdf_bytes),
+                  size['repeat'], input_bytes=len(pdf_bytes), tokens_raw=pdf_stats['tokens_raw'],
+                  tokens_saved=pdf_stats['tokens_saved'])
+        suite.run(f"extract_from_pdf[{pages}p,sequential]",
+                  lambda: DocumentParser.extract_from_pdf(pdf_bytes, parallel=False),
+                  size['repeat'], input_bytes=len(pdf_bytes))
+
+    paragraphs = size['docx_paragraphs']
+    if suite.selected(f"extract_from_word[{paragraphs}par]"):
+        docx_bytes = fixtures.make_docx(paragraphs=paragraphs)
+        suite.run(f"extract_from_word[{paragraphs}par]", lambda: DocumentParser.extract_from_word(docx_bytes),
+                  size['repeat'], input_bytes=len(docx_bytes))
+    if suite.selected(f"docx_text[{paragraphs}par"):
+        # Texte seul : lecture XML en une passe vs modèle objet python-docx (paragraphes puis tableaux)
+        docx_bytes = fixtures.make_docx(paragraphs=paragraphs, images=0)
+        missing = _docx_missing_blocks(docx_bytes)
+        if missing:
+            print(f"  ⚠️ docx_text : {missing} bloc(s) python-docx absents de la lecture XML")
+        suite.run(f"docx_text[{paragraphs}par,xml]", lambda: _docx_text_xml(docx_bytes),
+                  size['repeat'], input_bytes=len(docx_bytes), missing_blocks=missing)
+        suite.run(f"docx_text[{paragraphs}par,python-docx]", lambda: _docx_text_python_docx(docx_bytes),
+                  size['repeat'], input_bytes=len(docx_bytes))
+
+    print("🖼️ Optimisation d'images")
+    for label, fmt, image_size in (("jpeg_4000x3000", 'JPEG', (4000, 3000)),
+                                   ("png_2000x1500", 'PNG', (2000, 1500)),
+                                   ("jpeg_800x600", 'JPEG', (800, 600))):
+        image_bytes = fixtures.make_image(7, image_size, fmt)
+        source_format = fmt.lower()
+        suite.run(f"_optimize_image[{label}]",
+                  lambda: DocumentParser._optimize_image(image_bytes, source_format),
+                  size['repeat'] * 2, input_bytes=len(image_bytes))
+
+
+def bench_export(suite: BenchmarkSuite, size: Dict) -> None:
+    from utils.pdf_export import PDFExporter
+
+    print("📥 Export PDF")
+    for count in size['question_counts']:
+        questions = fixtures.make_questions(count)
+        results, summary = fixtures.make_results(questions)
+        repeat = size['repeat'] if count < 1000 else max(1, size['repeat'] // 2)
+        suite.run(f"create_qcm_pdf[{count}q]", lambda: PDFExporter.create_qcm_pdf(questions), repeat)
+        suite.run(f"create_qcm_pdf[{count}q,answers]",
+                  lambda: PDFExporter.create_qcm_pdf(questions, with_answers=True), repeat)
+        suite.run(f"create_results_pdf[{count}q]",
+                  lambda: PDFExporter.create_results_pdf(results, summary), repeat)
+        if count >= 1000:
+            # Story complète en liste vs story produite par morceaux : temps et pic mémoire
+            for label, bulk in (("list", False), ("bulk", True)):
+                name = f"create_qcm_pdf[{count}q,answers,{label}]"
+                if not suite.selected(name):
+                    continue
+                export = lambda: PDFExporter.create_qcm_pdf(questions, with_answers=True, bulk=bulk)
+                suite.run(name, export, repeat, warmup=0, peak_mb=peak_memory_mb(export))
+                print(f"  {'':<44} pic mémoire {suite.results[name]['peak_mb']:.1f} Mo")
+            # Rendu parallèle par plages de questions + fusion PyMuPDF
+            suite.run(f"create_qcm_pdf[{count}q,answers,sharded]",
+                      lambda: PDFExporter.create_qcm_pdf_sharded(questions, with_answers=True, workers=4),
+                      repeat, workers=min(4, os.cpu_count() or 1))
+
+
+def bench_end_to_end(suite: BenchmarkSuite, size: Dict, latency: float, tokens_per_second: float) -> None:
+    """Extraction + génération (vrai client anthropic, faux serveur) + export, par étape"""
+    if not any(suite.selected(name) for name in ("end_to_end", "generate_qcm")):
+        return
+    from benchmarks.fake_server import FakeAnthropicServer
+
+    print(f"🔁 Pipeline complet (faux serveur, premier token {latency:.2f} s, {tokens_per_second:.0f} tokens/s)")
+    with FakeAnthropicServer(first_token_latency=latency, tokens_per_second=tokens_per_second) as server:
+        # Lus à la création du client / de la banque : à poser avant le premier import
+        os.environ.pop("QCM_FAKE_BACKEND", None)
+        os.environ["ANTHROPIC_BASE_URL"] = server.base_url
+        from utils.claude_api import ClaudeQCMGenerator
+        from utils.document_parser import DocumentParser
+        from utils.pdf_export import PDFExporter
+        from utils.rate_limit import RateLimiter
+
+        generator = ClaudeQCMGenerator("benchmark-key")
+        # Limites de débit hors mesure : seule la latence du serveur compte
+        generator.limiter = RateLimiter(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+        pdf_bytes = fixtures.make_pdf(pages=min(20, size['pdf_pages']), seed=1)
+        stages = {'parse': [], 'generate': [], 'export': []}
+        variant = iter(range(1000))
+
+        def pipeline():
+            started = time.perf_counter()
+            text, images = DocumentParser.parse_document(pdf_bytes, 'pdf', use_cache=False)
+            parsed = time.perf_counter()
+            questions = generator.generate_qcm(text, images, variant=next(variant))
+            generated = time.perf_counter()
+            PDFExporter.create_qcm_pdf(questions, with_answers=True)
+            stages['parse'].append(parsed - started)
+            stages['generate'].append(generated - parsed)
+            stages['export'].append(time.perf_counter() - generated)
+
+        suite.run("end_to_end[20p]", pipeline, size['repeat'])
+        if "end_to_end[20p]" in suite.results:
+            # Sans le tour de chauffe
+            suite.results["end_to_end[20p]"]['stages_median'] = {
+                stage: statistics.median(values[-size['repeat']:]) for stage, values in stages.items()
+            }
+
+        text, images = DocumentParser.parse_document(pdf_bytes, 'pdf', use_cache=False)
+
+        def first_question():
+            stream = generator.generate_qcm_stream(text, images, variant=next(variant))
+            next(stream)
+            stream.close()
+
+        suite.run("generate_qcm_stream[first_question]", first_question, size['repeat'])
+        suite.run("generate_qcm[single]", lambda: generator.generate_qcm(text, images, variant=next(variant)),
+                  size['repeat'])
+
+
+# ----- Résultats -----
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(RESULTS_DIR)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results: Dict[str, Dict], args, path: Optional[str] = None) -> str:
+    commit = _git_commit()
+    payload = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'size': 'quick' if args.quick else 'full',
+            'latency': args.latency,
+            'tokens_per_second': args.tokens_per_second
+        },
+        'results': results
+    }
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}.json"
+        path = os.path.join(RESULTS_DIR, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def compare(results: Dict[str, Dict], baseline_path: str) -> int:
+    """Affiche l'écart des médianes avec un fichier de résultats précédent ; retourne le nombre de régressions"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = 0
+    print(f"\n📊 Comparaison avec {baseline_path}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['median'], result['median']
+        ratio = (after - before) / before if before else 0.0
+        flag = ""
+        if ratio > REGRESSION_THRESHOLD:
+            flag = "  ⚠️ régression"
+            regressions += 1
+        elif ratio < -REGRESSION_THRESHOLD:
+            flag = "  ✅ amélioration"
+        print(f"  {name:<44} {before * 1000:9.1f} → {after * 1000:9.1f} ms ({ratio:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks extraction / export / génération")
+    parser.add_argument("--quick", action="store_true", help="Fixtures réduites (vérification rapide)")
+    parser.add_argument("--only", nargs="*", help="Ne lancer que les benchmarks dont le nom contient ces motifs")
+    parser.add_argument("--latency", type=float, default=0.3, help="Faux serveur : secondes avant le premier token")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="Faux serveur : débit de sortie")
+    parser.add_argument("--output", help="Fichier JSON de résultats (défaut benchmarks/results/<date>-<commit>.json)")
+    parser.add_argument("--compare", help="Fichier JSON de résultats de référence")
+    args = parser.parse_args()
+
+    size = SIZES['quick' if args.quick else 'full']
+    suite = BenchmarkSuite(args.only)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Banque de questions jetable : les benchmarks ne polluent pas celle de l'utilisateur
+        os.environ["QCM_BANK_PATH"] = os.path.join(workdir, "questions.sqlite3")
+        bench_extraction(suite, size)
+        bench_export(suite, size)
+        bench_end_to_end(suite, size, args.latency, args.tokens_per_second)
+
+    path = save_results(suite.results, args, args.output)
+    print(f"\n💾 Résultats : {path}")
+    if args.compare:
+        return 1 if compare(suite.results, args.compare) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Test de charge de l'ordonnancement des appels Claude (backend factice, sans clé API)
+
+Simule des générations de QCM longues lancées en même temps que des demandes de
+feedback interactives, et compare la latence du feedback avec et sans classes
+de priorité.
+
+Les limites de débit sont celles de production (RateLimiter par défaut) : les
+générations consomment le budget de tokens par minute et le feedback doit passer
+devant celles qui attendent leurs tokens.
+
+Usage : python load_test.py [--generations 8] [--feedbacks 30] [--interval 0.4] [--concurrency 4]
+                            [--time-scale 0.2] [--course-tokens 50000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def run_scenario(args, use_priorities: bool) -> dict:
+    """Lance générations + feedbacks en parallèle et mesure les latences"""
+    from utils.cache import get_feedback_cache
+    from utils.claude_api import ClaudeQCMGenerator
+    from utils.rate_limit import RateLimiter
+    from utils.scheduler import BULK, INTERACTIVE
+    from utils.text_chunking import CHARS_PER_TOKEN
+
+    get_feedback_cache().clear()
+    generator = ClaudeQCMGenerator("load-test")
+    reservations = {INTERACTIVE: 2, BULK: 1} if use_priorities else {INTERACTIVE: 0, BULK: 0}
+    generator.limiter = RateLimiter(max_concurrency=args.concurrency, reservations=reservations)
+    if not use_priorities:
+        # Tous les appels dans la même file, servis dans l'ordre d'arrivée
+        generator.PRIORITY_CLASSES = {kind: BULK for kind in generator.PRIORITY_CLASSES}
+
+    sentence = "Cours simulé de cardiologie. "
+    course = sentence * max(1, int(args.course_tokens * CHARS_PER_TOKEN / len(sentence)))
+    feedback_latencies = []
+    generation_latencies = []
+    lock = threading.Lock()
+
+    def generation(_):
+        started = time.perf_counter()
+        generator.generate_qcm(course, [])
+        with lock:
+            generation_latencies.append(time.perf_counter() - started)
+
+    def feedback(index):
+        # Arrivées étalées : un étudiant valide une réponse toutes les `interval` secondes
+        time.sleep(index * args.interval)
+        question = {
+            'question': f"Question {index}",
+            'options': ["A", "B", "C", "D"],
+            'correct_answers': [0]
+        }
+        started = time.perf_counter()
+        generator.explain_answer(question, [1])
+        with lock:
+            feedback_latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.generations + args.feedbacks) as executor:
+        futures = [executor.submit(generation, i) for i in range(args.generations)]
+        futures += [executor.submit(feedback, i) for i in range(args.feedbacks)]
+        for future in futures:
+            future.result()
+
+    return {
+        'total': time.perf_counter() - started,
+        'feedback_p50': percentile(feedback_latencies, 0.50),
+        'feedback_p95': percentile(feedback_latencies, 0.95),
+        'feedback_max': max(feedback_latencies, default=0.0),
+        'generation_p50': percentile(generation_latencies, 0.50),
+        'generation_max': max(generation_latencies, default=0.0),
+        'scheduler': generator.limiter.scheduler.stats()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de l'ordonnancement (backend factice)")
+    parser.add_argument("--generations", type=int, default=8, help="Générations de QCM simultanées")
+    parser.add_argument("--feedbacks", type=int, default=30, help="Demandes de feedback")
+    parser.add_argument("--interval", type=float, default=0.4, help="Secondes entre deux feedbacks")
+    parser.add_argument("--concurrency", type=int, default=4, help="Appels API simultanés max")
+    parser.add_argument("--time-scale", type=float, default=0.2, help="Échelle de temps du backend factice")
+    parser.add_argument("--course-tokens", type=int, default=50000, help="Taille du cours simulé (tokens estimés)")
+    args = parser.parse_args()
+
+    # Le registre de clients lit cette variable à sa création
+    os.environ["QCM_FAKE_BACKEND"] = str(args.time_scale)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    print(f"🧪 {args.generations} génération(s) + {args.feedbacks} feedback(s), "
+          f"{args.concurrency} appel(s) simultané(s), échelle de temps {args.time_scale}\n")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Banque de questions jetable : le test ne pollue pas celle de l'utilisateur
+        # (lue à la création de la banque, donc avant l'import des modules de l'application)
+        os.environ["QCM_BANK_PATH"] = os.path.join(workdir, "questions.sqlite3")
+        for label, use_priorities in (("Sans priorité (FIFO)", False), ("Avec priorités", True)):
+            result = run_scenario(args, use_priorities)
+            print(f"=== {label} ===")
+            print(f"  Feedback   : p50 {result['feedback_p50']:.2f} s | p95 {result['feedback_p95']:.2f} s | "
+                  f"max {result['feedback_max']:.2f} s")
+            print(f"  Génération : p50 {result['generation_p50']:.2f} s | max {result['generation_max']:.2f} s")
+            for name, stats in result['scheduler'].items():
+                print(f"  File {name:<11}: {stats['served']} servies, attente moy. {stats['avg_wait']:.2f} s, "
+                      f"p95 {stats['p95_wait']:.2f} s, max {stats['max_wait']:.2f} s")
+            print(f"  Durée totale : {result['total']:.2f} s\n")
+
+
+if __name__ == "__main__":
+    main()
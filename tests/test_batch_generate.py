@@ -0,0 +1,65 @@
+"""
+Tests de la reprise de batch_generate.py (manifest des documents déjà traités)
+"""
+
+import io
+import argparse
+
+import pytest
+from docx import Document
+
+from batch_generate import Manifest, run_batch
+from utils.claude_api import ClaudeQCMGenerator
+
+
+def test_manifest_reloads_completed_documents(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    Manifest(path, "facile", 10).add("abc", "cours.pdf")
+
+    assert "abc" in Manifest(path, "facile", 10)
+
+
+@pytest.mark.parametrize("difficulty, num_questions", [("difficile", 10), ("facile", 20)])
+def test_manifest_is_scoped_to_generation_settings(tmp_path, difficulty, num_questions):
+    path = str(tmp_path / "manifest.jsonl")
+    Manifest(path, "facile", 10).add("abc", "cours.pdf")
+
+    assert "abc" not in Manifest(path, difficulty, num_questions)
+
+
+def test_manifest_ignores_truncated_lines(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    path.write_text('{"hash": "abc", "difficulty": "facile", "num_questions": 10}\n{"hash": "de', encoding='utf-8')
+
+    assert Manifest(str(path), "facile", 10).completed == {"abc"}
+
+
+def _write_course(path):
+    doc = Document()
+    for index in range(20):
+        doc.add_paragraph(f"Paragraphe {index} : l'insuffisance cardiaque réduit la fraction d'éjection.")
+    output = io.BytesIO()
+    doc.save(output)
+    path.write_bytes(output.getvalue())
+
+
+def test_rerun_with_other_difficulty_is_not_skipped(tmp_path, monkeypatch):
+    monkeypatch.setenv("QCM_FAKE_BACKEND", "0.01")
+    monkeypatch.setenv("QCM_BANK_PATH", str(tmp_path / "questions.sqlite3"))
+    courses = tmp_path / "cours"
+    courses.mkdir()
+    _write_course(courses / "cardiologie.docx")
+
+    def run(difficulty):
+        args = argparse.Namespace(input_dir=str(courses), output=str(tmp_path / "sortie"), difficulty=difficulty,
+                                  api_key="fake-backend", parse_workers=1, generation_workers=1,
+                                  queue_size=2, no_pdf=True)
+        return run_batch(args)
+
+    assert run("facile")['succeeded'] == 1
+    assert run("facile")['skipped'] == 1
+    report = run("difficile")
+    assert (report['skipped'], report['succeeded']) == (0, 1)
+
+    monkeypatch.setattr(ClaudeQCMGenerator, "NUM_QUESTIONS", 5)
+    assert run("difficile")['skipped'] == 0
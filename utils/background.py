@@ -0,0 +1,176 @@
+"""
+Module de génération en tâche de fond
+Permet à l'interface de consommer les questions au fur et à mesure de leur génération
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils.metrics import start_thread
+
+
+class GenerationJob:
+    """
+    Consomme un flux de questions dans un thread de fond
+
+    La liste `questions` grandit au fil du flux : l'interface peut afficher la
+    question 1 pendant que les suivantes sont encore en cours de génération.
+    """
+
+    def __init__(self, question_source: Callable[[], Iterable[Dict]], expected: int):
+        """
+        Args:
+            question_source: Fonction retournant l'itérable de questions (appelée dans le thread)
+            expected: Nombre de questions attendues (pour l'affichage de la progression)
+        """
+        self.question_source = question_source
+        self.expected = expected
+        self.questions: List[Dict] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.started_at: Optional[float] = None
+        self.first_question_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancelled = threading.Event()
+        self._condition = threading.Condition()
+        self._on_question: Optional[Callable[[Dict], None]] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "GenerationJob":
+        """Démarre la génération dans un thread daemon (métriques attribuées à la session appelante)"""
+        self.started_at = time.perf_counter()
+        self._thread = start_thread(self._run, name="qcm-generation")
+        return self
+
+    def _run(self) -> None:
+        stream = None
+        try:
+            stream = iter(self.question_source())
+            for question in stream:
+                if self._cancelled.is_set():
+                    break
+                with self._condition:
+                    if self.first_question_at is None:
+                        self.first_question_at = time.perf_counter()
+                    self.questions.append(question)
+                    if self._on_question is not None:
+                        self._on_question(question)
+                    self._condition.notify_all()
+        except Exception as e:
+            print(f"❌ Erreur génération en tâche de fond: {e}")
+            self.error = e
+        finally:
+            # Fermer le flux (et la connexion de streaming) en cas d'annulation
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+            with self._condition:
+                self.done = True
+                self.finished_at = time.perf_counter()
+                self._condition.notify_all()
+
+    def claim(self, on_question: Callable[[Dict], None]) -> List[Dict]:
+        """
+        Récupère le job (QCM pré-généré) : on_question sera appelé pour chaque question
+        produite ensuite
+
+        Returns:
+            Les questions déjà produites ; l'instantané et l'installation de on_question
+            sont atomiques, aucune question ne passe entre les deux
+        """
+        with self._condition:
+            self._on_question = on_question
+            return list(self.questions)
+
+    def cancel(self) -> None:
+        """Demande l'arrêt : les questions suivantes sont ignorées"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def wait_for(self, count: int, timeout: Optional[float] = None) -> bool:
+        """
+        Attend qu'au moins `count` questions soient disponibles (ou la fin du flux)
+
+        Returns:
+            True si `count` questions sont disponibles
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: len(self.questions) >= count or self.done, timeout)
+            return len(self.questions) >= count
+
+    @property
+    def time_to_first_question(self) -> Optional[float]:
+        """Délai (s) entre le lancement et la première question"""
+        if self.first_question_at is None or self.started_at is None:
+            return None
+        return self.first_question_at - self.started_at
+
+
+class PrefetchRegistry:
+    """
+    Pré-générations en cours, bornées par utilisateur (toutes sessions confondues)
+    pour qu'un étudiant ne monopolise pas la capacité API avec des QCM d'avance
+    """
+
+    MAX_PER_USER = 1
+
+    def __init__(self, max_per_user: Optional[int] = None):
+        self.max_per_user = max_per_user or self.MAX_PER_USER
+        self._jobs: Dict[str, List[GenerationJob]] = {}
+        self._lock = threading.Lock()
+
+    def try_start(self, user_key: str, job: GenerationJob) -> bool:
+        """Démarre job si l'utilisateur a encore un créneau de pré-génération"""
+        with self._lock:
+            running = [j for j in self._jobs.get(user_key, []) if not j.done and not j.cancelled]
+            if len(running) >= self.max_per_user:
+                self._jobs[user_key] = running
+                return False
+            running.append(job.start())
+            self._jobs[user_key] = running
+            return True
+
+    def running(self, user_key: str) -> int:
+        """Pré-générations en cours pour cet utilisateur"""
+        with self._lock:
+            return sum(1 for j in self._jobs.get(user_key, []) if not j.done and not j.cancelled)
+
+
+_prefetch_registry = PrefetchRegistry()
+
+
+def get_prefetch_registry() -> PrefetchRegistry:
+    """Retourne le registre des pré-générations partagé par le process"""
+    return _prefetch_registry
+
+
+_background_tasks = {}
+_background_tasks_lock = threading.Lock()
+
+
+def run_in_background_once(key: str, task: Callable[[], None]) -> bool:
+    """
+    Lance task() dans un thread daemon, sauf si une tâche de même clé tourne déjà
+    (ex : un seul réapprovisionnement de la banque par document et niveau)
+
+    Returns:
+        True si la tâche a été lancée
+    """
+    def run():
+        try:
+            task()
+        except Exception as e:
+            print(f"❌ Erreur tâche de fond ({key[:24]}): {e}")
+        finally:
+            with _background_tasks_lock:
+                _background_tasks.pop(key, None)
+
+    with _background_tasks_lock:
+        if key in _background_tasks:
+            return False
+        _background_tasks[key] = start_thread(run, name="qcm-background")
+        return True
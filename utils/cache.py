@@ -0,0 +1,293 @@
+"""
+Module de cache pour l'application QCM Médical
+Cache LRU en mémoire + cache disque adressé par contenu pour l'extraction
++ cache des feedbacks générés + cache des PDF exportés
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class LRUCache:
+    """
+    Cache LRU thread-safe, borné en nombre d'entrées et (optionnellement) en octets
+    Les entrées peuvent expirer après une durée de vie (ttl)
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None, ttl: Optional[float] = None):
+        """
+        Args:
+            max_entries: Nombre maximum d'entrées conservées
+            max_bytes: Taille totale maximale (None = pas de limite)
+            sizeof: Fonction donnant la taille d'une valeur en octets (requis si max_bytes)
+            ttl: Durée de vie d'une entrée en secondes (None = pas d'expiration)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.ttl = ttl
+        self._data = OrderedDict()  # clé -> (valeur, taille, expiration)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Retourne la valeur associée à la clé (et la marque comme récente)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                # Entrée expirée : supprimée comme si elle n'avait jamais existé
+                del self._data[key]
+                self._total_bytes -= entry[1]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any) -> None:
+        """Ajoute ou remplace une entrée puis évince les plus anciennes si besoin"""
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # Trop gros pour être mis en cache
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._data[key] = (value, size, expires_at)
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        """Évince les entrées les moins récemment utilisées (verrou déjà pris)"""
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            _, (_, size, _) = self._data.popitem(last=False)
+            self._total_bytes -= size
+
+    def clear(self) -> None:
+        """Vide le cache"""
+        with self._lock:
+            self._data.clear()
+            self._total_bytes = 0
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[2] is None or entry[2] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """Compteurs du cache"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._data),
+            'bytes': self._total_bytes
+        }
+
+
+class ExtractionCache:
+    """
+    Cache des résultats d'extraction, adressé par le contenu du fichier
+
+    - Niveau 1 : LRU en mémoire (partagé par toutes les sessions du process)
+    - Niveau 2 : fichiers pickle sur disque, éviction des plus anciens au-delà de max_disk_bytes
+    """
+
+    DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "qcm-medical", "extraction")
+
+    def __init__(self, cache_dir: Optional[str] = None, max_memory_entries: int = 16,
+                 max_disk_bytes: int = 500 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: Dossier du cache disque (None = QCM_CACHE_DIR ou ~/.cache/qcm-medical)
+            max_memory_entries: Nombre de documents gardés en mémoire
+            max_disk_bytes: Taille maximale du cache disque (0 = cache disque désactivé)
+        """
+        self.cache_dir = cache_dir or os.environ.get("QCM_CACHE_DIR") or self.DEFAULT_DIR
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = LRUCache(max_entries=max_memory_entries)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(file_bytes: bytes, file_type: str, settings: Dict[str, Any]) -> str:
+        """
+        Calcule la clé de cache : SHA-256 du fichier + type + paramètres du parser
+
+        Args:
+            file_bytes: Contenu du fichier
+            file_type: 'docx' ou 'pdf'
+            settings: Paramètres influençant le résultat (MAX_IMAGES, etc.)
+        """
+        digest = hashlib.sha256(file_bytes)
+        digest.update(file_type.encode('utf-8'))
+        digest.update(repr(sorted(settings.items())).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Any:
+        """Retourne le résultat en cache ou None"""
+        value = self.memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return value
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Enregistre un résultat dans les deux niveaux de cache"""
+        self.memory.set(key, value)
+        self._disk_set(key, value)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def _disk_get(self, key: str) -> Any:
+        if self.max_disk_bytes <= 0:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)  # Marque l'entrée comme récemment utilisée
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Entrée de cache illisible ({key[:12]}): {e}")
+            return None
+
+    def _disk_set(self, key: str, value: Any) -> None:
+        if self.max_disk_bytes <= 0:
+            return
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Écriture atomique : fichier temporaire puis renommage
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+            tmp_path = None
+            self._evict_disk()
+        except Exception as e:
+            if tmp_path is not None:
+                # Disque plein, objet non picklable... : ne pas laisser le fichier temporaire
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            print(f"⚠️ Écriture du cache disque impossible: {e}")
+
+    def _evict_disk(self) -> None:
+        """Supprime les entrées les moins récemment utilisées au-delà de max_disk_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+
+    def clear(self) -> None:
+        """Vide les deux niveaux de cache"""
+        self.memory.clear()
+        if os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.pkl'):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        continue
+
+    def stats(self) -> Dict[str, int]:
+        """Compteurs hits/misses du cache d'extraction"""
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'memory_entries': len(self.memory)
+        }
+
+
+_extraction_cache = None
+_singleton_lock = threading.Lock()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Retourne le cache d'extraction partagé par le process"""
+    global _extraction_cache
+    with _singleton_lock:
+        if _extraction_cache is None:
+            _extraction_cache = ExtractionCache()
+        return _extraction_cache
+
+
+# Feedbacks gardés 24 h : au-delà, une nouvelle explication peut être générée
+FEEDBACK_CACHE_TTL = 24 * 3600
+FEEDBACK_CACHE_MAX_ENTRIES = 2048
+
+_feedback_cache = None
+
+
+def get_feedback_cache() -> LRUCache:
+    """Retourne le cache des feedbacks partagé par toutes les sessions du process"""
+    global _feedback_cache
+    with _singleton_lock:
+        if _feedback_cache is None:
+            _feedback_cache = LRUCache(max_entries=FEEDBACK_CACHE_MAX_ENTRIES, ttl=FEEDBACK_CACHE_TTL)
+        return _feedback_cache
+
+
+# PDF exportés : un même jeu de questions n'est rendu qu'une fois, toutes sessions confondues
+EXPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+EXPORT_CACHE_MAX_ENTRIES = 256
+
+_export_cache = None
+
+
+def get_export_cache() -> LRUCache:
+    """Retourne le cache des PDF exportés (bytes), borné en taille totale"""
+    global _export_cache
+    with _singleton_lock:
+        if _export_cache is None:
+            _export_cache = LRUCache(max_entries=EXPORT_CACHE_MAX_ENTRIES, max_bytes=EXPORT_CACHE_MAX_BYTES,
+                                     sizeof=len)
+        return _export_cache
@@ -5,45 +5,30 @@ VERSION OPTIMISÉE avec sélecteur de difficulté
 """
 
 import json
-from typing import List, Dict, Any
-from anthropic import Anthropic
+import math
+import time
+import asyncio
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from anthropic import AsyncAnthropic
 
+from utils import metrics
+from utils.cache import get_feedback_cache
+from utils.client_pool import get_client_registry
+from utils.rate_limit import get_rate_limiter
+from utils.scheduler import INTERACTIVE, BULK
+from utils.document_parser import DocumentParser, ExtractedImage
+from utils.json_stream import IncrementalQuestionParser
+from utils.question_bank import get_question_bank
+from utils.text_chunking import estimate_tokens, split_into_chunks
 
-class ClaudeQCMGenerator:
-    """Classe pour générer des QCM médicaux via Claude"""
-    
-    def __init__(self, api_key: str):
-        """
-        Initialise le client Claude
-        
-        Args:
-            api_key: Clé API Anthropic
-        """
-        self.client = Anthropic(api_key=api_key)
-        self.model = "claude-haiku-4-5"  # Haiku 4.5
-    
-    def generate_qcm(self, text: str, images: List[Dict], difficulty: str = "intermediaire") -> List[Dict]:
-        """
-        Génère 10 questions QCM type EDN depuis un document
-        
-        Args:
-            text: Texte extrait du document
-            images: Liste d'images {data: base64, format: str}
-            difficulty: Niveau de difficulté ("facile", "intermediaire", "difficile")
-            
-        Returns:
-            Liste de 10 questions au format:
-            {
-                "question": str,
-                "options": [str],
-                "correct_answers": [int],  # Indices des bonnes réponses (0-based)
-                "explanation": str
-            }
-        """
-        
-        # Construction du prompt système adapté au niveau
-        difficulty_prompts = {
-            "facile": """Tu es un expert en pédagogie médicale spécialisé dans la création de QCM pour les EDN (Examens Dématérialisés Nationaux) de médecine en France.
+
+# Prompts système adaptés au niveau (le nombre de questions est précisé dans le message utilisateur)
+DIFFICULTY_PROMPTS = {
+    "facile": """Tu es un expert en pédagogie médicale spécialisé dans la création de QCM pour les EDN (Examens Dématérialisés Nationaux) de médecine en France.
 
 Ton rôle est de créer des QCM de niveau DÉBUTANT/RÉVISION qui :
 - Testent les connaissances FONDAMENTALES et définitions de base
@@ -53,14 +38,14 @@ Ton rôle est de créer des QCM de niveau DÉBUTANT/RÉVISION qui :
 - Permettent de valider l'acquisition des bases
 
 RÈGLES STRICTES :
-- Exactement 10 questions
+- Exactement le nombre de questions demandé
 - 4 à 5 propositions par question
 - Questions claires et directes (niveau début DFASM)
 - Plusieurs bonnes réponses possibles par question
 - Formulation sans ambiguïté
 - Explications pédagogiques simples""",
-            
-            "intermediaire": """Tu es un expert en pédagogie médicale spécialisé dans la création de QCM pour les EDN (Examens Dématérialisés Nationaux) de médecine en France.
+    
+    "intermediaire": """Tu es un expert en pédagogie médicale spécialisé dans la création de QCM pour les EDN (Examens Dématérialisés Nationaux) de médecine en France.
 
 Ton rôle est de créer des QCM de haute qualité niveau DFASM (5e année de médecine) qui :
 - Testent la compréhension profonde et le raisonnement clinique
@@ -70,13 +55,13 @@ Ton rôle est de créer des QCM de haute qualité niveau DFASM (5e année de mé
 - Couvrent différents aspects du cours (physiopathologie, diagnostic, traitement, etc.)
 
 RÈGLES STRICTES :
-- Exactement 10 questions
+- Exactement le nombre de questions demandé
 - 4 à 5 propositions par question
 - Plusieurs bonnes réponses possibles par question (typique des EDN)
 - Formulation claire et précise
 - Explications pédagogiques détaillées""",
-            
-            "difficile": """Tu es un expert en pédagogie médicale spécialisé dans la création de QCM pour les EDN (Examens Dématérialisés Nationaux) de médecine en France.
+    
+    "difficile": """Tu es un expert en pédagogie médicale spécialisé dans la création de QCM pour les EDN (Examens Dématérialisés Nationaux) de médecine en France.
 
 Ton rôle est de créer des QCM de niveau AVANCÉ/EXPERT qui :
 - Testent le raisonnement clinique approfondi et l'expertise
@@ -86,30 +71,346 @@ Ton rôle est de créer des QCM de niveau AVANCÉ/EXPERT qui :
 - Simulent des situations réelles difficiles en pratique clinique
 
 RÈGLES STRICTES :
-- Exactement 10 questions
+- Exactement le nombre de questions demandé
 - 4 à 5 propositions par question
 - Plusieurs bonnes réponses possibles par question
 - Questions exigeantes avec nuances importantes
 - Cas cliniques élaborés et situations atypiques
 - Explications détaillées des raisonnements complexes"""
-        }
+}
+
+
+class UsageTracker:
+    """
+    Compteurs de tokens (dont prompt caching) et de latence des appels API,
+    partagés par toutes les sessions du process
+    """
+    
+    USAGE_FIELDS = ('input_tokens', 'output_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens')
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {}  # type d'appel -> compteurs
+    
+    def record(self, kind: str, usage: Any, latency: float) -> None:
+        """
+        Enregistre l'usage d'une réponse
         
-        system_prompt = difficulty_prompts.get(difficulty, difficulty_prompts["intermediaire"])
+        Args:
+            kind: Type d'appel ("generation", "feedback", "summary")
+            usage: response.usage (les champs absents comptent pour 0)
+            latency: Durée de l'appel en secondes
+        """
+        counts = {field: getattr(usage, field, None) or 0 for field in self.USAGE_FIELDS}
+        cached = counts['cache_read_input_tokens'] > 0
+        with self._lock:
+            totals = self.totals.setdefault(kind, {
+                'calls': 0, 'cached_calls': 0, 'latency': 0.0, 'cached_latency': 0.0,
+                **{field: 0 for field in self.USAGE_FIELDS}
+            })
+            totals['calls'] += 1
+            totals['latency'] += latency
+            if cached:
+                totals['cached_calls'] += 1
+                totals['cached_latency'] += latency
+            for field, value in counts.items():
+                totals[field] += value
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Totaux par type d'appel + latences moyennes avec/sans lecture du cache"""
+        with self._lock:
+            result = {}
+            for kind, totals in self.totals.items():
+                uncached_calls = totals['calls'] - totals['cached_calls']
+                result[kind] = dict(totals)
+                result[kind]['avg_cached_latency'] = (
+                    totals['cached_latency'] / totals['cached_calls'] if totals['cached_calls'] else None
+                )
+                result[kind]['avg_uncached_latency'] = (
+                    (totals['latency'] - totals['cached_latency']) / uncached_calls if uncached_calls else None
+                )
+            return result
+
+
+_usage_tracker = UsageTracker()
 
-        # Construction du message utilisateur
+
+def get_usage_tracker() -> UsageTracker:
+    """Retourne le suivi d'usage API partagé par le process"""
+    return _usage_tracker
+
+
+class ClaudeQCMGenerator:
+    """Classe pour générer des QCM médicaux via Claude"""
+    
+    NUM_QUESTIONS = 10  # Questions par QCM
+    SINGLE_SHOT_MAX_TOKENS = 60000  # Au-delà (estimation locale), génération map-reduce
+    CHUNK_MAX_TOKENS = 20000  # Budget de tokens du cours par morceau en map-reduce
+    MAP_CONCURRENCY = 4  # Morceaux générés en parallèle
+    IMAGE_TOKENS = 1600  # Tokens comptés par image (1024x1024 max, voir DocumentParser)
+    # Classe de priorité par type d'appel : l'étudiant attend le feedback, pas la génération complète
+    PRIORITY_CLASSES = {"generation": BULK, "feedback": INTERACTIVE, "summary": INTERACTIVE}
+    
+    def __init__(self, api_key: str, option_rationales: bool = True):
+        """
+        Initialise le client Claude
+        
+        Args:
+            api_key: Clé API Anthropic
+            option_rationales: Demander une justification par proposition à la génération
+                (feedback composé localement, sans appel API supplémentaire)
+        """
+        # Client partagé par clé API : pas de nouveau pool de connexions à chaque rerun
+        self.api_key = api_key
+        self.client = get_client_registry().get_client(api_key)
+        # Limiteur de débit partagé : tous les appels passent par _create / _acreate
+        self.limiter = get_rate_limiter()
+        self.model = "claude-haiku-4-5"  # Haiku 4.5
+        self.option_rationales = option_rationales
+        # Toute question générée est conservée pour être resservie sans appel API
+        self.question_bank = get_question_bank()
+    
+    def generate_qcm(self, text: str, images: List[ExtractedImage], difficulty: str = "intermediaire",
+                     mode: str = "auto", variant: int = 0) -> List[Dict]:
+        """
+        Génère 10 questions QCM type EDN depuis un document
+        
+        Les cours longs (plus de SINGLE_SHOT_MAX_TOKENS tokens estimés) passent en
+        mode map-reduce : questions candidates générées en parallèle par morceau,
+        puis sélection de 10 questions couvrant l'ensemble du cours.
+        
+        Args:
+            text: Texte extrait du document
+            images: Liste d'ExtractedImage (bytes bruts, encodés en base64 ici seulement)
+            difficulty: Niveau de difficulté ("facile", "intermediaire", "difficile")
+            mode: "auto", "single" (un seul appel) ou "map_reduce"
+            variant: Numéro de régénération sur le même document (0 = première génération)
+            
+        Returns:
+            Liste de 10 questions au format:
+            {
+                "question": str,
+                "options": [str],
+                "correct_answers": [int],  # Indices des bonnes réponses (0-based)
+                "explanation": str,
+                "option_rationales": [str]  # Si option_rationales (une par proposition)
+            }
+        """
+        if mode == "auto":
+            mode = "map_reduce" if estimate_tokens(text) > self.SINGLE_SHOT_MAX_TOKENS else "single"
+        
+        if mode == "map_reduce":
+            return self._generate_map_reduce(text, images, difficulty, variant)
+        
+        questions = self._generate_questions(text, images, difficulty, self.NUM_QUESTIONS, variant=variant)
+        self._store_questions(text, difficulty, questions)
+        
+        # Validation
+        if questions and len(questions) != self.NUM_QUESTIONS:
+            print(f"⚠️ Attention: {len(questions)} questions générées au lieu de {self.NUM_QUESTIONS}")
+        
+        return questions
+    
+    @property
+    def async_client(self) -> AsyncAnthropic:
+        """Client asynchrone partagé (clé API + boucle d'événements courante)"""
+        return get_client_registry().get_async_client(self.api_key)
+    
+    async def agenerate_qcm(self, text: str, images: List[ExtractedImage], difficulty: str = "intermediaire",
+                            mode: str = "auto", variant: int = 0) -> List[Dict]:
+        """
+        Variante asynchrone de generate_qcm (AsyncAnthropic) : aucun thread n'est
+        bloqué pendant les appels réseau, les morceaux map-reduce sont lancés en
+        parallèle dans la boucle (MAP_CONCURRENCY au plus)
+        """
+        if mode == "auto":
+            mode = "map_reduce" if estimate_tokens(text) > self.SINGLE_SHOT_MAX_TOKENS else "single"
+        
+        if mode == "map_reduce":
+            return await self._agenerate_map_reduce(text, images, difficulty, variant)
+        
+        questions = await self._agenerate_questions(text, images, difficulty, self.NUM_QUESTIONS, variant=variant)
+        self._store_questions(text, difficulty, questions)
+        
+        # Validation
+        if questions and len(questions) != self.NUM_QUESTIONS:
+            print(f"⚠️ Attention: {len(questions)} questions générées au lieu de {self.NUM_QUESTIONS}")
+        
+        return questions
+    
+    def generate_qcm_stream(self, text: str, images: List[ExtractedImage],
+                            difficulty: str = "intermediaire", variant: int = 0) -> Iterator[Dict]:
+        """
+        Variante streaming de generate_qcm : chaque question est produite dès que
+        son objet JSON est complet, sans attendre la fin de la réponse
+        
+        Les cours longs (mode map-reduce) ne sont pas streamés : les questions sont
+        produites une fois la sélection finale faite.
+        
+        Args:
+            text: Texte extrait du document
+            images: Liste d'ExtractedImage
+            difficulty: Niveau de difficulté ("facile", "intermediaire", "difficile")
+            variant: Numéro de régénération sur le même document
+            
+        Yields:
+            Questions au même format que generate_qcm
+        """
+        if estimate_tokens(text) > self.SINGLE_SHOT_MAX_TOKENS:
+            yield from self._generate_map_reduce(text, images, difficulty, variant)
+            return
+        
+        request = self._build_generation_request(text, images, difficulty, self.NUM_QUESTIONS, variant=variant)
+        estimated_tokens = self._estimate_request_tokens(request)
+        parser = IncrementalQuestionParser()
+        parse_time = 0.0  # Temps passé dans le parser incrémental
+        attempt = 0
+        
+        while True:
+            try:
+                with self.limiter.slot(estimated_tokens, priority_class=self.PRIORITY_CLASSES["generation"]):
+                    self._record_request("generation", request)
+                    started = time.perf_counter()
+                    with self.client.messages.stream(**request) as stream:
+                        for text_delta in stream.text_stream:
+                            parse_started = time.perf_counter()
+                            parsed = parser.feed(text_delta)
+                            parse_time += time.perf_counter() - parse_started
+                            for question in parsed:
+                                self._store_questions(text, difficulty, [question])
+                                yield question
+                        self._record_usage("generation", stream.get_final_message().usage,
+                                           time.perf_counter() - started)
+            except json.JSONDecodeError as e:
+                metrics.increment("qcm_json_parse_errors_total", mode="stream")
+                print(f"❌ Erreur parsing JSON (streaming): {e}")
+            except Exception as e:
+                metrics.increment("qcm_api_errors_total", kind="generation", error=type(e).__name__)
+                # Nouvel essai seulement si aucune question n'a encore été transmise
+                if parser.count == 0 and attempt < self.limiter.max_retries and self.limiter.is_retryable(e):
+                    time.sleep(self.limiter.backoff(e, attempt))
+                    attempt += 1
+                    parser = IncrementalQuestionParser()
+                    continue
+                print(f"❌ Erreur API Claude (streaming): {e}")
+            break
+        metrics.observe("qcm_json_parse_seconds", parse_time, mode="stream")
+        
+        # Validation
+        if parser.count != self.NUM_QUESTIONS:
+            print(f"⚠️ Attention: {parser.count} questions générées au lieu de {self.NUM_QUESTIONS}")
+    
+    def _create(self, kind: str, request: Dict) -> Any:
+        """messages.create via le limiteur de débit (file, priorité, nouvelles tentatives)"""
+        def call():
+            self._record_request(kind, request)
+            started = time.perf_counter()
+            try:
+                response = self.client.messages.create(**request)
+            except Exception as e:
+                metrics.increment("qcm_api_errors_total", kind=kind, error=type(e).__name__)
+                raise
+            self._record_usage(kind, response.usage, time.perf_counter() - started)
+            return response
+        return self.limiter.call(call, self._estimate_request_tokens(request),
+                                 priority_class=self.PRIORITY_CLASSES[kind])
+    
+    async def _acreate(self, kind: str, request: Dict) -> Any:
+        """Variante asynchrone de _create"""
+        async def call():
+            self._record_request(kind, request)
+            started = time.perf_counter()
+            try:
+                response = await self.async_client.messages.create(**request)
+            except Exception as e:
+                metrics.increment("qcm_api_errors_total", kind=kind, error=type(e).__name__)
+                raise
+            self._record_usage(kind, response.usage, time.perf_counter() - started)
+            return response
+        return await self.limiter.acall(call, self._estimate_request_tokens(request),
+                                        priority_class=self.PRIORITY_CLASSES[kind])
+    
+    @staticmethod
+    def _record_request(kind: str, request: Dict) -> None:
+        """Compte les images envoyées (et leur taille en base64) à chaque tentative"""
+        for message in request['messages']:
+            content = message['content']
+            if not isinstance(content, list):
+                continue
+            for block in content:
+                if block.get("type") == "image":
+                    metrics.increment("qcm_images_sent_total", kind=kind)
+                    metrics.increment("qcm_image_bytes_sent_total", len(block["source"]["data"]), kind=kind)
+    
+    @staticmethod
+    def _record_usage(kind: str, usage: Any, latency: float) -> None:
+        """Enregistre un appel réussi : suivi d'usage, durée et tokens par type"""
+        _usage_tracker.record(kind, usage, latency)
+        metrics.observe("qcm_api_call_seconds", latency, kind=kind)
+        metrics.increment("qcm_api_calls_total", kind=kind)
+        for field in UsageTracker.USAGE_FIELDS:
+            value = getattr(usage, field, None) or 0
+            if value:
+                token_type = field.replace('_input_tokens', '').replace('_tokens', '')
+                metrics.increment("qcm_tokens_total", value, kind=kind, type=token_type)
+    
+    @staticmethod
+    def _estimate_request_tokens(request: Dict) -> int:
+        """Tokens d'entrée estimés d'une requête (pour le seau tokens/minute)"""
+        system = request.get('system', "")
+        blocks = list(system) if isinstance(system, list) else [{"type": "text", "text": system}]
+        for message in request['messages']:
+            content = message['content']
+            blocks.extend(content if isinstance(content, list) else [{"type": "text", "text": content}])
+        
+        tokens = 0
+        for block in blocks:
+            if block.get("type") == "image":
+                tokens += ClaudeQCMGenerator.IMAGE_TOKENS
+            else:
+                tokens += estimate_tokens(block.get("text", ""))
+        return tokens
+    
+    def _build_generation_request(self, text: str, images: List[ExtractedImage], difficulty: str,
+                                  num_questions: int, part_label: str = "", variant: int = 0) -> Dict:
+        """
+        Construit les paramètres de messages.create pour une génération de questions
+        
+        Args:
+            text: Texte (cours complet ou morceau)
+            images: Images de contexte
+            difficulty: Niveau de difficulté
+            num_questions: Nombre de questions demandées
+            part_label: Précision ajoutée au prompt en mode map-reduce ("partie 2/5")
+            variant: Numéro de régénération (les variantes > 0 demandent des questions nouvelles)
+        
+        Organisation pour le prompt caching : préfixe stable (prompt système, cours,
+        consignes, images) marqué cache_control, partie variable (nombre de
+        questions, variante) en dernier. Une régénération sur le même document ne
+        repaie que la partie variable.
+        """
+        system_prompt = DIFFICULTY_PROMPTS.get(difficulty, DIFFICULTY_PROMPTS["intermediaire"])
+        
+        # Justification par proposition (optionnelle) : permet un feedback local immédiat
+        rationale_rule = ""
+        rationale_field = ""
+        if self.option_rationales:
+            rationale_rule = "\n5. Pour chaque proposition, justifie en une phrase pourquoi elle est vraie ou fausse"
+            rationale_field = """,
+            "option_rationales": ["Pourquoi A est vraie/fausse", "Pourquoi B ...", "...", "...", "..."]"""
+        
+        # Construction du message utilisateur : préfixe stable d'abord
         user_content = [
             {
                 "type": "text",
-                "text": f"""À partir du cours médical suivant, génère 10 questions QCM type EDN.
-
-COURS :
+                "text": f"""COURS MÉDICAL{part_label} :
 {text}
 
 CONSIGNES :
 1. Crée des questions qui couvrent l'ensemble du cours
 2. Varie les types de questions (connaissances, cas cliniques, raisonnement)
 3. Assure-toi que plusieurs réponses sont correctes pour chaque question
-4. Fournis des explications détaillées et pédagogiques
+4. Fournis des explications détaillées et pédagogiques{rationale_rule}
 
 FORMAT DE SORTIE (JSON strict) :
 {{
@@ -118,7 +419,7 @@ FORMAT DE SORTIE (JSON strict) :
             "question": "Énoncé complet de la question",
             "options": ["Option A", "Option B", "Option C", "Option D", "Option E"],
             "correct_answers": [0, 2],
-            "explanation": "Explication détaillée des bonnes et mauvaises réponses"
+            "explanation": "Explication détaillée des bonnes et mauvaises réponses"{rationale_field}
         }}
     ]
 }}
@@ -129,33 +430,103 @@ IMPORTANT : Réponds UNIQUEMENT avec le JSON, sans texte avant ou après."""
         
         # Ajout des images si présentes (contexte visuel)
         if images and len(images) > 0:
-            # Limiter à 5 images max pour ne pas surcharger
-            for img in images[:5]:
+            # Limiter le nombre d'images (même budget que l'extraction, voir DocumentParser)
+            for img in images[:DocumentParser.MAX_IMAGES]:
                 user_content.append({
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": f"image/{img['format']}",
-                        "data": img['data']
+                        "media_type": img.media_type,
+                        "data": img.to_base64()
                     }
                 })
         
+        # Fin du préfixe stable (cours + images) : point de cache
+        user_content[-1]["cache_control"] = {"type": "ephemeral"}
+        
+        # Partie variable, en dernier
+        request_text = f"À partir de ce cours, génère {num_questions} questions QCM type EDN."
+        if variant:
+            request_text += (f"\nVariante n°{variant} : propose des questions différentes des QCM précédents "
+                             "sur ce cours (autres notions, autres angles cliniques).")
+        user_content.append({"type": "text", "text": request_text})
+        
+        return {
+            "model": self.model,
+            "max_tokens": 10000,
+            "system": [{
+                "type": "text",
+                "text": system_prompt,
+                "cache_control": {"type": "ephemeral"}
+            }],
+            "messages": [{
+                "role": "user",
+                "content": user_content
+            }]
+        }
+    
+    def _generate_questions(self, text: str, images: List[ExtractedImage], difficulty: str,
+                            num_questions: int, part_label: str = "", variant: int = 0) -> List[Dict]:
+        """
+        Un appel de génération : num_questions questions sur le texte fourni
+        (voir _build_generation_request pour les arguments)
+        
+        Returns:
+            Liste de questions ([] en cas d'erreur)
+        """
+        request = self._build_generation_request(text, images, difficulty, num_questions, part_label, variant)
+        
+        response_text = ""
         try:
             # Appel API
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=10000,
-                system=system_prompt,
-                messages=[{
-                    "role": "user",
-                    "content": user_content
-                }]
-            )
+            response = self._create("generation", request)
             
             # Extraction et parsing du JSON
             response_text = response.content[0].text
+            return self._parse_questions(response_text)
+            
+        except json.JSONDecodeError as e:
+            print(f"❌ Erreur parsing JSON: {e}")
+            print(f"Réponse brute: {response_text[:500]}")
+            return []
+        except Exception as e:
+            print(f"❌ Erreur API Claude: {e}")
+            return []
+    
+    async def _agenerate_questions(self, text: str, images: List[ExtractedImage], difficulty: str,
+                                   num_questions: int, part_label: str = "", variant: int = 0) -> List[Dict]:
+        """Variante asynchrone de _generate_questions"""
+        request = self._build_generation_request(text, images, difficulty, num_questions, part_label, variant)
+        
+        response_text = ""
+        try:
+            response = await self._acreate("generation", request)
+            response_text = response.content[0].text
+            return self._parse_questions(response_text)
             
-            # Nettoyage du texte (au cas où Claude ajoute du texte autour)
+        except json.JSONDecodeError as e:
+            print(f"❌ Erreur parsing JSON: {e}")
+            print(f"Réponse brute: {response_text[:500]}")
+            return []
+        except Exception as e:
+            print(f"❌ Erreur API Claude: {e}")
+            return []
+    
+    def _store_questions(self, text: str, difficulty: str, questions: List[Dict]) -> None:
+        """Ajoute des questions à la banque (une erreur d'écriture n'interrompt pas la génération)"""
+        if not questions or self.question_bank is None:
+            return
+        try:
+            self.question_bank.add_questions(
+                self.question_bank.document_key(text), difficulty, self.model, questions
+            )
+        except Exception as e:
+            print(f"⚠️ Enregistrement dans la banque de questions impossible: {e}")
+    
+    @staticmethod
+    def _parse_questions(response_text: str) -> List[Dict]:
+        """Nettoie la réponse (au cas où Claude ajoute du texte autour) et extrait les questions"""
+        with metrics.timer("qcm_json_parse_seconds", mode="full"):
             response_text = response_text.strip()
             if response_text.startswith("```json"):
                 response_text = response_text[7:]
@@ -165,22 +536,124 @@ IMPORTANT : Réponds UNIQUEMENT avec le JSON, sans texte avant ou après."""
                 response_text = response_text[:-3]
             response_text = response_text.strip()
             
-            parsed_response = json.loads(response_text)
-            questions = parsed_response.get("questions", [])
-            
-            # Validation
-            if len(questions) != 10:
-                print(f"⚠️ Attention: {len(questions)} questions générées au lieu de 10")
-            
-            return questions
-            
-        except json.JSONDecodeError as e:
-            print(f"❌ Erreur parsing JSON: {e}")
-            print(f"Réponse brute: {response_text[:500]}")
-            return []
-        except Exception as e:
-            print(f"❌ Erreur API Claude: {e}")
-            return []
+            try:
+                parsed_response = json.loads(response_text)
+            except json.JSONDecodeError:
+                metrics.increment("qcm_json_parse_errors_total", mode="full")
+                raise
+            return parsed_response.get("questions", [])
+    
+    def _generate_map_reduce(self, text: str, images: List[ExtractedImage], difficulty: str,
+                             variant: int = 0) -> List[Dict]:
+        """
+        Génération map-reduce pour les cours longs
+        - map : chaque morceau (borné à CHUNK_MAX_TOKENS) produit quelques questions
+          candidates, les morceaux étant traités en parallèle
+        - reduce : sélection locale en tourniquet sur les morceaux, pour que les
+          10 questions finales couvrent tout le cours
+        """
+        tasks = self._plan_map_tasks(text, images)
+        if tasks is None:
+            return self._generate_questions(text, images, difficulty, self.NUM_QUESTIONS, variant=variant)
+        
+        def run_chunk(task: Tuple) -> List[Dict]:
+            return self._generate_questions(task[0], task[1], difficulty, task[2], task[3], variant)
+        
+        with ThreadPoolExecutor(max_workers=min(self.MAP_CONCURRENCY, len(tasks))) as executor:
+            # Une copie du contexte par tâche : métriques attribuées à la session appelante
+            futures = [executor.submit(contextvars.copy_context().run, run_chunk, task) for task in tasks]
+            candidates = [future.result() for future in futures]
+        # Toutes les candidates vont en banque, pas seulement les questions retenues
+        self._store_questions(text, difficulty, [q for chunk_questions in candidates for q in chunk_questions])
+        
+        questions = self._select_covering(candidates, self.NUM_QUESTIONS)
+        if len(questions) != self.NUM_QUESTIONS:
+            print(f"⚠️ Attention: {len(questions)} questions générées au lieu de {self.NUM_QUESTIONS}")
+        return questions
+    
+    async def _agenerate_map_reduce(self, text: str, images: List[ExtractedImage], difficulty: str,
+                                    variant: int = 0) -> List[Dict]:
+        """Variante asynchrone de _generate_map_reduce (sémaphore au lieu d'un pool de threads)"""
+        tasks = self._plan_map_tasks(text, images)
+        if tasks is None:
+            return await self._agenerate_questions(text, images, difficulty, self.NUM_QUESTIONS, variant=variant)
+        
+        semaphore = asyncio.Semaphore(self.MAP_CONCURRENCY)
+        
+        async def run_chunk(task: Tuple) -> List[Dict]:
+            async with semaphore:
+                return await self._agenerate_questions(task[0], task[1], difficulty, task[2], task[3], variant)
+        
+        candidates = await asyncio.gather(*(run_chunk(task) for task in tasks))
+        self._store_questions(text, difficulty, [q for chunk_questions in candidates for q in chunk_questions])
+        
+        questions = self._select_covering(list(candidates), self.NUM_QUESTIONS)
+        if len(questions) != self.NUM_QUESTIONS:
+            print(f"⚠️ Attention: {len(questions)} questions générées au lieu de {self.NUM_QUESTIONS}")
+        return questions
+    
+    def _plan_map_tasks(self, text: str, images: List[ExtractedImage]) -> Optional[List[Tuple]]:
+        """
+        Découpe le cours pour le map-reduce
+        
+        Returns:
+            Liste de (texte, images, nombre de questions, libellé de partie) par morceau,
+            ou None si le cours tient en un seul morceau
+        """
+        # Au plus ~NUM_QUESTIONS morceaux : chacun doit pouvoir fournir au moins une question
+        chunk_budget = max(self.CHUNK_MAX_TOKENS, math.ceil(estimate_tokens(text) / self.NUM_QUESTIONS))
+        chunks = split_into_chunks(text, chunk_budget)
+        if len(chunks) <= 1:
+            return None
+        
+        # Une marge de questions par morceau pour compenser les échecs éventuels
+        per_chunk = max(2, math.ceil(self.NUM_QUESTIONS / len(chunks)) + 1)
+        
+        return [
+            (
+                chunk['text'],
+                self._images_for_chunk(images, chunk, first=(index == 0)),
+                per_chunk,
+                f" (partie {index + 1}/{len(chunks)})"
+            )
+            for index, chunk in enumerate(chunks)
+        ]
+    
+    @staticmethod
+    def _images_for_chunk(images: List[ExtractedImage], chunk: Dict, first: bool) -> List[ExtractedImage]:
+        """Images dont la page source appartient au morceau (images Word : premier morceau)"""
+        selected = []
+        for img in images or []:
+            if img.page is None:
+                if first:
+                    selected.append(img)
+            elif chunk['first_page'] is not None and chunk['first_page'] <= img.page <= chunk['last_page']:
+                selected.append(img)
+        return selected
+    
+    @staticmethod
+    def _select_covering(candidates: List[List[Dict]], count: int) -> List[Dict]:
+        """
+        Sélectionne count questions en prenant tour à tour une question par morceau,
+        puis les restitue dans l'ordre du cours
+        """
+        picked = []  # (index_morceau, rang, question)
+        rank = 0
+        while len(picked) < count:
+            available = [i for i, chunk_questions in enumerate(candidates) if rank < len(chunk_questions)]
+            if not available:
+                break
+            remaining = count - len(picked)
+            if remaining < len(available):
+                # Plus de morceaux que de places : morceaux répartis régulièrement sur le cours
+                step = (len(available) - 1) / max(1, remaining - 1)
+                available = [available[round(k * step)] for k in range(remaining)]
+            for chunk_index in available:
+                picked.append((chunk_index, rank, candidates[chunk_index][rank]))
+            rank += 1
+        
+        picked.sort(key=lambda item: (item[0], item[1]))
+        return [question for _, _, question in picked]
     
     def explain_answer(self, question: Dict, user_answers: List[int]) -> str:
         """
@@ -195,8 +668,47 @@ IMPORTANT : Réponds UNIQUEMENT avec le JSON, sans texte avant ou après."""
             Explication personnalisée en markdown
         """
         
+        # Feedback déjà généré pour cette question et ces réponses (toutes sessions confondues)
+        cache = get_feedback_cache()
+        cache_key = self._feedback_key(question, user_answers)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = self._create("feedback", self._build_explain_request(question, user_answers))
+            
+            feedback = response.content[0].text
+            cache.set(cache_key, feedback)
+            return feedback
+            
+        except Exception as e:
+            # Pas de mise en cache : un nouvel essai sera fait au prochain affichage
+            print(f"❌ Erreur génération feedback: {e}")
+            return question.get('explanation', 'Explication non disponible.')
+    
+    async def aexplain_answer(self, question: Dict, user_answers: List[int]) -> str:
+        """Variante asynchrone de explain_answer (même cache de feedback)"""
+        cache = get_feedback_cache()
+        cache_key = self._feedback_key(question, user_answers)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await self._acreate("feedback", self._build_explain_request(question, user_answers))
+            
+            feedback = response.content[0].text
+            cache.set(cache_key, feedback)
+            return feedback
+            
+        except Exception as e:
+            print(f"❌ Erreur génération feedback: {e}")
+            return question.get('explanation', 'Explication non disponible.')
+    
+    def _build_explain_request(self, question: Dict, user_answers: List[int]) -> Dict:
+        """Construit les paramètres de messages.create pour le feedback d'une réponse"""
         correct_answers = set(question['correct_answers'])
-        user_answers_set = set(user_answers)
         
         # Prompt optimisé et plus concis pour réponse rapide
         prompt = f"""Question : {question['question']}
@@ -211,21 +723,81 @@ Feedback concis (max 150 mots) :
 
 Sois direct et pédagogue."""
         
-        try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=600,  # Réduit de 1200 -> 600 pour vitesse ~2x
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }]
-            )
-            
-            return response.content[0].text
+        return {
+            "model": self.model,
+            "max_tokens": 600,  # Réduit de 1200 -> 600 pour vitesse ~2x
+            "messages": [{
+                "role": "user",
+                "content": prompt
+            }]
+        }
+    
+    @staticmethod
+    def compose_feedback(question: Dict, user_answers: List[int]) -> str:
+        """
+        Compose localement le feedback personnalisé à partir des justifications
+        par proposition (option_rationales), sans appel API
+        
+        Args:
+            question: Dict contenant la question complète
+            user_answers: Liste des indices sélectionnés par l'utilisateur
             
-        except Exception as e:
-            print(f"❌ Erreur génération feedback: {e}")
-            return question.get('explanation', 'Explication non disponible.')
+        Returns:
+            Feedback en markdown, ou None si la question n'a pas de justifications exploitables
+        """
+        options = question['options']
+        rationales = question.get('option_rationales')
+        if not isinstance(rationales, list) or len(rationales) != len(options):
+            return None
+        
+        correct_answers = set(question['correct_answers'])
+        user_answers_set = set(user_answers)
+        missed = correct_answers - user_answers_set
+        wrong = user_answers_set - correct_answers
+        
+        if not missed and not wrong:
+            status = "✅ **Toutes les bonnes réponses ont été trouvées, sans erreur.**"
+        else:
+            details = []
+            if wrong:
+                details.append(f"{len(wrong)} proposition(s) cochée(s) à tort")
+            if missed:
+                details.append(f"{len(missed)} bonne(s) réponse(s) oubliée(s)")
+            status = f"❌ **{' et '.join(details).capitalize()}.**"
+        
+        lines = [status, ""]
+        for i, option in enumerate(options):
+            letter = chr(65 + i)
+            if i in correct_answers and i in user_answers_set:
+                icon = "✅"  # Bonne réponse cochée
+            elif i in wrong:
+                icon = "❌"  # Cochée à tort
+            elif i in missed:
+                icon = "⚠️"  # Bonne réponse oubliée
+            else:
+                icon = "▫️"  # Fausse et non cochée
+            verdict = "Vraie" if i in correct_answers else "Fausse"
+            lines.append(f"- {icon} **{letter}. {option}** — *{verdict}* : {rationales[i]}")
+        
+        explanation = question.get('explanation')
+        if explanation:
+            lines.extend(["", f"**📌 À retenir :** {explanation}"])
+        
+        return "\n".join(lines)
+    
+    def _feedback_key(self, question: Dict, user_answers: List[int]) -> str:
+        """
+        Clé stable du feedback : SHA-256 de (énoncé, propositions, bonnes réponses,
+        réponses de l'étudiant, modèle), indépendante de l'ordre de sélection
+        """
+        payload = json.dumps({
+            'question': question['question'],
+            'options': question['options'],
+            'correct_answers': sorted(set(question['correct_answers'])),
+            'user_answers': sorted(set(user_answers)),
+            'model': self.model
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
     
     def generate_final_summary(self, all_results: List[Dict]) -> str:
         """
@@ -237,7 +809,35 @@ Sois direct et pédagogue."""
         Returns:
             Récapitulatif en markdown
         """
+        request, fallback = self._build_summary_request(all_results)
+        
+        try:
+            response = self._create("summary", request)
+            return response.content[0].text
+            
+        except Exception as e:
+            print(f"❌ Erreur génération récapitulatif: {e}")
+            return fallback
+    
+    async def agenerate_final_summary(self, all_results: List[Dict]) -> str:
+        """Variante asynchrone de generate_final_summary"""
+        request, fallback = self._build_summary_request(all_results)
         
+        try:
+            response = await self._acreate("summary", request)
+            return response.content[0].text
+            
+        except Exception as e:
+            print(f"❌ Erreur génération récapitulatif: {e}")
+            return fallback
+    
+    def _build_summary_request(self, all_results: List[Dict]) -> Tuple[Dict, str]:
+        """
+        Construit les paramètres de messages.create pour le récapitulatif
+        
+        Returns:
+            (paramètres de la requête, récapitulatif de repli en cas d'erreur)
+        """
         # Calcul des statistiques
         total_questions = len(all_results)
         perfect_answers = sum(
@@ -281,18 +881,13 @@ Ton ton doit être :
 
 Format markdown avec émojis. Maximum 400 mots."""
         
-        try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=1200,
-                messages=[{
-                    "role": "user",
-                    "content": prompt
-                }]
-            )
-            
-            return response.content[0].text
-            
-        except Exception as e:
-            print(f"❌ Erreur génération récapitulatif: {e}")
-            return f"# Récapitulatif\n\nScore : {perfect_answers}/{total_questions} questions parfaitement réussies."
\ No newline at end of file
+        request = {
+            "model": self.model,
+            "max_tokens": 1200,
+            "messages": [{
+                "role": "user",
+                "content": prompt
+            }]
+        }
+        fallback = f"# Récapitulatif\n\nScore : {perfect_answers}/{total_questions} questions parfaitement réussies."
+        return request, fallback
\ No newline at end of file
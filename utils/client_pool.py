@@ -0,0 +1,137 @@
+"""
+Module de mutualisation des clients Anthropic
+Un client (et son pool de connexions HTTP keep-alive) par clé API, partagé par
+toutes les sessions du process au lieu d'être recréé à chaque rerun Streamlit
+"""
+
+import os
+import asyncio
+import hashlib
+import threading
+import weakref
+from typing import Dict, Optional
+
+import httpx
+from anthropic import Anthropic, AsyncAnthropic
+
+from utils.fake_backend import FakeAnthropic, FakeAsyncAnthropic
+
+
+class ClientRegistry:
+    """
+    Registre process-wide des clients Anthropic, indexé par clé API
+
+    - Clients synchrones : un par clé, partagés entre threads (httpx.Client est thread-safe)
+    - Clients asynchrones : un par clé et par boucle d'événements (un httpx.AsyncClient
+      ne peut pas être utilisé depuis une autre boucle que la sienne)
+    - QCM_FAKE_BACKEND=<échelle de temps> : backend factice (utils.fake_backend) à la
+      place de l'API, pour les tests de charge
+    """
+
+    MAX_CONNECTIONS = 20  # Connexions simultanées max par client
+    MAX_KEEPALIVE_CONNECTIONS = 10  # Connexions gardées ouvertes entre deux requêtes
+    KEEPALIVE_EXPIRY = 60.0  # Secondes avant fermeture d'une connexion inactive
+    TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+    def __init__(self, max_connections: Optional[int] = None,
+                 max_keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: Optional[float] = None,
+                 timeout: Optional[httpx.Timeout] = None):
+        """
+        Args:
+            max_connections: Connexions simultanées max par client (défaut MAX_CONNECTIONS)
+            max_keepalive_connections: Connexions keep-alive conservées (défaut MAX_KEEPALIVE_CONNECTIONS)
+            keepalive_expiry: Durée de vie d'une connexion inactive (défaut KEEPALIVE_EXPIRY)
+            timeout: Timeouts HTTP (défaut TIMEOUT)
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections or self.MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive_connections or self.MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=keepalive_expiry if keepalive_expiry is not None else self.KEEPALIVE_EXPIRY
+        )
+        self.timeout = timeout or self.TIMEOUT
+        fake_backend = os.environ.get("QCM_FAKE_BACKEND")
+        self.fake_time_scale = float(fake_backend) if fake_backend else None
+        self._clients: Dict[str, Anthropic] = {}
+        self._async_clients = weakref.WeakKeyDictionary()  # boucle -> {clé: AsyncAnthropic}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(api_key: str) -> str:
+        """Empreinte de la clé API (la clé elle-même n'est pas utilisée comme index)"""
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+    def get_client(self, api_key: str) -> Anthropic:
+        """Retourne le client synchrone partagé pour cette clé API"""
+        key = self._key(api_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None and self.fake_time_scale is not None:
+                client = self._clients[key] = FakeAnthropic(self.fake_time_scale)
+            if client is None:
+                client = Anthropic(
+                    api_key=api_key,
+                    timeout=self.timeout,
+                    max_retries=0,  # Nouvelles tentatives gérées par utils.rate_limit
+                    http_client=httpx.Client(limits=self.limits, timeout=self.timeout)
+                )
+                self._clients[key] = client
+            return client
+
+    def get_async_client(self, api_key: str) -> AsyncAnthropic:
+        """
+        Retourne le client asynchrone partagé pour cette clé API et la boucle courante
+
+        Raises:
+            RuntimeError: si appelé hors d'une boucle d'événements
+        """
+        loop = asyncio.get_running_loop()
+        key = self._key(api_key)
+        with self._lock:
+            loop_clients = self._async_clients.setdefault(loop, {})
+            client = loop_clients.get(key)
+            if client is None and self.fake_time_scale is not None:
+                client = loop_clients[key] = FakeAsyncAnthropic(self.fake_time_scale)
+            if client is None:
+                client = AsyncAnthropic(
+                    api_key=api_key,
+                    timeout=self.timeout,
+                    max_retries=0,  # Nouvelles tentatives gérées par utils.rate_limit
+                    http_client=httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+                )
+                loop_clients[key] = client
+            return client
+
+    async def aclose(self) -> None:
+        """
+        Ferme les clients asynchrones de la boucle courante
+        À appeler avant la fin d'une boucle éphémère (asyncio.run)
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            loop_clients = self._async_clients.pop(loop, {})
+        for client in loop_clients.values():
+            await client.close()
+
+    def close(self) -> None:
+        """Ferme les clients synchrones (les clients asynchrones suivent leur boucle)"""
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    """Retourne le registre de clients partagé par le process"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
@@ -5,233 +5,838 @@ VERSION OPTIMISÉE pour extraction rapide
 """
 
 import io
+import os
+import math
+import time
 import base64
-from typing import List, Dict, Tuple
-from docx import Document
-from docx.oxml.table import CT_Tbl
-from docx.oxml.text.paragraph import CT_P
-from docx.table import _Cell, Table
-from docx.text.paragraph import Paragraph
+import posixpath
+import zipfile
+from collections import deque
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional, Iterator, Iterable, Callable
+from lxml import etree
 import fitz  # PyMuPDF
 from PIL import Image
 
+from utils import metrics
+from utils.cache import get_extraction_cache
+from utils.text_normalization import PageTextNormalizer
+
+
+class ExtractedImage:
+    """
+    Image extraite et optimisée, conservée en bytes bruts
+    (le base64, 33% plus volumineux, n'est calculé qu'au moment de l'appel API)
+    """
+    
+    __slots__ = ('data', 'media_type', 'width', 'height', 'page')
+    
+    def __init__(self, data: bytes, media_type: str, width: int = 0, height: int = 0,
+                 page: Optional[int] = None):
+        """
+        Args:
+            data: Bytes de l'image
+            media_type: Type MIME ('image/jpeg', 'image/png'...)
+            width: Largeur en pixels (0 si inconnue)
+            height: Hauteur en pixels (0 si inconnue)
+            page: Page source (PDF), None pour Word
+        """
+        self.data = data
+        self.media_type = media_type
+        self.width = width
+        self.height = height
+        self.page = page
+    
+    @property
+    def format(self) -> str:
+        """Format court ('jpeg', 'png'...)"""
+        return self.media_type.split('/')[-1]
+    
+    def to_base64(self) -> str:
+        """Encode l'image en base64 (non mémorisé pour ne pas garder les deux versions)"""
+        return base64.b64encode(self.data).decode('utf-8')
+    
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ExtractedImage):
+            return NotImplemented
+        return (self.data, self.media_type, self.width, self.height, self.page) == \
+               (other.data, other.media_type, other.width, other.height, other.page)
+    
+    def __repr__(self) -> str:
+        return (f"ExtractedImage({self.media_type}, {self.width}x{self.height}, "
+                f"{len(self.data)} octets, page={self.page})")
+
 
 class DocumentParser:
     """Classe pour extraire texte et images de documents Word/PDF"""
     
     # Configuration optimisée
-    MAX_IMAGES = 10  # Limite d'images à extraire
+    MAX_IMAGES = 5  # Images retenues = images envoyées à Claude (partagé avec ClaudeQCMGenerator)
     MAX_IMAGE_SIZE = (1024, 1024)  # Résolution max (largeur, hauteur)
     IMAGE_QUALITY = 85  # Qualité JPEG (85 = bon compromis qualité/taille)
+    CACHE_VERSION = 9  # À incrémenter quand le format des résultats change
+    PARALLEL_PAGE_THRESHOLD = 64  # Nombre de pages à partir duquel l'extraction PDF est parallélisée
+    MAX_WORKERS = min(4, os.cpu_count() or 1)  # Processus pour l'extraction parallèle
+    PARALLEL_RANGE_SIZE = 16  # Pages par tâche envoyée à un worker
+    IMAGE_WORKERS = min(8, (os.cpu_count() or 1) + 2)  # Threads d'optimisation d'images
+    DUPLICATE_HASH_DISTANCE = 4  # Distance de Hamming max entre hash perceptuels (sur 64 bits)
+    MIN_IMAGE_SIDE = 100  # Images plus petites ignorées (puces, icônes)
+    PAGE_MARGIN_RATIO = 0.12  # Bandes haute/basse de la page considérées comme en-tête/pied de page
+    NORMALIZE_TEXT = True  # Texte PDF normalisé (en-têtes/pieds répétés, numéros de page, césures)
+    # Extraction du texte PDF normalisé : options par défaut + mots coupés en fin de ligne recollés
+    # (LaTeX et Word coupent avec un trait d'union ordinaire, pas une césure douce)
+    PDF_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT | fitz.TEXT_DEHYPHENATE
     
     @staticmethod
-    def extract_from_word(file_bytes: bytes) -> Tuple[str, List[Dict]]:
+    def extract_from_word(file_bytes: bytes, stats: Optional[Dict] = None) -> Tuple[str, List[ExtractedImage]]:
         """
         Extrait le texte et les images d'un fichier Word
         
         Args:
             file_bytes: Contenu du fichier Word en bytes
+            stats: Dict optionnel rempli avec les statistiques d'extraction
             
         Returns:
             Tuple (texte_complet, liste_images)
             - texte_complet: String contenant tout le texte
-            - liste_images: Liste de dicts avec {data: base64, format: str}
+            - liste_images: Liste d'ExtractedImage (bytes JPEG optimisés)
         """
-        doc = Document(io.BytesIO(file_bytes))
-        
-        # Extraction du texte
-        text_parts = []
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text_parts.append(paragraph.text)
-        
-        # Extraction des tableaux (souvent utilisés en médecine)
-        for table in doc.tables:
-            table_text = DocumentParser._extract_table_text(table)
-            if table_text:
-                text_parts.append(table_text)
-        
-        full_text = "\n\n".join(text_parts)
-        
-        # Extraction des images (OPTIMISÉ - limite à MAX_IMAGES)
-        images = []
-        image_count = 0
+        return DocumentParser._collect_chunks(DocumentParser.iter_docx_blocks(file_bytes, stats=stats))
+    
+    @staticmethod
+    def iter_docx_blocks(file_bytes: bytes, stats: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Parcourt un fichier Word et produit ses blocs au fil de l'extraction
+        Le corps (word/document.xml en général) est lu en une passe, dans l'ordre du document :
+        les tableaux restent à leur place entre les paragraphes qui les commentent.
+        Les images répétées (même part, ou quasi-identiques) sont ignorées
         
-        for rel in doc.part.rels.values():
-            if "image" in rel.target_ref and image_count < DocumentParser.MAX_IMAGES:
+        Args:
+            file_bytes: Contenu du fichier Word en bytes
+            stats: Dict optionnel rempli avec les statistiques d'extraction
+            
+        Yields:
+            {'type': 'text', 'page': None, 'text': str} pour chaque paragraphe / tableau
+            (les tableaux imbriqués suivent le tableau qui les contient),
+            puis {'type': 'image', 'page': None, 'image': ExtractedImage} pour chaque image
+        """
+        stats = DocumentParser._init_stats(stats)
+        with zipfile.ZipFile(io.BytesIO(file_bytes)) as archive:
+            # Extraction du texte (paragraphes et tableaux, souvent utilisés en médecine)
+            main_part = _docx_main_part(archive)
+            with archive.open(main_part) as body:
+                for text in _iter_docx_body_text(body):
+                    yield {'type': 'text', 'page': None, 'text': text}
+            
+            # Extraction des images (OPTIMISÉ - sélection des MAX_IMAGES plus pertinentes)
+            dedup = _ImageDeduplicator(stats)
+            candidates = []
+            
+            for partname in _docx_image_parts(archive, main_part):
                 try:
-                    image_data = rel.target_part.blob
-                    
-                    # Optimiser l'image avant conversion base64
-                    optimized_data = DocumentParser._optimize_image(image_data)
-                    
-                    # Convertir en base64
-                    img_base64 = base64.b64encode(optimized_data).decode('utf-8')
-                    
-                    # Déterminer le format
-                    img_format = DocumentParser._get_image_format(optimized_data)
-                    
-                    images.append({
-                        'data': img_base64,
-                        'format': img_format
+                    if dedup.is_repeated_key(partname):
+                        continue
+                    # Dimensions lues dans l'en-tête de l'image, sans décodage
+                    with archive.open(partname) as image_file:
+                        width, height = Image.open(image_file).size
+                    candidates.append({
+                        'key': partname,
+                        'order': len(candidates),
+                        'page': None,
+                        'width': width,
+                        'height': height,
+                        'bytes': archive.getinfo(partname).file_size,
+                        'occurrences': 1
                     })
-                    
-                    image_count += 1
-                    
                 except Exception as e:
                     print(f"Erreur extraction image: {e}")
                     continue
-        
-        return full_text, images
-    
-    @staticmethod
-    def _extract_table_text(table: Table) -> str:
-        """Extrait le texte d'un tableau Word"""
-        table_lines = []
-        for row in table.rows:
-            row_text = " | ".join(cell.text.strip() for cell in row.cells)
-            if row_text.strip():
-                table_lines.append(row_text)
-        return "\n".join(table_lines)
+            
+            def load_part(candidate: Dict) -> Tuple[bytes, str]:
+                partname = candidate['key']
+                # Format d'origine (utilisé seulement si l'optimisation échoue)
+                return archive.read(partname), posixpath.splitext(partname)[1].lstrip('.').lower()
+            
+            for image in DocumentParser._select_and_optimize(candidates, load_part, dedup):
+                stats['images'] += 1
+                yield {'type': 'image', 'page': None, 'image': image}
     
     @staticmethod
-    def extract_from_pdf(file_bytes: bytes) -> Tuple[str, List[Dict]]:
+    def extract_from_pdf(file_bytes: bytes, parallel: Optional[bool] = None,
+                         stats: Optional[Dict] = None) -> Tuple[str, List[ExtractedImage]]:
         """
         Extrait le texte et les images d'un fichier PDF
         VERSION OPTIMISÉE - Limite extraction et compresse images
         
         Args:
             file_bytes: Contenu du fichier PDF en bytes
+            parallel: Voir iter_pdf_pages
+            stats: Dict optionnel rempli avec les statistiques d'extraction
             
         Returns:
             Tuple (texte_complet, liste_images)
         """
-        doc = fitz.open(stream=file_bytes, filetype="pdf")
+        return DocumentParser._collect_chunks(
+            DocumentParser.iter_pdf_pages(file_bytes, parallel=parallel, stats=stats)
+        )
+    
+    @staticmethod
+    def iter_pdf_pages(file_bytes: bytes, parallel: Optional[bool] = None,
+                       stats: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Parcourt un PDF page par page et produit texte et images au fil de l'extraction
+        La mémoire reste bornée : seules les pages en cours de traitement sont conservées
         
-        text_parts = []
-        images = []
-        image_count = 0
+        Au-delà de PARALLEL_PAGE_THRESHOLD pages, le texte des pages est extrait
+        par plusieurs processus (résultat identique au mode séquentiel)
         
-        for page_num in range(len(doc)):
-            # Arrêter si on a déjà assez d'images
-            if image_count >= DocumentParser.MAX_IMAGES:
-                # Continuer à extraire le texte mais pas les images
-                page = doc[page_num]
-                page_text = page.get_text()
-                if page_text.strip():
-                    text_parts.append(f"--- Page {page_num + 1} ---\n{page_text}")
-                continue
+        Les images ne sont pas prises dans l'ordre des pages : leurs métadonnées
+        (dimensions, taille, position) sont collectées pendant le parcours, puis
+        seules les MAX_IMAGES mieux notées sont décodées et optimisées, en fin de flux.
+        Les images répétées (même xref, ou quasi-identiques d'après un hash perceptuel :
+        logos, bandeaux, filigranes) sont ignorées.
+        
+        Avec NORMALIZE_TEXT, les mots coupés en fin de ligne sont recollés par PyMuPDF
+        (PDF_TEXT_FLAGS) et le texte passe par PageTextNormalizer (en-têtes et pieds
+        de page répétés, numéros de page, espaces) ; les tokens économisés
+        sont reportés dans stats (tokens_raw, tokens, tokens_saved).
+        
+        Args:
+            file_bytes: Contenu du fichier PDF en bytes
+            parallel: Force (True) ou désactive (False) le mode parallèle,
+                      None = automatique selon le nombre de pages
+            stats: Dict optionnel rempli avec les statistiques d'extraction
+        
+        Yields:
+            {'type': 'text', 'page': n, 'text': str} pour chaque page non vide (préfixée
+            par le marqueur "[pn]", ou "--- Page n ---" sans normalisation),
+            puis {'type': 'image', 'page': n, 'image': ExtractedImage} pour les images retenues
+        """
+        stats = DocumentParser._init_stats(stats)
+        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+            page_count = len(doc)
+            stats['pages'] = page_count
             
-            page = doc[page_num]
+            if parallel is None:
+                parallel = page_count >= DocumentParser.PARALLEL_PAGE_THRESHOLD and DocumentParser.MAX_WORKERS > 1
             
-            # Extraction du texte
-            page_text = page.get_text()
-            if page_text.strip():
-                text_parts.append(f"--- Page {page_num + 1} ---\n{page_text}")
+            if parallel:
+                pages = DocumentParser._iter_pdf_pages_parallel(file_bytes, page_count)
+            else:
+                pages = DocumentParser._iter_pdf_page_records(doc, 0, page_count)
             
-            # Extraction des images (LIMITÉE)
-            image_list = page.get_images(full=True)
-            for img_index, img_info in enumerate(image_list):
-                if image_count >= DocumentParser.MAX_IMAGES:
-                    break
+            try:
+                dedup = _ImageDeduplicator(stats)
+                candidates = {}  # xref -> métadonnées de l'image (aucun décodage)
+                
+                def page_texts() -> Iterator[Tuple[int, str]]:
+                    """Texte des pages non vides ; les métadonnées d'images sont collectées au passage"""
+                    for page_num, page_text, page_images in pages:
+                        if page_text.strip():
+                            yield page_num + 1, page_text
+                        
+                        for meta in page_images:
+                            known = candidates.get(meta['key'])
+                            if known is None:
+                                meta['order'] = len(candidates)
+                                meta['occurrences'] = 1
+                                candidates[meta['key']] = meta
+                            else:
+                                # Même objet image déjà vu (logo répété sur chaque page...)
+                                stats['repeated_images'] += 1
+                                known['occurrences'] += 1
+                                known['display_ratio'] = max(known['display_ratio'], meta['display_ratio'])
+                
+                normalizer = PageTextNormalizer() if DocumentParser.NORMALIZE_TEXT else None
+                if normalizer is not None:
+                    texts = normalizer.normalize_pages(page_texts())
+                else:
+                    texts = ((page, f"--- Page {page} ---\n{text}") for page, text in page_texts())
+                for page, text in texts:
+                    yield {'type': 'text', 'page': page, 'text': text}
+                
+                if normalizer is not None:
+                    savings = normalizer.savings()
+                    for name in ('tokens_raw', 'tokens', 'tokens_saved'):
+                        stats[name] = savings[name]
+                    metrics.increment("qcm_text_tokens_saved_total", savings['tokens_saved'])
                 
+                def load_xref(candidate: Dict) -> Tuple[bytes, str]:
+                    base_image = doc.extract_image(candidate['key'])
+                    return base_image["image"], base_image["ext"]
+                
+                # Les images sont choisies une fois toutes les pages vues (budget global)
+                for image in DocumentParser._select_and_optimize(list(candidates.values()), load_xref, dedup):
+                    stats['images'] += 1
+                    yield {'type': 'image', 'page': image.page, 'image': image}
+            finally:
+                pages.close()
+    
+    @staticmethod
+    def _iter_pdf_page_records(doc, start: int, end: int) -> Iterator[Tuple[int, str, List[Dict]]]:
+        """
+        Extrait le texte et les métadonnées des images des pages [start, end)
+        Aucune image n'est décodée : seuls dimensions, taille et position sont lues
+        
+        Yields:
+            Tuples (numéro_page, texte, [métadonnées image])
+        """
+        for page_num in range(start, end):
+            page = doc[page_num]
+            if DocumentParser.NORMALIZE_TEXT:
+                page_text = page.get_text(flags=DocumentParser.PDF_TEXT_FLAGS)
+            else:
+                page_text = page.get_text()
+            page_area = abs(page.rect) or 1.0
+            page_height = page.rect.height or 1.0
+            text_chars = len(page_text.strip())
+            
+            page_images = []
+            for img_info in page.get_images(full=True):
+                xref, width, height = img_info[0], img_info[2], img_info[3]
                 try:
-                    xref = img_info[0]
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    
-                    # OPTIMISATION : Compresser l'image
-                    optimized_bytes = DocumentParser._optimize_image(image_bytes)
-                    
-                    # Convertir en base64
-                    img_base64 = base64.b64encode(optimized_bytes).decode('utf-8')
-                    img_format = base_image["ext"]
-                    
-                    images.append({
-                        'data': img_base64,
-                        'format': img_format
-                    })
-                    
-                    image_count += 1
-                    
-                except Exception as e:
-                    print(f"Erreur extraction image PDF page {page_num + 1}: {e}")
-                    continue
+                    bbox = page.get_image_bbox(img_info)
+                    valid_bbox = bbox.is_valid and not bbox.is_infinite and not bbox.is_empty
+                except Exception:
+                    valid_bbox = False
+                
+                if valid_bbox:
+                    center_y = (bbox.y0 + bbox.y1) / 2 / page_height
+                    display_ratio = abs(bbox & page.rect) / page_area
+                else:
+                    center_y, display_ratio = 0.5, 0.0
+                
+                try:
+                    length = int(doc.xref_get_key(xref, "Length")[1])
+                except (ValueError, TypeError):
+                    length = 0
+                
+                page_images.append({
+                    'key': xref,
+                    'page': page_num + 1,
+                    'width': width,
+                    'height': height,
+                    'bytes': length,
+                    'display_ratio': display_ratio,
+                    'in_margin': (center_y < DocumentParser.PAGE_MARGIN_RATIO
+                                  or center_y > 1 - DocumentParser.PAGE_MARGIN_RATIO),
+                    'page_text_chars': text_chars
+                })
+            
+            yield page_num, page_text, page_images
+    
+    @staticmethod
+    def _iter_pdf_pages_parallel(file_bytes: bytes, page_count: int) -> Iterator[Tuple[int, str, List[Dict]]]:
+        """
+        Répartit les pages en plages contiguës sur un pool de processus
+        Chaque worker ouvre son propre document fitz depuis les bytes partagés
+        Les plages sont soumises par fenêtre glissante et restituées dans l'ordre des pages
+        """
+        workers = max(1, min(DocumentParser.MAX_WORKERS, page_count))
+        # Plages courtes pour équilibrer les pages lourdes et borner la mémoire
+        range_size = max(1, min(DocumentParser.PARALLEL_RANGE_SIZE, -(-page_count // workers)))
+        ranges = deque((start, min(start + range_size, page_count))
+                       for start in range(0, page_count, range_size))
         
-        full_text = "\n\n".join(text_parts)
-        doc.close()
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=_init_pdf_worker,
+                                       initargs=(file_bytes,))
+        try:
+            pending = deque()
+            while ranges or pending:
+                # Garder au plus 2 plages en vol par worker
+                while ranges and len(pending) < workers * 2:
+                    start, end = ranges.popleft()
+                    pending.append(executor.submit(_extract_pdf_page_range, start, end))
+                yield from pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    @staticmethod
+    def _score_image(candidate: Dict) -> float:
+        """
+        Note la pertinence probable d'une image à partir de ses seules métadonnées
+        (aucun décodage) : favorise les figures grandes, détaillées, au milieu du texte ;
+        pénalise bandeaux, images de marge et images répétées sur plusieurs pages
         
-        return full_text, images
+        Returns:
+            Score (plus élevé = plus pertinent), -inf si l'image est à ignorer
+        """
+        width, height = candidate['width'], candidate['height']
+        if min(width, height) < DocumentParser.MIN_IMAGE_SIDE:
+            return float('-inf')
+        
+        score = math.log(width * height)
+        # Octets par pixel : une photo ou un schéma détaillé compresse moins bien qu'un aplat
+        if candidate['bytes']:
+            score += 0.5 * math.log(candidate['bytes'])
+        
+        aspect = max(width, height) / min(width, height)
+        if aspect > 4:
+            score -= 2.0  # Bandeau / séparateur
+        
+        # Surface affichée sur la page (PDF)
+        score += 3.0 * candidate.get('display_ratio', 0.0)
+        if candidate.get('in_margin'):
+            score -= 2.0  # En-tête / pied de page
+        if candidate.get('page_text_chars', 0) > 200:
+            score += 0.5  # Figure commentée par le texte de la page
+        
+        # Image répétée sur plusieurs pages : logo, filigrane
+        score -= 1.5 * math.log(candidate.get('occurrences', 1))
+        return score
     
     @staticmethod
-    def _optimize_image(image_bytes: bytes) -> bytes:
+    def _select_and_optimize(candidates: List[Dict], load: Callable[[Dict], Tuple[bytes, str]],
+                             dedup: '_ImageDeduplicator') -> List[ExtractedImage]:
+        """
+        Retient les MAX_IMAGES meilleures images candidates puis les optimise en parallèle
+        Seules les images retenues (et les quasi-doublons écartés) sont décodées
+        
+        Args:
+            candidates: Métadonnées des images (voir _score_image)
+            load: Fonction retournant (image_bytes, format_source) d'un candidat
+            dedup: Détecteur de doublons du document
+            
+        Returns:
+            ExtractedImage dans l'ordre du document
+        """
+        ranked = sorted(
+            (candidate for candidate in candidates if DocumentParser._score_image(candidate) > float('-inf')),
+            key=DocumentParser._score_image,
+            reverse=True
+        )
+        
+        selected = []
+        for candidate in ranked:
+            if len(selected) >= DocumentParser.MAX_IMAGES:
+                break
+            try:
+                image_bytes, source_format = load(candidate)
+            except Exception as e:
+                print(f"Erreur extraction image (page {candidate['page']}): {e}")
+                continue
+            if dedup.is_near_duplicate(image_bytes):
+                continue
+            selected.append((candidate['order'], image_bytes, source_format, candidate['page']))
+        
+        # Restituer dans l'ordre du document
+        selected.sort(key=lambda item: item[0])
+        return DocumentParser.optimize_images([item[1:] for item in selected])
+    
+    @staticmethod
+    def optimize_images(images: List[Tuple[bytes, str, Optional[int]]]) -> List['ExtractedImage']:
+        """
+        Optimise un lot d'images en parallèle sur un pool de threads
+        (PIL relâche le GIL pendant le décodage, le redimensionnement et l'encodage)
+        
+        Args:
+            images: Tuples (image_bytes, format_source, page)
+            
+        Returns:
+            ExtractedImage optimisées, dans le même ordre
+        """
+        if len(images) <= 1:
+            return [DocumentParser._optimize_image(*image) for image in images]
+        return list(_get_image_executor().map(lambda image: DocumentParser._optimize_image(*image), images))
+    
+    @staticmethod
+    def _optimize_image(image_bytes: bytes, source_format: str = 'jpeg',
+                        page: Optional[int] = None) -> 'ExtractedImage':
         """
         Optimise une image (redimensionne et compresse)
+        Les JPEG sont décodés directement à résolution réduite (mode draft) :
+        une image 4000px n'est jamais décodée entièrement pour finir en 1024px
         
         Args:
             image_bytes: Image originale en bytes
+            source_format: Format d'origine, conservé si l'optimisation échoue
+            page: Page source (PDF)
             
         Returns:
-            Image optimisée en bytes
+            ExtractedImage (JPEG optimisé, format et dimensions connus sans re-décodage)
         """
         try:
             img = Image.open(io.BytesIO(image_bytes))
+            max_size = DocumentParser.MAX_IMAGE_SIZE
+            too_large = img.size[0] > max_size[0] or img.size[1] > max_size[1]
+            
+            # Décodage DCT réduit (1/2, 1/4, 1/8) tant que l'image reste >= taille finale
+            if too_large and img.format == 'JPEG':
+                ratio = min(max_size[0] / img.size[0], max_size[1] / img.size[1])
+                img.draft('RGB', (max(1, int(img.size[0] * ratio)), max(1, int(img.size[1] * ratio))))
+            
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            
+            # Redimensionner si trop grande (avant conversion : moins de pixels à traiter)
+            if too_large:
+                img.thumbnail(max_size, Image.Resampling.LANCZOS)
             
             # Convertir en RGB si nécessaire (pour JPEG)
-            if img.mode in ('RGBA', 'LA', 'P'):
+            if img.mode in ('RGBA', 'LA'):
                 background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+                background.paste(img, mask=img.split()[-1])
                 img = background
             elif img.mode != 'RGB':
                 img = img.convert('RGB')
             
-            # Redimensionner si trop grande
-            if img.size[0] > DocumentParser.MAX_IMAGE_SIZE[0] or img.size[1] > DocumentParser.MAX_IMAGE_SIZE[1]:
-                img.thumbnail(DocumentParser.MAX_IMAGE_SIZE, Image.Resampling.LANCZOS)
-            
             # Compresser en JPEG
             output = io.BytesIO()
             img.save(output, format='JPEG', quality=DocumentParser.IMAGE_QUALITY, optimize=True)
             
-            return output.getvalue()
+            return ExtractedImage(output.getvalue(), 'image/jpeg', img.size[0], img.size[1], page)
             
         except Exception as e:
             print(f"Erreur optimisation image: {e}")
             # Si erreur, retourner l'original
-            return image_bytes
+            media_type = f"image/{'jpeg' if source_format == 'jpg' else source_format}"
+            return ExtractedImage(image_bytes, media_type, page=page)
     
     @staticmethod
-    def _get_image_format(image_bytes: bytes) -> str:
-        """Détermine le format d'une image depuis ses bytes"""
-        try:
-            img = Image.open(io.BytesIO(image_bytes))
-            format_map = {
-                'JPEG': 'jpeg',
-                'PNG': 'png',
-                'GIF': 'gif',
-                'WEBP': 'webp'
-            }
-            return format_map.get(img.format, 'jpeg')
-        except:
-            return 'jpeg'  # Format par défaut
+    def _init_stats(stats: Optional[Dict]) -> Dict:
+        """Initialise le dict de statistiques d'extraction (ou en crée un local)"""
+        if stats is None:
+            stats = {}
+        stats.setdefault('pages', 0)
+        stats.setdefault('images', 0)
+        stats.setdefault('repeated_images', 0)
+        stats.setdefault('near_duplicate_images', 0)
+        stats.setdefault('tokens_raw', 0)
+        stats.setdefault('tokens', 0)
+        stats.setdefault('tokens_saved', 0)
+        return stats
+    
+    @staticmethod
+    def _collect_chunks(chunks: Iterable[Dict]) -> Tuple[str, List[ExtractedImage]]:
+        """Assemble un flux de blocs en (texte_complet, liste_images)"""
+        text_parts = []
+        images = []
+        for chunk in chunks:
+            if chunk['type'] == 'text':
+                text_parts.append(chunk['text'])
+            elif chunk['type'] == 'image':
+                images.append(chunk['image'])
+        return "\n\n".join(text_parts), images
     
     @staticmethod
-    def parse_document(file_bytes: bytes, file_type: str) -> Tuple[str, List[Dict]]:
+    def iter_document(file_bytes: bytes, file_type: str, stats: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Version flux de parse_document (sans cache) : produit les blocs
+        texte/image au fil de l'extraction
+        
+        Args:
+            file_bytes: Contenu du fichier
+            file_type: 'docx' ou 'pdf'
+            stats: Dict optionnel rempli avec les statistiques d'extraction
+        """
+        if file_type == 'docx':
+            return DocumentParser.iter_docx_blocks(file_bytes, stats=stats)
+        elif file_type == 'pdf':
+            return DocumentParser.iter_pdf_pages(file_bytes, stats=stats)
+        else:
+            raise ValueError(f"Type de fichier non supporté: {file_type}")
+    
+    @staticmethod
+    def _cache_settings() -> Dict:
+        """Paramètres du parser qui influencent le résultat (inclus dans la clé de cache)"""
+        return {
+            'max_images': DocumentParser.MAX_IMAGES,
+            'max_image_size': DocumentParser.MAX_IMAGE_SIZE,
+            'image_quality': DocumentParser.IMAGE_QUALITY,
+            'normalize_text': DocumentParser.NORMALIZE_TEXT,
+            'cache_version': DocumentParser.CACHE_VERSION
+        }
+    
+    @staticmethod
+    def parse_document(file_bytes: bytes, file_type: str, use_cache: bool = True,
+                       stats: Optional[Dict] = None) -> Tuple[str, List[ExtractedImage]]:
         """
         Point d'entrée principal pour parser un document
+        Les résultats sont mis en cache (mémoire + disque) par hash du contenu
         
         Args:
             file_bytes: Contenu du fichier
             file_type: 'docx' ou 'pdf'
+            use_cache: Si False, force une nouvelle extraction
+            stats: Dict optionnel rempli avec les statistiques d'extraction
+                   (pages, images, repeated_images, near_duplicate_images,
+                   tokens_raw / tokens / tokens_saved pour les PDF normalisés)
             
         Returns:
             Tuple (texte, images) avec images optimisées et limitées
         """
-        if file_type == 'docx':
-            return DocumentParser.extract_from_word(file_bytes)
-        elif file_type == 'pdf':
-            return DocumentParser.extract_from_pdf(file_bytes)
+        if file_type not in ('docx', 'pdf'):
+            raise ValueError(f"Type de fichier non supporté: {file_type}")
+        
+        started = time.perf_counter()
+        cache = get_extraction_cache()
+        if use_cache:
+            key = cache.make_key(file_bytes, file_type, DocumentParser._cache_settings())
+            cached = cache.get(key)
+            if cached is not None:
+                text, images, cached_stats = cached
+                if stats is not None:
+                    stats.update(cached_stats)
+                DocumentParser._record_parse(file_type, "hit", started)
+                return text, list(images)
+        
+        parse_stats = DocumentParser._init_stats(None)
+        text, images = DocumentParser._collect_chunks(
+            DocumentParser.iter_document(file_bytes, file_type, stats=parse_stats)
+        )
+        if stats is not None:
+            stats.update(parse_stats)
+        
+        if use_cache:
+            cache.set(key, (text, images, parse_stats))
+        
+        DocumentParser._record_parse(file_type, "miss" if use_cache else "off", started)
+        return text, list(images)
+    
+    @staticmethod
+    def _record_parse(file_type: str, cache_status: str, started: float) -> None:
+        """Métriques d'une extraction (cache_status : hit, miss ou off)"""
+        metrics.observe("qcm_parse_seconds", time.perf_counter() - started, file_type=file_type, cache=cache_status)
+        metrics.increment("qcm_documents_parsed_total", file_type=file_type, cache=cache_status)
+
+
+class _ImageDeduplicator:
+    """
+    Détecte les images répétées pendant l'extraction
+    - par identifiant (xref PDF, part Word) : gratuit
+    - par hash perceptuel (dHash 64 bits) calculé sur une vignette 9x8 : quasi-doublons
+    """
+    
+    def __init__(self, stats: Dict):
+        self.stats = stats
+        self.seen_keys = set()
+        self.hashes = []
+    
+    def is_repeated_key(self, key) -> bool:
+        """True si l'identifiant a déjà été vu (et le mémorise sinon)"""
+        if key in self.seen_keys:
+            self.stats['repeated_images'] += 1
+            return True
+        self.seen_keys.add(key)
+        return False
+    
+    def is_near_duplicate(self, image_bytes: bytes) -> bool:
+        """True si l'image est quasi-identique à une image déjà retenue (et la mémorise sinon)"""
+        image_hash = _perceptual_hash(image_bytes)
+        if image_hash is None:
+            return False
+        for known in self.hashes:
+            if bin(image_hash ^ known).count('1') <= DocumentParser.DUPLICATE_HASH_DISTANCE:
+                self.stats['near_duplicate_images'] += 1
+                return True
+        self.hashes.append(image_hash)
+        return False
+
+
+def _perceptual_hash(image_bytes: bytes) -> Optional[int]:
+    """
+    Hash perceptuel par différences (dHash) sur une vignette 9x8 en niveaux de gris
+    Les JPEG sont décodés au 1/8 (mode draft) : coût négligeable devant l'optimisation
+    """
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.draft('L', (32, 32))
+        pixels = list(img.convert('L').resize((9, 8), Image.Resampling.BILINEAR, reducing_gap=2.0).getdata())
+    except Exception:
+        return None
+    
+    image_hash = 0
+    for row in range(8):
+        for col in range(8):
+            image_hash = (image_hash << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return image_hash
+
+
+# Lecture directe du XML des fichiers Word (sans le modèle objet de python-docx)
+DOCX_PACKAGE_RELS = "_rels/.rels"
+DOCX_DEFAULT_MAIN_PART = "word/document.xml"  # Si le paquet ne déclare pas sa part principale
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_IMAGE_RELTYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+_OFFICE_DOCUMENT_RELTYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+# Texte des runs (comme Run.text de python-docx)
+_DOCX_RUN_TEXT = {_W + "tab": "\t", _W + "ptab": "\t", _W + "cr": "\n", _W + "noBreakHyphen": "-"}
+# Contenus ignorés : zones de texte et formes (absents de Paragraph.text), texte supprimé
+_DOCX_SKIPPED = {
+    _W + "drawing", _W + "pict", _W + "object", _W + "del",
+    "{http://schemas.openxmlformats.org/markup-compatibility/2006}AlternateContent"
+}
+
+
+def _iter_docx_body_text(body) -> Iterator[str]:
+    """
+    Parcourt word/document.xml en flux (iterparse) et produit, dans l'ordre du document,
+    le texte des paragraphes non vides et de chaque tableau ("cellule | cellule" par ligne)
+    Comme Table.row_cells de python-docx, une ligne a une cellule par colonne de la grille :
+    une cellule fusionnée (gridSpan, vMerge) répète son texte dans chaque colonne couverte
+    Les éléments déjà traités sont libérés : la mémoire ne dépend pas de la taille du document
+    """
+    paragraphs: List[List[str]] = []  # Runs des paragraphes ouverts
+    tables: List[Dict] = []  # Tableaux ouverts (imbrication)
+    skipped = 0
+    
+    for event, elem in etree.iterparse(body, events=("start", "end")):
+        tag = elem.tag
+        if tag in _DOCX_SKIPPED:
+            skipped += 1 if event == "start" else -1
+            continue
+        if skipped:
+            continue
+        
+        if event == "start":
+            if tag == _W + "p":
+                paragraphs.append([])
+            elif tag == _W + "tbl":
+                tables.append({'rows': [], 'row': None, 'above': [], 'cell': None, 'nested': []})
+            elif tag == _W + "tr":
+                tables[-1]['row'] = []
+            elif tag == _W + "tc":
+                tables[-1]['cell'] = []
+            continue
+        
+        if tag == _W + "t":
+            if paragraphs:
+                paragraphs[-1].append(elem.text or "")
+        elif tag in _DOCX_RUN_TEXT:
+            if paragraphs:
+                paragraphs[-1].append(_DOCX_RUN_TEXT[tag])
+        elif tag == _W + "br":
+            # Saut de ligne ; les sauts de page et de colonne n'ajoutent rien
+            if paragraphs and elem.get(_W + "type", "textWrapping") == "textWrapping":
+                paragraphs[-1].append("\n")
+        elif tag == _W + "p":
+            text = "".join(paragraphs.pop())
+            if tables and tables[-1]['cell'] is not None:
+                tables[-1]['cell'].append(text)
+            elif text.strip():
+                yield text
+        elif tag == _W + "tc":
+            table = tables[-1]
+            text = "\n".join(table['cell']).strip()
+            span, continued = _docx_cell_merge(elem)
+            for _ in range(span):
+                column = len(table['row'])
+                if continued:
+                    # Suite d'une fusion verticale : texte de la cellule du dessus
+                    text = table['above'][column] if column < len(table['above']) else ""
+                table['row'].append(text)
+            table['cell'] = None
+        elif tag == _W + "tr":
+            table = tables[-1]
+            if any(table['row']):
+                table['rows'].append(" | ".join(table['row']))
+            table['above'] = table['row']
+            table['row'] = None
+        elif tag == _W + "tbl":
+            table = tables.pop()
+            blocks = (["\n".join(table['rows'])] if table['rows'] else []) + table['nested']
+            if tables:
+                tables[-1]['nested'].extend(blocks)
+            else:
+                yield from blocks
         else:
-            raise ValueError(f"Type de fichier non supporté: {file_type}")
\ No newline at end of file
+            continue
+        
+        # Bloc de premier niveau terminé : libérer l'élément et ses prédécesseurs
+        if not tables and not paragraphs and tag in (_W + "p", _W + "tbl"):
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+
+def _docx_cell_merge(cell) -> Tuple[int, bool]:
+    """Colonnes de la grille couvertes par une cellule (w:gridSpan) et suite de fusion verticale (w:vMerge)"""
+    properties = cell.find(_W + "tcPr")
+    if properties is None:
+        return 1, False
+    grid_span = properties.find(_W + "gridSpan")
+    v_merge = properties.find(_W + "vMerge")
+    span = max(1, int(grid_span.get(_W + "val", "1"))) if grid_span is not None else 1
+    return span, v_merge is not None and v_merge.get(_W + "val", "continue") == "continue"
+
+
+def _resolve_part(source_dir: str, target: str) -> str:
+    """Chemin dans le paquet d'une cible de relation (relative à source_dir, ou absolue)"""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(source_dir, target))
+
+
+def _read_rels(archive: zipfile.ZipFile, rels_part: str) -> list:
+    """Relations d'une part (liste vide si le fichier .rels est absent)"""
+    try:
+        return list(etree.fromstring(archive.read(rels_part)))
+    except KeyError:
+        return []
+
+
+def _docx_main_part(archive: zipfile.ZipFile) -> str:
+    """
+    Part principale du document, déclarée par la relation officeDocument de _rels/.rels
+    (word/document.xml chez Word, mais d'autres générateurs la nomment autrement)
+    """
+    for rel in _read_rels(archive, DOCX_PACKAGE_RELS):
+        if rel.get("Type") == _OFFICE_DOCUMENT_RELTYPE and rel.get("TargetMode") != "External":
+            partname = _resolve_part("", rel.get("Target", ""))
+            if partname in archive.NameToInfo:
+                return partname
+    return DOCX_DEFAULT_MAIN_PART
+
+
+def _docx_image_parts(archive: zipfile.ZipFile, main_part: str) -> List[str]:
+    """Chemins des images référencées par le corps du document, dans l'ordre des relations"""
+    main_dir, main_name = posixpath.split(main_part)
+    rels = _read_rels(archive, posixpath.join(main_dir, "_rels", f"{main_name}.rels"))
+    parts = []
+    for rel in rels:
+        if rel.get("Type") != _IMAGE_RELTYPE or rel.get("TargetMode") == "External":
+            continue
+        # Cible relative au dossier de la part principale (ou absolue depuis la racine du paquet)
+        partname = _resolve_part(main_dir, rel.get("Target", ""))
+        if partname in archive.NameToInfo:
+            parts.append(partname)
+    return parts
+
+
+# Pool de threads partagé pour l'optimisation des images
+_image_executor = None
+_image_executor_lock = threading.Lock()
+
+
+def _get_image_executor() -> ThreadPoolExecutor:
+    """Retourne le pool de threads d'optimisation d'images (créé à la demande)"""
+    global _image_executor
+    with _image_executor_lock:
+        if _image_executor is None:
+            _image_executor = ThreadPoolExecutor(
+                max_workers=DocumentParser.IMAGE_WORKERS,
+                thread_name_prefix="qcm-image"
+            )
+        return _image_executor
+
+
+# Workers du pool de processus (niveau module pour être picklables)
+_worker_pdf_bytes = None
+
+
+def _init_pdf_worker(file_bytes: bytes) -> None:
+    """Initialise un worker : les bytes du PDF ne sont transmis qu'une fois par processus"""
+    global _worker_pdf_bytes
+    _worker_pdf_bytes = file_bytes
+
+
+def _extract_pdf_page_range(start: int, end: int) -> List[Tuple[int, str, List[Dict]]]:
+    """Extrait une plage de pages dans un worker"""
+    doc = fitz.open(stream=_worker_pdf_bytes, filetype="pdf")
+    try:
+        return list(DocumentParser._iter_pdf_page_records(doc, start, end))
+    finally:
+        doc.close()
@@ -0,0 +1,161 @@
+"""
+Module de backend factice pour l'API Claude
+Simule la latence (temps avant premier token + débit de sortie) sans réseau ni
+clé API : tests de charge de l'ordonnancement et démonstrations hors ligne
+"""
+
+import re
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, Iterator
+
+
+class FakeBackendConfig:
+    """Paramètres de latence simulée"""
+
+    FIRST_TOKEN_LATENCY = 0.6  # Secondes avant le premier token
+    OUTPUT_TOKENS_PER_SECOND = 150.0
+    CHARS_PER_TOKEN = 3.5
+
+    def __init__(self, time_scale: float = 1.0):
+        """
+        Args:
+            time_scale: Multiplicateur des délais (0.1 = 10x plus rapide que l'API simulée)
+        """
+        self.time_scale = time_scale
+
+    def first_token_delay(self) -> float:
+        return self.FIRST_TOKEN_LATENCY * self.time_scale
+
+    def output_delay(self, text: str) -> float:
+        tokens = len(text) / self.CHARS_PER_TOKEN
+        return tokens / self.OUTPUT_TOKENS_PER_SECOND * self.time_scale
+
+
+def _request_text(request: Dict) -> str:
+    """Concatène le texte du message utilisateur"""
+    parts = []
+    for message in request.get('messages', []):
+        content = message['content']
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get('text', '') for block in content if block.get('type') == 'text')
+    return "\n".join(parts)
+
+
+def fake_response_text(request: Dict) -> str:
+    """Réponse plausible selon le type de requête (génération de QCM ou texte libre)"""
+    prompt = _request_text(request)
+    match = re.search(r"génère (\d+) questions", prompt)
+    if match is None:
+        # Feedback / récapitulatif : texte de longueur proche de max_tokens
+        words = max(20, request.get('max_tokens', 600) // 4)
+        return "✅ Réponse simulée. " + " ".join(["analyse"] * words)
+
+    count = int(match.group(1))
+    part = re.search(r"partie (\d+)/", prompt)
+    variant = re.search(r"Variante n°(\d+)", prompt)
+    prefix = f"V{variant.group(1)}-" if variant else ""
+    prefix += f"P{part.group(1)}-" if part else ""
+    questions = [
+        {
+            "question": f"Question simulée {prefix}{i + 1} : quelle proposition est exacte ?",
+            "options": [f"Proposition {letter}" for letter in "ABCDE"],
+            "correct_answers": [0, 2],
+            "explanation": "Explication simulée des bonnes et mauvaises réponses.",
+            "option_rationales": [f"Justification simulée {letter}." for letter in "ABCDE"]
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"questions": questions}, ensure_ascii=False)
+
+
+def _fake_message(request: Dict, text: str) -> SimpleNamespace:
+    usage = SimpleNamespace(
+        input_tokens=len(_request_text(request)) // 4,
+        output_tokens=len(text) // 4,
+        cache_read_input_tokens=0,
+        cache_creation_input_tokens=0
+    )
+    return SimpleNamespace(
+        content=[SimpleNamespace(type="text", text=text)],
+        usage=usage,
+        model=request.get('model'),
+        stop_reason="end_turn"
+    )
+
+
+class _FakeStream:
+    """Équivalent factice de MessageStream (text_stream + get_final_message)"""
+
+    CHUNK_CHARS = 24
+
+    def __init__(self, request: Dict, config: FakeBackendConfig):
+        self.request = request
+        self.config = config
+        self.text = fake_response_text(request)
+
+    def __enter__(self) -> "_FakeStream":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        time.sleep(self.config.first_token_delay())
+        for i in range(0, len(self.text), self.CHUNK_CHARS):
+            chunk = self.text[i:i + self.CHUNK_CHARS]
+            time.sleep(self.config.output_delay(chunk))
+            yield chunk
+
+    def get_final_message(self) -> SimpleNamespace:
+        return _fake_message(self.request, self.text)
+
+
+class _FakeMessages:
+    def __init__(self, config: FakeBackendConfig):
+        self.config = config
+
+    def create(self, **request) -> SimpleNamespace:
+        text = fake_response_text(request)
+        time.sleep(self.config.first_token_delay() + self.config.output_delay(text))
+        return _fake_message(request, text)
+
+    def stream(self, **request) -> _FakeStream:
+        return _FakeStream(request, self.config)
+
+
+class _FakeAsyncMessages:
+    def __init__(self, config: FakeBackendConfig):
+        self.config = config
+
+    async def create(self, **request) -> SimpleNamespace:
+        text = fake_response_text(request)
+        await asyncio.sleep(self.config.first_token_delay() + self.config.output_delay(text))
+        return _fake_message(request, text)
+
+
+class FakeAnthropic:
+    """Remplaçant d'anthropic.Anthropic (messages.create / messages.stream)"""
+
+    def __init__(self, time_scale: float = 1.0):
+        self.config = FakeBackendConfig(time_scale)
+        self.messages = _FakeMessages(self.config)
+
+    def close(self) -> None:
+        return None
+
+
+class FakeAsyncAnthropic:
+    """Remplaçant d'anthropic.AsyncAnthropic (messages.create)"""
+
+    def __init__(self, time_scale: float = 1.0):
+        self.config = FakeBackendConfig(time_scale)
+        self.messages = _FakeAsyncMessages(self.config)
+
+    async def close(self) -> None:
+        return None
@@ -0,0 +1,108 @@
+"""
+Module de parsing JSON incrémental
+Extrait chaque question dès que son accolade fermante arrive dans le flux
+"""
+
+import json
+from typing import List, Dict
+
+
+class IncrementalQuestionParser:
+    """
+    Parser incrémental pour une réponse {"questions": [ {...}, {...} ]}
+
+    Le texte est fourni morceau par morceau (feed) ; chaque objet complet du
+    tableau "questions" est décodé et retourné dès sa fermeture. Le texte
+    autour du JSON (balises ```json, etc.) est ignoré.
+    """
+
+    def __init__(self, key: str = "questions"):
+        """
+        Args:
+            key: Clé du tableau d'objets à extraire
+        """
+        self.key_token = f'"{key}"'
+        self.buffer = ""
+        self.pos = 0  # Prochain caractère à analyser dans buffer
+        self.key_found = False
+        self.in_array = False
+        self.depth = 0  # Profondeur ({ et [) à l'intérieur du tableau
+        self.in_string = False
+        self.escape = False
+        self.object_start = None
+        self.done = False
+        self.count = 0
+
+    def feed(self, text: str) -> List[Dict]:
+        """
+        Ajoute un morceau de texte et retourne les objets complétés par ce morceau
+
+        Raises:
+            json.JSONDecodeError: si un objet complet n'est pas du JSON valide
+        """
+        if self.done:
+            return []
+        self.buffer += text
+        completed = []
+
+        if not self.in_array and not self._find_array_start():
+            return completed
+
+        buffer = self.buffer
+        i = self.pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                if char == '{' and self.depth == 0:
+                    self.object_start = i
+                self.depth += 1
+            elif char in '}]':
+                if self.depth == 0:
+                    # Fin du tableau
+                    self.done = True
+                    break
+                self.depth -= 1
+                if self.depth == 0 and self.object_start is not None:
+                    completed.append(json.loads(buffer[self.object_start:i + 1]))
+                    self.count += 1
+                    self.object_start = None
+            i += 1
+
+        # Libérer le texte déjà traité (sauf l'objet en cours)
+        keep_from = self.object_start if self.object_start is not None else i
+        self.buffer = buffer[keep_from:]
+        self.pos = i - keep_from
+        if self.object_start is not None:
+            self.object_start = 0
+        return completed
+
+    def _find_array_start(self) -> bool:
+        """Cherche la clé puis le '[' ouvrant ; True quand le tableau commence"""
+        if not self.key_found:
+            index = self.buffer.find(self.key_token, self.pos)
+            if index < 0:
+                # Garder la fin du buffer : la clé peut être coupée entre deux morceaux
+                self.buffer = self.buffer[-len(self.key_token):]
+                self.pos = 0
+                return False
+            self.key_found = True
+            self.pos = index + len(self.key_token)
+
+        index = self.buffer.find('[', self.pos)
+        if index < 0:
+            self.buffer = ""
+            self.pos = 0
+            return False
+        self.in_array = True
+        self.buffer = self.buffer[index + 1:]
+        self.pos = 0
+        return True
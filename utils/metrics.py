@@ -0,0 +1,207 @@
+"""
+Module d'instrumentation : compteurs et chronomètres par étape
+(extraction, appels API, parsing JSON, export PDF)
+
+Chaque mesure est enregistrée dans le registre du process (export au format
+texte Prometheus) et dans celui de la session Streamlit liée au contexte
+courant (panneau de la barre latérale).
+"""
+
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple
+
+
+# Description des métriques (lignes HELP de l'export Prometheus)
+METRIC_HELP = {
+    'qcm_parse_seconds': "Durée d'extraction d'un document (parse_document)",
+    'qcm_documents_parsed_total': "Documents extraits",
+    'qcm_text_tokens_saved_total': "Tokens estimés retirés par la normalisation du texte PDF",
+    'qcm_api_call_seconds': "Durée d'un appel messages.create / messages.stream",
+    'qcm_api_calls_total': "Appels API réussis",
+    'qcm_api_errors_total': "Appels API en erreur (chaque tentative compte)",
+    'qcm_api_retries_total': "Nouvelles tentatives après une erreur transitoire",
+    'qcm_tokens_total': "Tokens facturés par type (input, output, cache_read, cache_creation)",
+    'qcm_images_sent_total': "Images envoyées à l'API",
+    'qcm_image_bytes_sent_total': "Octets d'images envoyés à l'API (base64)",
+    'qcm_json_parse_seconds': "Durée de nettoyage et parsing JSON des réponses",
+    'qcm_json_parse_errors_total': "Réponses au JSON invalide",
+    'qcm_pdf_export_seconds': "Durée d'un export PDF",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _TimerStats:
+    """Durées d'une série : nombre, somme, maximum et fenêtre récente pour les quantiles"""
+
+    WINDOW = 500
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=self.WINDOW)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        recent = sorted(self.recent)
+        return recent[min(len(recent) - 1, int(q * len(recent)))] if recent else 0.0
+
+
+class MetricsRegistry:
+    """Compteurs et chronomètres étiquetés (thread-safe)"""
+
+    QUANTILES = (0.5, 0.95)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._timers: Dict[str, Dict[LabelKey, _TimerStats]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._timers.setdefault(name, {}).setdefault(key, _TimerStats()).observe(seconds)
+
+    # ----- Lecture -----
+
+    def counter(self, name: str, **labels) -> float:
+        """Somme des séries du compteur dont les étiquettes contiennent `labels`"""
+        wanted = set(self._key(labels))
+        with self._lock:
+            return sum(value for key, value in self._counters.get(name, {}).items() if wanted <= set(key))
+
+    def timer(self, name: str, **labels) -> Dict[str, float]:
+        """Nombre, total, moyenne, p50, p95 et max des séries du chronomètre dont les étiquettes contiennent `labels`"""
+        wanted = set(self._key(labels))
+        merged = _TimerStats()
+        with self._lock:
+            for key, stats in self._timers.get(name, {}).items():
+                if wanted <= set(key):
+                    merged.count += stats.count
+                    merged.total += stats.total
+                    merged.max = max(merged.max, stats.max)
+                    merged.recent.extend(stats.recent)
+        return {
+            'count': merged.count,
+            'total': merged.total,
+            'avg': merged.total / merged.count if merged.count else 0.0,
+            'p50': merged.quantile(0.5),
+            'p95': merged.quantile(0.95),
+            'max': merged.max
+        }
+
+    def to_prometheus(self) -> str:
+        """Export au format texte Prometheus (compteurs et résumés avec quantiles)"""
+        def labels_text(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = key + extra
+            if not pairs:
+                return ""
+            escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+            return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{labels_text(key)} {value:g}")
+            for name in sorted(self._timers):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} summary")
+                for key, stats in sorted(self._timers[name].items()):
+                    for q in self.QUANTILES:
+                        lines.append(f"{name}{labels_text(key, (('quantile', str(q)),))} {stats.quantile(q):.6f}")
+                    lines.append(f"{name}_sum{labels_text(key)} {stats.total:.6f}")
+                    lines.append(f"{name}_count{labels_text(key)} {stats.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+
+
+_process_metrics = MetricsRegistry()
+# Registre de la session courante (posé par app.py à chaque exécution du script,
+# propagé aux threads de fond par copie du contexte)
+_session_metrics: contextvars.ContextVar[Optional[MetricsRegistry]] = contextvars.ContextVar(
+    "qcm_session_metrics", default=None
+)
+
+
+def get_metrics() -> MetricsRegistry:
+    """Retourne le registre de métriques du process (toutes sessions)"""
+    return _process_metrics
+
+
+def bind_session(registry: Optional[MetricsRegistry]) -> None:
+    """Lie le registre d'une session au contexte courant (et aux threads lancés avec son contexte)"""
+    _session_metrics.set(registry)
+
+
+def _registries():
+    session = _session_metrics.get()
+    return (_process_metrics,) if session is None else (_process_metrics, session)
+
+
+def increment(name: str, value: float = 1, **labels) -> None:
+    """Incrémente un compteur (process + session courante)"""
+    for registry in _registries():
+        registry.increment(name, value, **labels)
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Enregistre une durée (process + session courante)"""
+    for registry in _registries():
+        registry.observe(name, seconds, **labels)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Chronomètre le bloc (la durée est enregistrée même si le bloc lève une exception)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(name: str, **labels) -> Callable:
+    """Décorateur : chronomètre chaque appel de la fonction"""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_thread(target: Callable, name: Optional[str] = None) -> threading.Thread:
+    """Lance un thread démon qui hérite du contexte courant (registre de session compris)"""
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(target,), name=name, daemon=True)
+    thread.start()
+    return thread
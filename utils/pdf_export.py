@@ -11,135 +11,345 @@ from reportlab.platypus import (
     SimpleDocTemplate, Paragraph, Spacer, 
     PageBreak, Table, TableStyle
 )
+from reportlab.platypus.flowables import Flowable
 from reportlab.lib import colors
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+from itertools import islice
 from datetime import datetime
-from typing import List, Dict
+from types import MappingProxyType
+from typing import List, Dict, Iterator, Mapping, Optional, Tuple
 
+import fitz  # PyMuPDF (fusion des PDF partiels)
 
-class PDFExporter:
-    """Classe pour exporter les QCM en PDF"""
-    
-    @staticmethod
-    def create_qcm_pdf(questions: List[Dict], with_answers: bool = False) -> BytesIO:
-        """
-        Crée un PDF contenant les questions QCM
-        
-        Args:
-            questions: Liste des questions générées
-            with_answers: Si True, inclut les réponses et explications
-            
-        Returns:
-            BytesIO contenant le PDF
-        """
-        buffer = BytesIO()
-        
-        # Création du document
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=2*cm,
-            leftMargin=2*cm,
-            topMargin=2*cm,
-            bottomMargin=2*cm
-        )
-        
-        # Styles
-        styles = getSampleStyleSheet()
-        
-        title_style = ParagraphStyle(
+from utils.cache import get_export_cache
+from utils.metrics import timed
+
+
+def _build_styles() -> Mapping[str, ParagraphStyle]:
+    """Styles des exports, construits une seule fois à l'import du module"""
+    base = getSampleStyleSheet()
+    styles = {
+        'normal': base['Normal'],
+        'heading2': base['Heading2'],
+        'title': ParagraphStyle(
             'CustomTitle',
-            parent=styles['Heading1'],
+            parent=base['Heading1'],
             fontSize=18,
             textColor=colors.HexColor('#1f77b4'),
             spaceAfter=0.5*cm,
             alignment=TA_CENTER
-        )
-        
-        subtitle_style = ParagraphStyle(
+        ),
+        'subtitle': ParagraphStyle(
             'CustomSubtitle',
-            parent=styles['Normal'],
+            parent=base['Normal'],
             fontSize=10,
             textColor=colors.grey,
             spaceAfter=1*cm,
             alignment=TA_CENTER
-        )
-        
-        question_style = ParagraphStyle(
+        ),
+        'question': ParagraphStyle(
             'QuestionStyle',
-            parent=styles['Heading2'],
+            parent=base['Heading2'],
             fontSize=12,
             textColor=colors.HexColor('#2c3e50'),
             spaceAfter=0.3*cm,
             spaceBefore=0.5*cm
-        )
-        
-        option_style = ParagraphStyle(
+        ),
+        'option': ParagraphStyle(
             'OptionStyle',
-            parent=styles['Normal'],
+            parent=base['Normal'],
             fontSize=11,
             leftIndent=0.5*cm,
             spaceAfter=0.2*cm
-        )
-        
-        answer_style = ParagraphStyle(
+        ),
+        'answer': ParagraphStyle(
             'AnswerStyle',
-            parent=styles['Normal'],
+            parent=base['Normal'],
             fontSize=10,
             textColor=colors.HexColor('#27ae60'),
             leftIndent=0.5*cm,
             spaceAfter=0.2*cm,
             spaceBefore=0.3*cm
-        )
-        
-        explanation_style = ParagraphStyle(
+        ),
+        'explanation': ParagraphStyle(
             'ExplanationStyle',
-            parent=styles['Normal'],
+            parent=base['Normal'],
             fontSize=10,
             textColor=colors.HexColor('#34495e'),
             leftIndent=0.5*cm,
             spaceAfter=0.5*cm,
             spaceBefore=0.2*cm,
             backColor=colors.HexColor('#ecf0f1')
+        ),
+        'results_title': ParagraphStyle(
+            'Title',
+            parent=base['Heading1'],
+            fontSize=18,
+            textColor=colors.HexColor('#1f77b4'),
+            alignment=TA_CENTER
+        ),
+        'result_correct': ParagraphStyle(
+            'ResultCorrect',
+            parent=base['Normal'],
+            fontSize=11,
+            textColor=colors.green,
+            spaceAfter=0.2*cm
+        ),
+        'result_wrong': ParagraphStyle(
+            'ResultWrong',
+            parent=base['Normal'],
+            fontSize=11,
+            textColor=colors.red,
+            spaceAfter=0.2*cm
+        ),
+    }
+    return MappingProxyType(styles)
+
+
+# Registre partagé en lecture seule (ne pas modifier les styles : ils servent à tous les exports)
+STYLES = _build_styles()
+
+
+class _ChunkedStory(list):
+    """
+    Story ReportLab alimentée par morceaux depuis un itérateur de flowables
+
+    SimpleDocTemplate.build consomme la liste par l'avant (len, [0], del [0]) :
+    seuls `chunk_size` flowables sont matérialisés à la fois au lieu de tout le
+    document, et chaque suppression en tête reste en O(chunk_size).
+    """
+
+    def __init__(self, flowables: Iterator[Flowable], chunk_size: int):
+        super().__init__()
+        self._source = flowables
+        self._chunk_size = chunk_size
+        self._refill()
+
+    def _refill(self) -> None:
+        # Garder au moins chunk_size // 2 éléments d'avance (chaînes keepWithNext)
+        if self._source is not None and list.__len__(self) < self._chunk_size // 2:
+            self.extend(islice(self._source, self._chunk_size - list.__len__(self)))
+            if list.__len__(self) < self._chunk_size // 2:
+                self._source = None  # Itérateur épuisé
+
+    def __len__(self) -> int:
+        self._refill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._refill()
+        return list.__getitem__(self, index)
+
+
+class PDFExporter:
+    """Classe pour exporter les QCM en PDF"""
+    
+    EXPORT_KINDS = ("vierge", "corrige", "resultats")
+    BULK_THRESHOLD = 200  # Questions à partir desquelles la story est générée par morceaux
+    BULK_CHUNK_SIZE = 64  # Flowables matérialisés à la fois en mode morceaux
+    SHARD_QUESTIONS = 240  # Questions par PDF partiel (multiple de 3 : un partiel commence sur une nouvelle page)
+    SHARD_MIN_QUESTIONS = 600  # En dessous, le rendu séquentiel est plus rapide que pool + fusion
+    SHARD_WORKERS = min(4, os.cpu_count() or 1)
+    PAGE_MARGIN = 2*cm
+    
+    @staticmethod
+    def export_key(kind: str, questions: List[Dict], all_results: Optional[List[Dict]] = None,
+                   summary: Optional[str] = None) -> str:
+        """
+        Empreinte du contenu d'un export : même contenu = même PDF
+        (les questions pour les QCM, résultats + récapitulatif pour les résultats)
+        """
+        if kind not in PDFExporter.EXPORT_KINDS:
+            raise ValueError(f"Export inconnu : {kind}")
+        content = {'results': all_results, 'summary': summary} if kind == "resultats" else {'questions': questions}
+        payload = json.dumps([kind, content], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def is_exported(kind: str, questions: List[Dict], all_results: Optional[List[Dict]] = None,
+                    summary: Optional[str] = None) -> bool:
+        """True si le PDF est déjà en cache (téléchargement immédiat)"""
+        return PDFExporter.export_key(kind, questions, all_results, summary) in get_export_cache()
+    
+    @staticmethod
+    def export(kind: str, questions: List[Dict], all_results: Optional[List[Dict]] = None,
+               summary: Optional[str] = None) -> bytes:
+        """
+        Rend un export à la demande, mémorisé par contenu et partagé entre sessions
+        
+        Args:
+            kind: "vierge", "corrige" ou "resultats"
+            questions: Questions du QCM
+            all_results: Résultats (export "resultats")
+            summary: Récapitulatif (export "resultats")
+            
+        Returns:
+            Bytes du PDF
+        """
+        cache = get_export_cache()
+        key = PDFExporter.export_key(kind, questions, all_results, summary)
+        data = cache.get(key)
+        if data is None:
+            if kind == "resultats":
+                buffer = PDFExporter.create_results_pdf(all_results, summary)
+            else:
+                buffer = PDFExporter.create_qcm_pdf(questions, with_answers=(kind == "corrige"))
+            data = buffer.getvalue()
+            cache.set(key, data)
+        return data
+    
+    @staticmethod
+    def _new_document(buffer: BytesIO) -> SimpleDocTemplate:
+        return SimpleDocTemplate(
+            buffer,
+            pagesize=A4,
+            rightMargin=PDFExporter.PAGE_MARGIN,
+            leftMargin=PDFExporter.PAGE_MARGIN,
+            topMargin=PDFExporter.PAGE_MARGIN,
+            bottomMargin=PDFExporter.PAGE_MARGIN
         )
+    
+    @staticmethod
+    def _build(doc: SimpleDocTemplate, flowables: Iterator[Flowable], count: int, bulk: Optional[bool]) -> None:
+        """
+        Construit le document ; au-delà de BULK_THRESHOLD questions (ou si bulk=True)
+        la story est produite par morceaux pour garder une mémoire plate
+        """
+        if bulk is None:
+            bulk = count >= PDFExporter.BULK_THRESHOLD
+        story = _ChunkedStory(flowables, PDFExporter.BULK_CHUNK_SIZE) if bulk else list(flowables)
+        doc.build(story)
+    
+    @staticmethod
+    @timed("qcm_pdf_export_seconds", export="qcm")
+    def create_qcm_pdf(questions: List[Dict], with_answers: bool = False, bulk: Optional[bool] = None) -> BytesIO:
+        """
+        Crée un PDF contenant les questions QCM
         
-        # Contenu du document
-        story = []
+        Args:
+            questions: Liste des questions générées
+            with_answers: Si True, inclut les réponses et explications
+            bulk: Story générée par morceaux (None = automatique selon le nombre de questions)
+            
+        Returns:
+            BytesIO contenant le PDF
+        """
+        buffer = BytesIO()
         
-        # En-tête
-        story.append(Paragraph("QCM Médical - EDN", title_style))
-        story.append(Paragraph(
-            f"Généré le {datetime.now().strftime('%d/%m/%Y à %H:%M')}",
-            subtitle_style
-        ))
-        story.append(Spacer(1, 0.5*cm))
+        # Création du document
+        doc = PDFExporter._new_document(buffer)
+        PDFExporter._build(doc, PDFExporter.iter_qcm_flowables(questions, with_answers, doc.width),
+                           len(questions), bulk)
+        buffer.seek(0)
+        
+        return buffer
+    
+    @staticmethod
+    @timed("qcm_pdf_export_seconds", export="qcm_sharded")
+    def create_qcm_pdf_sharded(questions: List[Dict], with_answers: bool = False,
+                               workers: Optional[int] = None) -> BytesIO:
+        """
+        Variante parallèle de create_qcm_pdf pour les grandes banques de questions
         
-        # Informations
-        if with_answers:
-            info_text = "<b>Version avec corrigé</b> - Document de révision"
-        else:
-            info_text = "<b>Version vierge</b> - À compléter"
-        story.append(Paragraph(info_text, styles['Normal']))
-        story.append(Spacer(1, 0.5*cm))
+        Les questions sont découpées en plages contiguës de SHARD_QUESTIONS, rendues
+        par un pool de processus puis fusionnées avec PyMuPDF. Les plages tombent sur
+        les sauts de page (toutes les 3 questions) : numérotation, mise en page,
+        date d'en-tête et pied de page final sont ceux du rendu séquentiel.
+        
+        Args:
+            questions: Liste des questions
+            with_answers: Si True, inclut les réponses et explications
+            workers: Processus de rendu (défaut SHARD_WORKERS)
+            
+        Returns:
+            BytesIO contenant le PDF
+        """
+        workers = workers or PDFExporter.SHARD_WORKERS
+        if len(questions) < PDFExporter.SHARD_MIN_QUESTIONS or workers <= 1:
+            return PDFExporter.create_qcm_pdf(questions, with_answers)
+        
+        total = len(questions)
+        size = PDFExporter.SHARD_QUESTIONS
+        generated_at = datetime.now()  # Une seule date pour tous les partiels
+        shards = [
+            (questions[start:start + size], with_answers, start + 1, total, generated_at)
+            for start in range(0, total, size)
+        ]
+        
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+                parts = list(executor.map(_render_qcm_shard, shards))
+        except Exception as e:
+            print(f"⚠️ Rendu parallèle impossible, rendu séquentiel: {e}")
+            return PDFExporter.create_qcm_pdf(questions, with_answers)
+        
+        merged = fitz.open()
+        for part in parts:
+            with fitz.open(stream=part, filetype="pdf") as shard_doc:
+                if merged.page_count == 0:
+                    merged.set_metadata(shard_doc.metadata)
+                merged.insert_pdf(shard_doc)
+        # garbage=3 : polices et ressources identiques des partiels fusionnées
+        buffer = BytesIO(merged.tobytes(garbage=3, deflate=True))
+        merged.close()
+        return buffer
+    
+    @staticmethod
+    def iter_qcm_flowables(questions: List[Dict], with_answers: bool, width: float, start: int = 1,
+                           total: Optional[int] = None,
+                           generated_at: Optional[datetime] = None) -> Iterator[Flowable]:
+        """
+        Produit les flowables du QCM un à un (en-tête, questions, pied de page)
+        
+        Args:
+            questions: Questions à rendre (toutes, ou une plage pour un rendu partiel)
+            with_answers: Si True, inclut les réponses et explications
+            width: Largeur utile de la page
+            start: Numéro de la première question (l'en-tête n'est produit que pour 1)
+            total: Nombre total de questions du QCM (le pied de page suit la dernière)
+            generated_at: Date affichée en en-tête (défaut : maintenant)
+        """
+        total = total if total is not None else start - 1 + len(questions)
         
-        # Ligne de séparation
-        line_data = [['', '']]
-        line_table = Table(line_data, colWidths=[doc.width])
-        line_table.setStyle(TableStyle([
-            ('LINEBELOW', (0, 0), (-1, -1), 2, colors.HexColor('#1f77b4')),
-        ]))
-        story.append(line_table)
-        story.append(Spacer(1, 0.5*cm))
+        if start == 1:
+            # En-tête
+            yield Paragraph("QCM Médical - EDN", STYLES['title'])
+            yield Paragraph(
+                f"Généré le {(generated_at or datetime.now()).strftime('%d/%m/%Y à %H:%M')}",
+                STYLES['subtitle']
+            )
+            yield Spacer(1, 0.5*cm)
+            
+            # Informations
+            if with_answers:
+                info_text = "<b>Version avec corrigé</b> - Document de révision"
+            else:
+                info_text = "<b>Version vierge</b> - À compléter"
+            yield Paragraph(info_text, STYLES['normal'])
+            yield Spacer(1, 0.5*cm)
+            
+            # Ligne de séparation
+            line_data = [['', '']]
+            line_table = Table(line_data, colWidths=[width])
+            line_table.setStyle(TableStyle([
+                ('LINEBELOW', (0, 0), (-1, -1), 2, colors.HexColor('#1f77b4')),
+            ]))
+            yield line_table
+            yield Spacer(1, 0.5*cm)
         
         # Questions
-        for i, q in enumerate(questions, 1):
+        for i, q in enumerate(questions, start):
             # Numéro et question
-            story.append(Paragraph(
+            yield Paragraph(
                 f"<b>Question {i}</b>",
-                question_style
-            ))
-            story.append(Paragraph(q['question'], styles['Normal']))
-            story.append(Spacer(1, 0.3*cm))
+                STYLES['question']
+            )
+            yield Paragraph(q['question'], STYLES['normal'])
+            yield Spacer(1, 0.3*cm)
             
             # Options
             for j, option in enumerate(q['options']):
@@ -151,124 +361,108 @@ class PDFExporter:
                 else:
                     option_text = f"{checkbox} {option}"
                 
-                story.append(Paragraph(option_text, option_style))
+                yield Paragraph(option_text, STYLES['option'])
             
             # Réponses et explications (si demandé)
             if with_answers:
-                story.append(Spacer(1, 0.3*cm))
+                yield Spacer(1, 0.3*cm)
                 
                 correct_options = [q['options'][idx] for idx in q['correct_answers']]
                 answer_text = f"<b>✓ Réponse(s) correcte(s) :</b> {', '.join(correct_options)}"
-                story.append(Paragraph(answer_text, answer_style))
+                yield Paragraph(answer_text, STYLES['answer'])
                 
                 explanation_text = f"<b>💡 Explication :</b><br/>{q.get('explanation', 'Non disponible')}"
-                story.append(Paragraph(explanation_text, explanation_style))
+                yield Paragraph(explanation_text, STYLES['explanation'])
             
-            story.append(Spacer(1, 0.7*cm))
+            yield Spacer(1, 0.7*cm)
             
             # Saut de page toutes les 3 questions (sauf dernière)
-            if i % 3 == 0 and i < len(questions):
-                story.append(PageBreak())
-        
-        # Pied de page
-        story.append(Spacer(1, 1*cm))
-        footer_text = "QCM généré par Claude Haiku 4.5 - Application QCM Médical"
-        story.append(Paragraph(footer_text, subtitle_style))
+            if i % 3 == 0 and i < total:
+                yield PageBreak()
         
-        # Construction du PDF
-        doc.build(story)
-        buffer.seek(0)
-        
-        return buffer
+        if start - 1 + len(questions) == total:
+            # Pied de page
+            yield Spacer(1, 1*cm)
+            footer_text = "QCM généré par Claude Haiku 4.5 - Application QCM Médical"
+            yield Paragraph(footer_text, STYLES['subtitle'])
     
     @staticmethod
-    def create_results_pdf(all_results: List[Dict], summary: str) -> BytesIO:
+    @timed("qcm_pdf_export_seconds", export="results")
+    def create_results_pdf(all_results: List[Dict], summary: str, bulk: Optional[bool] = None) -> BytesIO:
         """
         Crée un PDF avec les résultats du QCM complété
         
         Args:
             all_results: Liste des résultats complets
             summary: Récapitulatif textuel généré par Claude
+            bulk: Story générée par morceaux (None = automatique selon le nombre de résultats)
             
         Returns:
             BytesIO contenant le PDF
         """
         buffer = BytesIO()
         
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=2*cm,
-            leftMargin=2*cm,
-            topMargin=2*cm,
-            bottomMargin=2*cm
-        )
-        
-        styles = getSampleStyleSheet()
-        story = []
+        doc = PDFExporter._new_document(buffer)
+        PDFExporter._build(doc, PDFExporter.iter_results_flowables(all_results, summary), len(all_results), bulk)
+        buffer.seek(0)
         
+        return buffer
+    
+    @staticmethod
+    def iter_results_flowables(all_results: List[Dict], summary: str) -> Iterator[Flowable]:
+        """Produit les flowables du PDF de résultats un à un"""
         # En-tête
-        title_style = ParagraphStyle(
-            'Title',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#1f77b4'),
-            alignment=TA_CENTER
-        )
-        
-        story.append(Paragraph("Résultats du QCM", title_style))
-        story.append(Paragraph(
+        yield Paragraph("Résultats du QCM", STYLES['results_title'])
+        yield Paragraph(
             f"Session du {datetime.now().strftime('%d/%m/%Y à %H:%M')}",
-            styles['Normal']
-        ))
-        story.append(Spacer(1, 1*cm))
+            STYLES['normal']
+        )
+        yield Spacer(1, 1*cm)
         
         # Score global
         total = len(all_results)
         perfect = sum(1 for r in all_results if set(r['user_answers']) == set(r['correct_answers']))
         score_text = f"<b>Score : {perfect}/{total} ({int(perfect/total*100)}%)</b>"
-        story.append(Paragraph(score_text, styles['Heading2']))
-        story.append(Spacer(1, 0.5*cm))
+        yield Paragraph(score_text, STYLES['heading2'])
+        yield Spacer(1, 0.5*cm)
         
         # Récapitulatif
-        story.append(Paragraph("<b>Récapitulatif personnalisé</b>", styles['Heading2']))
+        yield Paragraph("<b>Récapitulatif personnalisé</b>", STYLES['heading2'])
         for line in summary.split('\n'):
             if line.strip():
-                story.append(Paragraph(line, styles['Normal']))
+                yield Paragraph(line, STYLES['normal'])
         
-        story.append(PageBreak())
+        yield PageBreak()
         
         # Détail des réponses
-        story.append(Paragraph("<b>Détail des réponses</b>", styles['Heading2']))
-        story.append(Spacer(1, 0.5*cm))
+        yield Paragraph("<b>Détail des réponses</b>", STYLES['heading2'])
+        yield Spacer(1, 0.5*cm)
         
         for i, result in enumerate(all_results, 1):
             is_correct = set(result['user_answers']) == set(result['correct_answers'])
             
             # Question
-            q_style = ParagraphStyle(
-                'Q',
-                parent=styles['Normal'],
-                fontSize=11,
-                textColor=colors.green if is_correct else colors.red,
-                spaceAfter=0.2*cm
-            )
-            
             status = "✓" if is_correct else "✗"
-            story.append(Paragraph(f"<b>{status} Question {i} :</b> {result['question']}", q_style))
+            yield Paragraph(f"<b>{status} Question {i} :</b> {result['question']}",
+                            STYLES['result_correct' if is_correct else 'result_wrong'])
             
             # Réponses
-            story.append(Paragraph(
+            yield Paragraph(
                 f"Vos réponses : {', '.join([result['options'][j] for j in result['user_answers']]) or 'Aucune'}",
-                styles['Normal']
-            ))
-            story.append(Paragraph(
+                STYLES['normal']
+            )
+            yield Paragraph(
                 f"Réponses attendues : {', '.join([result['options'][j] for j in result['correct_answers']])}",
-                styles['Normal']
-            ))
-            story.append(Spacer(1, 0.5*cm))
-        
-        doc.build(story)
-        buffer.seek(0)
-        
-        return buffer
+                STYLES['normal']
+            )
+            yield Spacer(1, 0.5*cm)
+
+
+def _render_qcm_shard(shard: Tuple[List[Dict], bool, int, int, datetime]) -> bytes:
+    """Rend une plage de questions dans un worker (niveau module pour être picklable)"""
+    questions, with_answers, start, total, generated_at = shard
+    buffer = BytesIO()
+    doc = PDFExporter._new_document(buffer)
+    flowables = PDFExporter.iter_qcm_flowables(questions, with_answers, doc.width, start, total, generated_at)
+    PDFExporter._build(doc, flowables, len(questions), None)
+    return buffer.getvalue()
@@ -0,0 +1,206 @@
+"""
+Module de banque de questions persistante (SQLite)
+Conserve chaque question générée par document et niveau, pour servir un
+nouveau QCM instantanément à partir des questions pas encore vues
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+
+class QuestionBank:
+    """
+    Banque de questions SQLite, partagée par toutes les sessions du process
+
+    - questions : une ligne par question (hash du document, niveau, modèle, date)
+    - questions_fts : index plein texte (FTS5) sur l'énoncé
+    - seen : questions déjà proposées à un utilisateur (empreinte de sa clé API)
+    """
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "qcm-medical", "questions.sqlite3")
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY,
+        question_hash TEXT NOT NULL UNIQUE,
+        document_hash TEXT NOT NULL,
+        difficulty TEXT NOT NULL,
+        model TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        question_text TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_questions_document
+        ON questions (document_hash, difficulty, created_at);
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+        question_text, content='questions', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN
+        INSERT INTO questions_fts (rowid, question_text) VALUES (new.id, new.question_text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN
+        INSERT INTO questions_fts (questions_fts, rowid, question_text)
+        VALUES ('delete', old.id, old.question_text);
+    END;
+
+    CREATE TABLE IF NOT EXISTS seen (
+        user_key TEXT NOT NULL,
+        question_hash TEXT NOT NULL,
+        seen_at REAL NOT NULL,
+        PRIMARY KEY (user_key, question_hash)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Args:
+            db_path: Fichier SQLite (None = QCM_BANK_PATH ou ~/.cache/qcm-medical/questions.sqlite3)
+        """
+        self.db_path = db_path or os.environ.get("QCM_BANK_PATH") or self.DEFAULT_PATH
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    # ----- Clés -----
+
+    @staticmethod
+    def document_key(text: str) -> str:
+        """Empreinte du document (texte extrait)"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def user_key(api_key: str) -> str:
+        """Empreinte de l'utilisateur (la clé API elle-même n'est jamais stockée)"""
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def question_key(document_hash: str, question: Dict) -> str:
+        """Empreinte d'une question : même énoncé et mêmes propositions = même question"""
+        payload = json.dumps([document_hash, question['question'], question['options']], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    # ----- Écriture -----
+
+    def add_questions(self, document_hash: str, difficulty: str, model: str, questions: List[Dict]) -> int:
+        """
+        Enregistre des questions (les doublons exacts sont ignorés)
+
+        Returns:
+            Nombre de questions réellement ajoutées
+        """
+        now = time.time()
+        rows = [
+            (
+                self.question_key(document_hash, question), document_hash, difficulty, model, now,
+                question['question'], json.dumps(question, ensure_ascii=False)
+            )
+            for question in questions
+            if question.get('question') and question.get('options')
+        ]
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO questions "
+                "(question_hash, document_hash, difficulty, model, created_at, question_text, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return cursor.rowcount
+
+    def mark_seen(self, user_key: str, document_hash: str, questions: List[Dict]) -> None:
+        """Marque des questions comme déjà proposées à cet utilisateur"""
+        now = time.time()
+        rows = [(user_key, self.question_key(document_hash, question), now) for question in questions]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO seen (user_key, question_hash, seen_at) VALUES (?, ?, ?)", rows)
+
+    # ----- Lecture -----
+
+    def sample_unseen(self, document_hash: str, difficulty: str, user_key: str, count: int) -> List[Dict]:
+        """Tire au hasard jusqu'à `count` questions jamais proposées à cet utilisateur"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM questions q "
+                "WHERE q.document_hash = ? AND q.difficulty = ? "
+                "AND NOT EXISTS (SELECT 1 FROM seen s WHERE s.user_key = ? AND s.question_hash = q.question_hash) "
+                "ORDER BY random() LIMIT ?",
+                (document_hash, difficulty, user_key, count)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def count_unseen(self, document_hash: str, difficulty: str, user_key: str) -> int:
+        """Nombre de questions disponibles et jamais proposées à cet utilisateur"""
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM questions q "
+                "WHERE q.document_hash = ? AND q.difficulty = ? "
+                "AND NOT EXISTS (SELECT 1 FROM seen s WHERE s.user_key = ? AND s.question_hash = q.question_hash)",
+                (document_hash, difficulty, user_key)
+            ).fetchone()
+        return count
+
+    def count(self, document_hash: Optional[str] = None, difficulty: Optional[str] = None) -> int:
+        """Nombre de questions en banque (pour un document / niveau, ou au total)"""
+        query = "SELECT COUNT(*) FROM questions WHERE 1 = 1"
+        params = []
+        if document_hash is not None:
+            query += " AND document_hash = ?"
+            params.append(document_hash)
+        if difficulty is not None:
+            query += " AND difficulty = ?"
+            params.append(difficulty)
+        with self._lock:
+            (count,) = self._conn.execute(query, params).fetchone()
+        return count
+
+    def search(self, query: str, document_hash: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """
+        Recherche plein texte (FTS5) dans les énoncés : questions contenant tous
+        les termes, les plus pertinentes d'abord
+
+        Args:
+            query: Termes recherchés (ex: "insuffisance cardiaque")
+            document_hash: Restreindre à un document
+            limit: Nombre maximum de résultats
+        """
+        # Chaque terme entre guillemets : la ponctuation de l'utilisateur n'est pas interprétée
+        terms = " ".join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+        if not terms:
+            return []
+        sql = ("SELECT q.data FROM questions_fts f JOIN questions q ON q.id = f.rowid "
+               "WHERE questions_fts MATCH ?")
+        params = [terms]
+        if document_hash is not None:
+            sql += " AND q.document_hash = ?"
+            params.append(document_hash)
+        sql += " ORDER BY bm25(questions_fts) LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_question_bank = None
+_question_bank_lock = threading.Lock()
+
+
+def get_question_bank() -> QuestionBank:
+    """Retourne la banque de questions partagée par le process"""
+    global _question_bank
+    with _question_bank_lock:
+        if _question_bank is None:
+            _question_bank = QuestionBank()
+        return _question_bank
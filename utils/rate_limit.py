@@ -0,0 +1,338 @@
+"""
+Module de limitation de débit des appels à l'API Claude
+Token bucket (requêtes/min et tokens/min) partagé par le process, créneaux de
+concurrence par priorité (utils.scheduler) et nouvelles tentatives avec backoff
+exponentiel (retry-after respecté)
+"""
+
+import time
+import random
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import anthropic
+
+from utils import metrics
+from utils.scheduler import PriorityScheduler, BULK, PRIORITIES
+
+
+class TokenBucket:
+    """
+    Seau à jetons thread-safe, rechargé en continu à `rate_per_minute`
+
+    Les jetons ne sont pris que lorsque le solde suffit : aucune dette n'est
+    laissée aux demandes suivantes. L'ordre de service (priorité puis arrivée)
+    est décidé par RateLimiter.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: Jetons ajoutés par minute
+            capacity: Solde maximal (rafale autorisée, défaut = rate_per_minute)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, amount: float) -> None:
+        """Retire `amount` jetons (à appeler quand estimate_wait(amount) vaut 0)"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+
+    def estimate_wait(self, amount: float) -> float:
+        """Attente avant que le solde couvre `amount` jetons, sans rien prendre"""
+        # Une demande plus grosse que le seau ne doit pas attendre indéfiniment
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (amount - self._tokens) / self.rate)
+
+    def penalize(self, seconds: float) -> None:
+        """Vide le seau pour `seconds` secondes (après un 429 : toute la file ralentit)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class RateLimiter:
+    """
+    Limiteur partagé devant chaque appel messages.create / messages.stream
+
+    - Deux seaux : requêtes par minute et tokens (estimés) par minute, servis par
+      priorité puis par ordre d'arrivée (un feedback passe devant les générations
+      en attente de tokens)
+    - Plafond d'appels simultanés, réparti par classe de priorité (PriorityScheduler)
+    - Erreurs transitoires (429, 5xx/529 surcharge, réseau) : nouvelles tentatives
+      avec backoff exponentiel à jitter complet, ou délai retry-after si fourni
+    """
+
+    REQUESTS_PER_MINUTE = 50
+    TOKENS_PER_MINUTE = 100000
+    MAX_CONCURRENCY = 8
+    MAX_RETRIES = 4
+    BASE_DELAY = 1.0  # Secondes (doublé à chaque tentative)
+    MAX_DELAY = 30.0
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, max_retries: Optional[int] = None,
+                 reservations: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            requests_per_minute: Débit de requêtes (défaut REQUESTS_PER_MINUTE)
+            tokens_per_minute: Débit de tokens d'entrée estimés (défaut TOKENS_PER_MINUTE)
+            max_concurrency: Appels simultanés max (défaut MAX_CONCURRENCY)
+            max_retries: Nouvelles tentatives sur erreur transitoire (défaut MAX_RETRIES)
+            reservations: Créneaux réservés par classe de priorité (voir PriorityScheduler)
+        """
+        self.requests = TokenBucket(requests_per_minute or self.REQUESTS_PER_MINUTE)
+        self.tokens = TokenBucket(tokens_per_minute or self.TOKENS_PER_MINUTE)
+        self.max_concurrency = max_concurrency or self.MAX_CONCURRENCY
+        self.max_retries = max_retries if max_retries is not None else self.MAX_RETRIES
+        self.scheduler = PriorityScheduler(self.max_concurrency, reservations)
+        self._lock = threading.Lock()
+        self._admission = threading.Condition()
+        self._admission_queue = {}  # ticket -> priorité des demandes en attente de débit
+        self._tickets = itertools.count()
+        self.waiting = 0  # Requêtes actuellement en file
+        self.total_wait = 0.0
+        self.waited_calls = 0
+        self.calls = 0
+        self.retries = 0
+
+    # ----- Attente d'un créneau -----
+
+    def estimate_wait(self, estimated_tokens: int = 0) -> float:
+        """Attente prévisible (secondes) pour une requête lancée maintenant"""
+        return max(self.requests.estimate_wait(1), self.tokens.estimate_wait(estimated_tokens))
+
+    def _try_admit(self, ticket: int, estimated_tokens: int) -> Optional[float]:
+        """
+        Prend les jetons si la demande est la première de la file et que les seaux suffisent
+        (verrou d'admission pris)
+
+        Returns:
+            0 si la demande est admise, l'attente avant un nouvel essai (secondes)
+            si elle est en tête, None si une demande plus prioritaire ou plus ancienne passe avant
+        """
+        rank = (self._admission_queue[ticket], ticket)
+        if min((priority, other) for other, priority in self._admission_queue.items()) != rank:
+            return None
+        wait = self.estimate_wait(estimated_tokens)
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(estimated_tokens)
+        del self._admission_queue[ticket]
+        self._admission.notify_all()
+        return 0.0
+
+    def _enqueue(self, priority_class: str) -> int:
+        if priority_class not in PRIORITIES:
+            raise ValueError(f"Classe de priorité inconnue : {priority_class}")
+        with self._admission:
+            ticket = next(self._tickets)
+            self._admission_queue[ticket] = PRIORITIES[priority_class]
+        return ticket
+
+    def _dequeue(self, ticket: int) -> None:
+        with self._admission:
+            if self._admission_queue.pop(ticket, None) is not None:
+                self._admission.notify_all()
+
+    def _admit(self, estimated_tokens: int, on_wait: Optional[Callable[[float], None]],
+               priority_class: str) -> None:
+        """Attend que les seaux couvrent la demande, dans l'ordre des priorités"""
+        ticket = self._enqueue(priority_class)
+        try:
+            announced = on_wait is None
+            while True:
+                with self._admission:
+                    wait = self._try_admit(ticket, estimated_tokens)
+                    if wait == 0:
+                        return
+                    if announced:
+                        # Réveillé par la sortie de la tête de file, ou quand les seaux sont rechargés
+                        self._admission.wait(wait)
+                        continue
+                announced = True
+                on_wait(wait if wait is not None else self.estimate_wait(estimated_tokens))
+        finally:
+            self._dequeue(ticket)
+
+    async def _aadmit(self, estimated_tokens: int, on_wait: Optional[Callable[[float], None]],
+                      priority_class: str, poll_interval: float = 0.02) -> None:
+        """Variante asynchrone de _admit (attente par sondage, aucun thread bloqué)"""
+        ticket = self._enqueue(priority_class)
+        try:
+            announced = on_wait is None
+            while True:
+                with self._admission:
+                    wait = self._try_admit(ticket, estimated_tokens)
+                if wait == 0:
+                    return
+                if not announced:
+                    announced = True
+                    on_wait(wait if wait is not None else self.estimate_wait(estimated_tokens))
+                await asyncio.sleep(min(wait, poll_interval * 10) if wait else poll_interval)
+        finally:
+            self._dequeue(ticket)
+
+    def _record_wait(self, waited: float) -> None:
+        with self._lock:
+            self.calls += 1
+            if waited > 0.01:
+                self.waited_calls += 1
+                self.total_wait += waited
+
+    @contextmanager
+    def slot(self, estimated_tokens: int = 0, on_wait: Optional[Callable[[float], None]] = None,
+             priority_class: str = BULK):
+        """
+        Attend un créneau (débit + concurrence) puis le garde pendant l'appel
+
+        Args:
+            estimated_tokens: Tokens d'entrée estimés de la requête
+            on_wait: Appelé avec l'attente prévue (secondes) si la requête est mise en file
+            priority_class: Classe de priorité (utils.scheduler.INTERACTIVE ou BULK)
+
+        Yields:
+            Attente effective en secondes
+        """
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            self._admit(estimated_tokens, on_wait, priority_class)
+            self.scheduler.acquire(priority_class)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        waited = time.monotonic() - started
+        self._record_wait(waited)
+        try:
+            yield waited
+        finally:
+            self.scheduler.release(priority_class)
+
+    async def _aacquire(self, estimated_tokens: int, on_wait: Optional[Callable[[float], None]],
+                        priority_class: str) -> float:
+        """Équivalent asynchrone de l'entrée de slot (aucun thread bloqué pendant l'attente)"""
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            await self._aadmit(estimated_tokens, on_wait, priority_class)
+            await self.scheduler.aacquire(priority_class)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        waited = time.monotonic() - started
+        self._record_wait(waited)
+        return waited
+
+    # ----- Nouvelles tentatives -----
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """Erreur transitoire : limite de débit, surcharge/erreur serveur, réseau"""
+        if isinstance(error, (anthropic.RateLimitError, anthropic.APIConnectionError)):
+            return True
+        if isinstance(error, anthropic.APIStatusError):
+            return error.status_code in (408, 409, 429) or error.status_code >= 500
+        return False
+
+    def retry_delay(self, error: Exception, attempt: int) -> float:
+        """Délai avant la tentative suivante : retry-after si fourni, sinon backoff à jitter complet"""
+        response = getattr(error, 'response', None)
+        if response is not None:
+            retry_after = response.headers.get('retry-after')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.MAX_DELAY)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.MAX_DELAY, self.BASE_DELAY * 2 ** attempt))
+
+    def backoff(self, error: Exception, attempt: int) -> float:
+        """Compte une nouvelle tentative et retourne le délai à attendre avant de la lancer"""
+        delay = self.retry_delay(error, attempt)
+        with self._lock:
+            self.retries += 1
+        metrics.increment("qcm_api_retries_total", error=type(error).__name__)
+        if isinstance(error, anthropic.RateLimitError):
+            # Limite atteinte côté API : toute la file ralentit, pas seulement cette requête
+            self.requests.penalize(delay)
+        print(f"⚠️ Appel Claude refusé ({type(error).__name__}), nouvel essai dans {delay:.1f} s")
+        return delay
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int = 0,
+             on_wait: Optional[Callable[[float], None]] = None, priority_class: str = BULK) -> Any:
+        """
+        Exécute fn() dans un créneau, avec nouvelles tentatives sur erreur transitoire
+
+        Raises:
+            La dernière erreur si toutes les tentatives échouent (ou si elle n'est pas transitoire)
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.slot(estimated_tokens, on_wait, priority_class):
+                    return fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                time.sleep(self.backoff(e, attempt))
+                attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int = 0,
+                    on_wait: Optional[Callable[[float], None]] = None, priority_class: str = BULK) -> Any:
+        """Variante asynchrone de call (fn retourne une coroutine)"""
+        attempt = 0
+        while True:
+            await self._aacquire(estimated_tokens, on_wait, priority_class)
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                delay = self.backoff(e, attempt)
+            finally:
+                self.scheduler.release(priority_class)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Compteurs de la file d'attente"""
+        with self._lock:
+            return {
+                'waiting': self.waiting,
+                'calls': self.calls,
+                'waited_calls': self.waited_calls,
+                'avg_wait': self.total_wait / self.waited_calls if self.waited_calls else 0.0,
+                'retries': self.retries
+            }
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Retourne le limiteur partagé par le process (tous les appels, toutes les sessions)"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
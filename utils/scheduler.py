@@ -0,0 +1,206 @@
+"""
+Module d'ordonnancement des appels à l'API Claude
+Classes de priorité avec créneaux réservés : le feedback interactif n'attend
+pas derrière les longues générations de QCM
+"""
+
+import time
+import asyncio
+import threading
+import itertools
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+# Classes de priorité (la plus petite valeur est servie en premier)
+INTERACTIVE = "interactive"  # Feedback, récapitulatif : l'étudiant attend la réponse
+BULK = "bulk"  # Génération de QCM : longue, déjà présentée progressivement
+
+PRIORITIES = {INTERACTIVE: 0, BULK: 1}
+
+
+class PriorityScheduler:
+    """
+    Répartit `max_concurrency` créneaux d'appel entre classes de priorité
+
+    - Chaque classe dispose de créneaux réservés que les autres ne peuvent pas prendre
+    - Les créneaux non réservés sont partagés
+    - À la libération d'un créneau, la demande en attente la plus prioritaire
+      (puis la plus ancienne) parmi celles qui peuvent démarrer est servie
+    """
+
+    def __init__(self, max_concurrency: int, reservations: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            max_concurrency: Appels simultanés max, toutes classes confondues
+            reservations: Créneaux réservés par classe (défaut : 2 pour interactive, 1 pour bulk)
+        """
+        self.max_concurrency = max_concurrency
+        self.reservations = reservations if reservations is not None else {INTERACTIVE: 2, BULK: 1}
+        if sum(self.reservations.values()) > max_concurrency:
+            raise ValueError("Les créneaux réservés dépassent la concurrence maximale")
+        self._condition = threading.Condition()
+        self._running = {name: 0 for name in PRIORITIES}
+        self._waiters = {}  # ticket -> (priorité, classe, début de l'attente)
+        self._tickets = itertools.count()
+        self._metrics = {name: _ClassMetrics() for name in PRIORITIES}
+
+    # ----- Règles d'admission (verrou pris) -----
+
+    def _shared_free(self) -> int:
+        """Créneaux partagés encore libres"""
+        shared_used = sum(max(0, self._running[name] - self.reservations.get(name, 0)) for name in self._running)
+        return self.max_concurrency - sum(self.reservations.values()) - shared_used
+
+    def _can_start(self, priority_class: str) -> bool:
+        if self._running[priority_class] < self.reservations.get(priority_class, 0):
+            return True
+        return self._shared_free() > 0
+
+    def _is_next(self, ticket: int) -> bool:
+        """True si ticket est la demande prioritaire parmi celles qui peuvent démarrer"""
+        priority, priority_class, _ = self._waiters[ticket]
+        if not self._can_start(priority_class):
+            return False
+        rank = (priority, ticket)
+        return all(
+            (other_priority, other) >= rank
+            for other, (other_priority, other_class, _) in self._waiters.items()
+            if other != ticket and self._can_start(other_class)
+        )
+
+    # ----- Acquisition / libération -----
+
+    def _enqueue(self, priority_class: str) -> int:
+        if priority_class not in PRIORITIES:
+            raise ValueError(f"Classe de priorité inconnue : {priority_class}")
+        with self._condition:
+            ticket = next(self._tickets)
+            self._waiters[ticket] = (PRIORITIES[priority_class], priority_class, time.monotonic())
+            return ticket
+
+    def _try_start(self, ticket: int) -> Optional[float]:
+        """Démarre la demande si c'est son tour (verrou pris) ; retourne l'attente subie"""
+        if not self._is_next(ticket):
+            return None
+        _, priority_class, started = self._waiters.pop(ticket)
+        self._running[priority_class] += 1
+        waited = time.monotonic() - started
+        self._metrics[priority_class].record(waited)
+        # La demande suivante dans l'ordre peut maintenant être servie si un créneau reste libre
+        self._condition.notify_all()
+        return waited
+
+    def _cancel(self, ticket: int) -> None:
+        with self._condition:
+            if self._waiters.pop(ticket, None) is not None:
+                self._condition.notify_all()
+
+    def release(self, priority_class: str) -> None:
+        """Libère un créneau et réveille les demandes en attente"""
+        with self._condition:
+            self._running[priority_class] -= 1
+            self._condition.notify_all()
+
+    def acquire(self, priority_class: str) -> float:
+        """
+        Attend un créneau pour la classe donnée
+
+        Returns:
+            Temps passé en file (secondes)
+        """
+        ticket = self._enqueue(priority_class)
+        waited = []
+
+        def ready() -> bool:
+            result = self._try_start(ticket)
+            if result is not None:
+                waited.append(result)
+            return result is not None
+
+        try:
+            with self._condition:
+                self._condition.wait_for(ready)
+                return waited[0]
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+    async def aacquire(self, priority_class: str, poll_interval: float = 0.02) -> float:
+        """Variante asynchrone de acquire (attente par sondage, aucun thread bloqué)"""
+        ticket = self._enqueue(priority_class)
+        try:
+            while True:
+                with self._condition:
+                    waited = self._try_start(ticket)
+                if waited is not None:
+                    return waited
+                await asyncio.sleep(poll_interval)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+    @contextmanager
+    def slot(self, priority_class: str):
+        """Garde un créneau pendant le bloc ; yield le temps passé en file"""
+        waited = self.acquire(priority_class)
+        try:
+            yield waited
+        finally:
+            self.release(priority_class)
+
+    # ----- Métriques -----
+
+    def queue_depth(self, priority_class: Optional[str] = None) -> int:
+        """Demandes en attente (d'une classe ou au total)"""
+        with self._condition:
+            return sum(1 for _, name, _ in self._waiters.values() if priority_class in (None, name))
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Par classe : en file, en cours, demandes servies et temps d'attente"""
+        with self._condition:
+            waiting = {name: 0 for name in PRIORITIES}
+            for _, name, _ in self._waiters.values():
+                waiting[name] += 1
+            return {
+                name: {
+                    'waiting': waiting[name],
+                    'running': self._running[name],
+                    'reserved': self.reservations.get(name, 0),
+                    **self._metrics[name].summary()
+                }
+                for name in PRIORITIES
+            }
+
+
+class _ClassMetrics:
+    """Temps d'attente d'une classe : total, maximum et fenêtre récente pour les percentiles"""
+
+    WINDOW = 500
+
+    def __init__(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent = deque(maxlen=self.WINDOW)
+
+    def record(self, waited: float) -> None:
+        self.count += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.recent.append(waited)
+
+    def summary(self) -> Dict[str, float]:
+        recent = sorted(self.recent)
+
+        def percentile(p: float) -> float:
+            return recent[min(len(recent) - 1, int(p * len(recent)))] if recent else 0.0
+
+        return {
+            'served': self.count,
+            'avg_wait': self.total_wait / self.count if self.count else 0.0,
+            'p50_wait': percentile(0.50),
+            'p95_wait': percentile(0.95),
+            'max_wait': self.max_wait
+        }
@@ -0,0 +1,124 @@
+"""
+Module de découpage du texte des cours
+Estimation locale du nombre de tokens et découpage en morceaux bornés
+pour la génération map-reduce des longs polycopiés
+"""
+
+import math
+import re
+from typing import List, Dict, Optional
+
+
+# Caractères par token pour du français médical (estimation prudente, sans appel API)
+CHARS_PER_TOKEN = 3.5
+
+# Marqueur de page inséré par DocumentParser.extract_from_pdf ("[p12]", ou "--- Page 12 ---"
+# dans les textes extraits avant la normalisation)
+PAGE_MARKER_PATTERN = re.compile(r"^(?:\[p(\d+)\]|--- Page (\d+) ---)$", re.MULTILINE)
+
+
+def page_marker(page: int) -> str:
+    """Marqueur compact placé en tête du texte de chaque page PDF"""
+    return f"[p{page}]"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estime localement le nombre de tokens d'un texte
+
+    Args:
+        text: Texte à mesurer
+
+    Returns:
+        Nombre de tokens estimé (arrondi au supérieur)
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_sections(text: str) -> List[Dict]:
+    """
+    Découpe le texte en sections naturelles : pages (PDF) ou paragraphes (Word)
+
+    Returns:
+        Liste de dicts {text: str, page: int ou None}
+    """
+    markers = list(PAGE_MARKER_PATTERN.finditer(text))
+    if markers:
+        sections = []
+        for i, marker in enumerate(markers):
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+            sections.append({'text': text[marker.start():end].strip(), 'page': int(marker.group(1) or marker.group(2))})
+        return sections
+
+    return [{'text': part, 'page': None} for part in text.split("\n\n") if part.strip()]
+
+
+def _split_oversized(section_text: str, max_tokens: int) -> List[str]:
+    """Redécoupe une section trop longue par lignes (puis par caractères en dernier recours)"""
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    parts = []
+    current = ""
+    for line in section_text.split("\n"):
+        while len(line) > max_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + len(line) + 1 > max_chars:
+            parts.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[Dict]:
+    """
+    Regroupe les sections du cours en morceaux d'au plus max_tokens tokens (estimés)
+    Les sections ne sont coupées que si elles dépassent seules le budget
+
+    Args:
+        text: Texte complet extrait du document
+        max_tokens: Budget de tokens par morceau
+
+    Returns:
+        Liste de dicts {text: str, first_page: int ou None, last_page: int ou None}
+    """
+    chunks = []
+    current_parts = []
+    current_tokens = 0
+    first_page: Optional[int] = None
+    last_page: Optional[int] = None
+
+    def flush():
+        if current_parts:
+            chunks.append({
+                'text': "\n\n".join(current_parts),
+                'first_page': first_page,
+                'last_page': last_page
+            })
+
+    for section in split_sections(text):
+        pieces = [section['text']]
+        if estimate_tokens(section['text']) > max_tokens:
+            pieces = _split_oversized(section['text'], max_tokens)
+
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current_parts and current_tokens + piece_tokens > max_tokens:
+                flush()
+                current_parts, current_tokens = [], 0
+                first_page = None
+            current_parts.append(piece)
+            current_tokens += piece_tokens
+            if first_page is None:
+                first_page = section['page']
+            last_page = section['page']
+
+    flush()
+    return chunks
@@ -0,0 +1,148 @@
+"""
+Module de normalisation du texte extrait des PDF
+Retire ce qui coûte des tokens sans apporter de contenu : en-têtes et pieds
+de page répétés, numéros de page, césures douces, espaces multiples
+(les mots coupés par un trait d'union sont recollés à l'extraction,
+voir DocumentParser.PDF_TEXT_FLAGS)
+"""
+
+import re
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from utils.text_chunking import estimate_tokens, page_marker
+
+
+# Ligne réduite à un numéro de page : "12", "- 12 -", "Page 12", "p. 12", "12/300", "Page 12 sur 300"
+PAGE_NUMBER_PATTERN = re.compile(
+    r"^[-–—\s]*(?:page|p\.?)?\s*\d{1,4}(?:\s*(?:/|sur|of)\s*\d{1,4})?[-–—\s]*$",
+    re.IGNORECASE
+)
+# Espaces horizontaux (dont insécables) à fusionner
+SPACES_PATTERN = re.compile(r"[ \t\u00a0\u2009\u202f]+")
+DIGITS_PATTERN = re.compile(r"\d+")
+
+
+def _signature(line: str) -> str:
+    """Forme comparable d'une ligne d'une page à l'autre (les numéros varient)"""
+    return DIGITS_PATTERN.sub("#", line.casefold())
+
+
+def _clean_lines(text: str) -> List[str]:
+    """Lignes sans césure douce (mot recollé en fin de ligne), espaces fusionnés et bords retirés"""
+    text = text.replace("\u00ad\n", "").replace("\u00ad", "")
+    return [SPACES_PATTERN.sub(" ", line).strip() for line in text.split("\n")]
+
+
+def _edge_indices(lines: List[str], edge_lines: int, edge_ratio: float) -> Set[int]:
+    """
+    Positions des premières et dernières lignes non vides d'une page (en-tête, pied de page)
+    Au plus edge_ratio des lignes de chaque côté : une page courte (diapositive) garde son contenu
+    """
+    content = [index for index, line in enumerate(lines) if line]
+    edge = min(edge_lines, int(len(content) * edge_ratio))
+    if edge == 0:
+        return set()
+    return set(content[:edge] + content[-edge:])
+
+
+def _join_lines(lines: List[str]) -> str:
+    """Réduit les lignes vides consécutives à une seule"""
+    output: List[str] = []
+    for line in lines:
+        if line or (output and output[-1]):
+            output.append(line)
+    return "\n".join(output).strip()
+
+
+class PageTextNormalizer:
+    """
+    Normalise le texte d'un PDF page par page, en flux
+
+    Les en-têtes et pieds de page sont appris sur les SAMPLE_PAGES premières
+    pages (mises en attente le temps de l'apprentissage) : une ligne présente
+    en bord de page sur au moins REPEAT_RATIO d'entre elles est retirée de
+    toutes les pages du document.
+    """
+
+    SAMPLE_PAGES = 12  # Pages observées avant de figer les lignes répétées
+    MIN_PAGES = 3  # En dessous, aucune ligne n'est considérée comme répétée
+    REPEAT_RATIO = 0.5  # Part des pages échantillonnées où la ligne doit apparaître
+    EDGE_LINES = 3  # Lignes examinées en haut et en bas de chaque page
+    EDGE_RATIO = 0.25  # Part maximale des lignes d'une page examinée de chaque côté
+
+    def __init__(self):
+        self.repeated: Set[str] = set()
+        self.stats = {'tokens_raw': 0, 'tokens': 0, 'removed_lines': 0}
+
+    def _learn(self, pages: List[List[str]]) -> None:
+        counts = Counter()
+        measured = 0  # Pages assez longues pour avoir des bords
+        for lines in pages:
+            edges = _edge_indices(lines, self.EDGE_LINES, self.EDGE_RATIO)
+            if edges:
+                measured += 1
+                counts.update({_signature(lines[index]) for index in edges})
+        if measured < self.MIN_PAGES:
+            return
+        threshold = max(self.MIN_PAGES, self.REPEAT_RATIO * measured)
+        self.repeated = {signature for signature, count in counts.items() if count >= threshold}
+
+    def _normalize(self, page: int, raw_text: str, lines: List[str]) -> str:
+        kept = []
+        # Seuls les bords de page sont filtrés : un nombre seul au milieu de la page est une donnée
+        edges = _edge_indices(lines, self.EDGE_LINES, self.EDGE_RATIO)
+        for index, line in enumerate(lines):
+            if index in edges and (PAGE_NUMBER_PATTERN.match(line) or _signature(line) in self.repeated):
+                self.stats['removed_lines'] += 1
+                continue
+            kept.append(line)
+        text = _join_lines(kept)
+        # Coût de référence : texte brut précédé de l'ancien marqueur "--- Page n ---"
+        self.stats['tokens_raw'] += estimate_tokens(f"--- Page {page} ---\n{raw_text}")
+        if text:
+            text = f"{page_marker(page)}\n{text}"
+            self.stats['tokens'] += estimate_tokens(text)
+        return text
+
+    def _release(self, sample: List[Tuple[int, str, List[str]]]) -> Iterator[Tuple[int, str]]:
+        self._learn([lines for _, _, lines in sample])
+        for page, raw_text, lines in sample:
+            text = self._normalize(page, raw_text, lines)
+            if text:
+                yield page, text
+
+    def normalize_pages(self, pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        """
+        Args:
+            pages: Tuples (numéro_page, texte brut) des pages non vides, dans l'ordre
+
+        Yields:
+            Tuples (numéro_page, texte normalisé préfixé par le marqueur de page),
+            les pages vidées par la normalisation sont omises
+        """
+        sample = []
+        learned = False
+        for page, raw_text in pages:
+            record = (page, raw_text, _clean_lines(raw_text))
+            if learned:
+                text = self._normalize(*record)
+                if text:
+                    yield page, text
+                continue
+            sample.append(record)
+            if len(sample) == self.SAMPLE_PAGES:
+                learned = True
+                yield from self._release(sample)
+        if not learned:
+            # Document plus court que l'échantillon
+            yield from self._release(sample)
+
+    def savings(self) -> Dict[str, float]:
+        """Tokens estimés avant / après normalisation"""
+        saved = self.stats['tokens_raw'] - self.stats['tokens']
+        return {
+            **self.stats,
+            'tokens_saved': saved,
+            'saved_ratio': saved / self.stats['tokens_raw'] if self.stats['tokens_raw'] else 0.0
+        }